@@ -88,6 +88,21 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock when a transaction starts so concurrent bookings
+            # queue for it instead of failing with "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+    }
+}
+
+# Shared by every process, so cache-backed locks (e.g. the per-bus accident
+# lock) hold across workers. Create the table with: python manage.py createcachetable
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'amts_cache',
     }
 }
 
@@ -183,6 +198,78 @@ EMERGENCY_HELPLINES = [
     'safety@amts.gov.in',
     'admin@amts.gov.in'
 ]
-
-# SMS Configuration (for future implementation)
+EMERGENCY_EMAIL_RATE = 10  # Sustained emails per second across a dispatch
+EMERGENCY_EMAIL_BURST = 20  # Emails that may go out back to back before throttling
+
+# Notification Outbox Settings
+OUTBOX_WORKERS = 4  # Concurrent SMTP connections per delivery batch
+OUTBOX_MAX_ATTEMPTS = 5  # A message is marked FAILED after this many tries
+OUTBOX_RETRY_BASE_SECONDS = 2  # First retry delay; doubles with every attempt
+OUTBOX_RETRY_MAX_SECONDS = 300
+OUTBOX_LEASE_SECONDS = 300  # Messages stuck in SENDING this long are requeued
+ACCIDENT_COALESCE_WINDOW_SECONDS = 900  # Repeat alerts for a bus within this of its last report join that incident
+ACCIDENT_LOCK_TIMEOUT_SECONDS = 30  # Expiry of the per-bus alert lock (held in the shared CACHES backend)
+ACCIDENT_LOCK_WAIT_SECONDS = 10
+
+# Emergency Audit Log Settings
+# JSON lines written by a background listener thread, rotated by size
+AUDIT_LOG_FILE = os.path.join(BASE_DIR, 'logs', 'emergency_notifications.jsonl')
+AUDIT_LOG_MAX_BYTES = 5 * 1024 * 1024
+AUDIT_LOG_BACKUP_COUNT = 10
+
+# SMS Configuration
+# 'console' logs messages, 'locmem' keeps them in memory (tests and benchmarks),
+# or a dotted path to a gateway class with an async send(phone_number, text)
 SMS_BACKEND = 'console'  # For localhost testing    
+SMS_CONCURRENCY = 8  # SMS in flight at once
+SMS_RATE = 20  # Sustained SMS per second
+SMS_BURST = 20
+EMERGENCY_SMS_NUMBERS = ['+917926580000']  # AMTS Control Room
+NOTIFICATION_LATENCY_BUDGET_SECONDS = 30  # Target for one incident to reach every recipient on every channel
+
+# Live Tracking Settings
+STOP_GEOFENCE_RADIUS_KM = 0.15  # A bus within this distance of a stop is considered at the stop
+HEADWAY_BUNCHING_MINUTES = 3  # Vehicles closer than this are flagged as bunched
+HEADWAY_GAP_MINUTES = 20  # Vehicles further apart than this are flagged as a long gap
+HEADWAY_NOMINAL_SPEED_KMH = 20  # Average city speed used to turn gaps into minutes
+ACTIVE_BUS_STALE_MINUTES = 15  # Buses without telemetry for this long are marked inactive
+STALL_THRESHOLD_MINUTES = 5  # Zero speed away from a stop for this long flags the bus as stalled
+
+# Background Task Settings
+# 'thread' runs tasks in an in-process pool (development), 'worker' leaves them
+# queued for worker commands such as process_qr_codes, 'sync' runs them inline
+BACKGROUND_TASK_MODE = os.getenv('BACKGROUND_TASK_MODE', 'thread')
+BACKGROUND_WORKERS = 4
+
+# Ticket QR Settings
+# 'on_demand' renders QR codes per request (no files written); 'files' stores a PNG per ticket
+QR_CODE_STORAGE = os.getenv('QR_CODE_STORAGE', 'on_demand')
+QR_CACHE_SIZE = 2048  # Encoded QR images kept in memory per process
+TICKET_VALIDITY_HOURS = 24  # Signed ticket tokens expire this long after booking
+REVOCATION_REFRESH_SECONDS = 30  # How often each process reloads revoked ticket IDs
+VERIFICATION_BUNDLE_DAYS_AHEAD = 7  # Latest service day a conductor device can fetch a bundle for
+VERIFICATION_BUNDLE_LAG_SECONDS = 120  # Revocations younger than this wait for the next bundle build
+CONDUCTOR_GROUP = 'Conductors'  # Auth group allowed to verify tickets and passes and fetch bundles
+
+# Fare Settings (per passenger, in rupees)
+FARE_BASE = '10.00'
+FARE_PER_STOP = '2.00'
+FARE_MAX = '50.00'
+FARE_TRANSFER_DISCOUNT = '5.00'  # Taken off each leg after a transfer
+FARE_JOURNEY_MAX = '60.00'  # Cap on a whole multi-leg journey
+FARE_TABLE_CHECK_SECONDS = 10  # How often each process checks the shared fare table version
+
+# Reporting Settings
+RIDERSHIP_ROLLUP_LAG_SECONDS = 120  # Bookings younger than this wait for the next rollup run
+
+# Seat Inventory Settings
+TRIP_SLOT_MINUTES = 60  # Bookings are counted against the departure slot of their travel time
+SEAT_BOOKING_DAYS_AHEAD = 7  # How far ahead a seat can be booked
+
+# Bus Pass Upload Settings
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024  # Larger uploads spool to a temp file instead of memory
+PASS_UPLOAD_MAX_BYTES = 5 * 1024 * 1024  # Per document
+PASS_THUMBNAIL_WIDTH = 240
+PASS_CACHE_REFRESH_SECONDS = 60  # How often each process reloads the passes valid today
+PASS_PROCESSING_LEASE_SECONDS = 600  # Passes stuck in PROCESSING this long are requeued by --requeue
+PASS_EMAIL_MAX_ATTEMPTS = 3  # --requeue stops resending a pass's email after this many tries
@@ -1,8 +1,19 @@
 from django.contrib import admin
+from .booking_service import refund_booking
 from .models import Bus, ActiveBus, Booking, Ticket
 
+@admin.action(description='Refund selected bookings (revokes their tickets)')
+def refund_bookings(modeladmin, request, queryset):
+    refunded = sum(1 for booking in queryset if refund_booking(booking))
+    modeladmin.message_user(request, f'{refunded} booking(s) refunded')
+
+class BookingAdmin(admin.ModelAdmin):
+    list_display = ['booking_id', 'user', 'bus_number', 'booking_date', 'payment_status']
+    list_filter = ['payment_status']
+    actions = [refund_bookings]
+
 # Register models with the default admin site
 admin.site.register(Bus)
 admin.site.register(ActiveBus)
-admin.site.register(Booking)
+admin.site.register(Booking, BookingAdmin)
 admin.site.register(Ticket)
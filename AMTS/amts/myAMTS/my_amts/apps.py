@@ -4,3 +4,18 @@ from django.apps import AppConfig
 class MyAmtsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'my_amts'
+
+    def ready(self):
+        from django.db.models.signals import post_save, post_delete
+        from .models import Bus, BusPass
+        from .stop_geofence import clear_route_cache
+        from .fare_engine import clear_fare_tables
+        from .pass_verification import valid_passes
+
+        # Route stop indexes are cached per process; rebuild them when routes change
+        post_save.connect(clear_route_cache, sender=Bus, dispatch_uid='stop_geofence_save')
+        post_delete.connect(clear_route_cache, sender=Bus, dispatch_uid='stop_geofence_delete')
+        post_save.connect(clear_fare_tables, sender=Bus, dispatch_uid='fare_engine_save')
+        post_delete.connect(clear_fare_tables, sender=Bus, dispatch_uid='fare_engine_delete')
+        post_save.connect(valid_passes.pass_saved, sender=BusPass, dispatch_uid='pass_verification_save')
+        post_delete.connect(valid_passes.pass_deleted, sender=BusPass, dispatch_uid='pass_verification_delete')
@@ -0,0 +1,89 @@
+# my_amts/audit_log.py
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime, timezone as dt_timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from django.conf import settings
+
+AUDIT_LOGGER = 'my_amts.audit'
+
+_listener = None
+_lock = threading.Lock()
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per line: time, level, event and the record's audit fields"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, dt_timezone.utc).isoformat(),
+            'level': record.levelname,
+            'event': record.getMessage(),
+        }
+        entry.update(getattr(record, 'audit', {}))
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def get_audit_log_file():
+    return getattr(settings, 'AUDIT_LOG_FILE', os.path.join(settings.BASE_DIR, 'logs', 'emergency_notifications.jsonl'))
+
+
+def get_audit_logger():
+    """
+    The audit logger only puts records on an in-memory queue; a QueueListener
+    thread formats them and writes the rotating JSON-lines file, so callers
+    never wait on disk I/O. Set up on first use.
+    """
+    global _listener
+    audit_logger = logging.getLogger(AUDIT_LOGGER)
+    if _listener is not None:
+        return audit_logger
+
+    with _lock:
+        if _listener is None:
+            log_file = get_audit_log_file()
+            os.makedirs(os.path.dirname(log_file), exist_ok=True)
+            file_handler = RotatingFileHandler(
+                log_file,
+                maxBytes=getattr(settings, 'AUDIT_LOG_MAX_BYTES', 5 * 1024 * 1024),
+                backupCount=getattr(settings, 'AUDIT_LOG_BACKUP_COUNT', 10),
+                encoding='utf-8'
+            )
+            file_handler.setFormatter(JsonLinesFormatter())
+
+            records = queue.SimpleQueue()
+            listener = QueueListener(records, file_handler, respect_handler_level=True)
+            listener.start()
+            # Flush whatever is still queued when the process exits
+            atexit.register(stop_audit_listener)
+
+            audit_logger.addHandler(QueueHandler(records))
+            audit_logger.setLevel(logging.INFO)
+            audit_logger.propagate = False
+            _listener = listener
+    return audit_logger
+
+
+def stop_audit_listener():
+    """Write out queued records and stop the listener thread (it restarts on next use)"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+            audit_logger = logging.getLogger(AUDIT_LOGGER)
+            for handler in list(audit_logger.handlers):
+                if isinstance(handler, QueueHandler):
+                    audit_logger.removeHandler(handler)
+            _listener = None
+
+
+def audit(event, level=logging.INFO, **fields):
+    """Queue one audit line, e.g. audit('incident_delivered', bus_number='101', sent=12)"""
+    get_audit_logger().log(level, event, extra={'audit': fields})
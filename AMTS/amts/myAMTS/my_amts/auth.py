@@ -1,5 +1,8 @@
+from functools import wraps
+from django.conf import settings
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
+from django.http import JsonResponse
 
 class SeparateAdminAuthBackend(ModelBackend):
     def authenticate(self, request, username=None, password=None, **kwargs):
@@ -30,3 +33,20 @@ class SeparateAdminAuthBackend(ModelBackend):
             return UserModel.objects.get(pk=user_id)
         except UserModel.DoesNotExist:
             return None
+
+def is_conductor(user):
+    """Staff, or a member of the CONDUCTOR_GROUP auth group"""
+    if not user.is_authenticated:
+        return False
+    if user.is_staff:
+        return True
+    return user.groups.filter(name=getattr(settings, 'CONDUCTOR_GROUP', 'Conductors')).exists()
+
+def conductor_required(view_func):
+    """Reject (403) users who aren't conductors; use after login_required"""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not is_conductor(request.user):
+            return JsonResponse({'status': 'error', 'message': 'Conductor access required'}, status=403)
+        return view_func(request, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,74 @@
+# my_amts/background.py
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_task_mode():
+    """
+    How background work is run:
+    'thread' - in-process thread pool (development default)
+    'worker' - left queued in the database for a worker management command
+    'sync'   - run inline once the transaction commits
+    """
+    return getattr(settings, 'BACKGROUND_TASK_MODE', 'thread')
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'BACKGROUND_WORKERS', 4),
+            thread_name_prefix='amts-background'
+        )
+    return _executor
+
+
+def _run_task(func, args, kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception(f"Background task {func.__name__} failed")
+    finally:
+        # Worker threads get their own DB connections; don't leak them
+        connections.close_all()
+
+
+def run_in_background(func, *args, **kwargs):
+    """
+    Schedule func(*args, **kwargs) to run after the current transaction commits,
+    so the task always sees the rows the request just wrote.
+    Returns False when the task is left for an external worker to pick up.
+    """
+    mode = get_task_mode()
+    if mode == 'worker':
+        return False
+
+    if mode == 'sync':
+        transaction.on_commit(lambda: func(*args, **kwargs))
+    else:
+        transaction.on_commit(lambda: get_executor().submit(_run_task, func, args, kwargs))
+    return True
+
+
+def run_later(delay, func, *args, **kwargs):
+    """
+    Run func(*args, **kwargs) on the thread pool after `delay` seconds, without
+    holding a pool thread while waiting. Only the 'thread' mode has a process
+    that outlives the request; in the other modes this returns False and the
+    work is left for a worker command to pick up.
+    """
+    if get_task_mode() != 'thread':
+        return False
+
+    timer = threading.Timer(delay, lambda: get_executor().submit(_run_task, func, args, kwargs))
+    timer.daemon = True
+    timer.start()
+    return True
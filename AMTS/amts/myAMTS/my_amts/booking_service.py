@@ -0,0 +1,74 @@
+# my_amts/booking_service.py
+
+from django.db import transaction
+from .models import Booking, Ticket
+from .qr_codes import enqueue_qr_generation, stores_qr_files
+from .seat_inventory import release_seats, reserve_seats
+from .ticket_tokens import revoke_tickets
+
+MAX_PASSENGERS_PER_BOOKING = 10
+
+
+def parse_passenger_count(value):
+    """Passenger count from a request; raises ValueError unless it is 1..MAX_PASSENGERS_PER_BOOKING"""
+    try:
+        passenger_count = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('Passenger count must be a whole number')
+    if not 1 <= passenger_count <= MAX_PASSENGERS_PER_BOOKING:
+        raise ValueError(f'Passenger count must be between 1 and {MAX_PASSENGERS_PER_BOOKING}')
+    return passenger_count
+
+
+def create_booking_with_tickets(user, bus_number, from_stop, to_stop, total_amount, passenger_count=1,
+                                travel_time=None):
+    """
+    Create a Booking and one Ticket per passenger in a single transaction,
+    taking the seats from the inventory of the departure the passengers travel
+    on (travel_time, default now; raises SeatsUnavailable if the trip is full).
+    Tickets are inserted with one bulk INSERT; when QR files are stored their
+    images are queued for background rendering once the transaction commits,
+    otherwise the QR is rendered on demand and the ticket is ready immediately.
+    Returns (booking, tickets).
+    """
+    passenger_count = parse_passenger_count(passenger_count)
+
+    qr_status = 'PENDING' if stores_qr_files() else 'READY'
+
+    with transaction.atomic():
+        trip = reserve_seats(bus_number, passenger_count, travel_time)
+        booking = Booking.objects.create(
+            user=user,
+            bus_number=bus_number,
+            from_stop=from_stop,
+            to_stop=to_stop,
+            total_amount=total_amount,
+            trip=trip
+        )
+        tickets = Ticket.objects.bulk_create(
+            [Ticket(booking=booking, qr_status=qr_status) for _ in range(passenger_count)]
+        )
+        enqueue_qr_generation(tickets)
+
+    return booking, tickets
+
+
+def refund_booking(booking, reason='REFUND'):
+    """
+    Mark a booking refunded, revoke its tickets so signed tokens stop verifying
+    and return its seats to the trip inventory.
+    Returns False if the booking isn't a completed, unrefunded one.
+    """
+    with transaction.atomic():
+        # Conditional update, so of two concurrent refunds only one releases the seats
+        refunded = Booking.objects.filter(pk=booking.pk, payment_status='COMPLETED').update(
+            payment_status='REFUNDED'
+        )
+        if not refunded:
+            return False
+        booking.payment_status = 'REFUNDED'
+        ticket_ids = list(booking.tickets.values_list('ticket_id', flat=True))
+        revoke_tickets(ticket_ids, reason=reason)
+        if booking.trip_id:
+            release_seats(booking.trip_id, len(ticket_ids))
+    return True
@@ -1,14 +1,14 @@
 # my_amts/emergency_notifications.py
 
 import random
-import time
-from django.core.mail import send_mail, send_mass_mail
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
-from .models import Bus, ActiveBus, Booking
-from datetime import datetime, date
+from .audit_log import audit
+from .models import Bus, ActiveBus, Booking, EmergencyAuditRecord, EmergencyContact
+from datetime import datetime, date, time, timedelta
+from django.utils import timezone
 import logging
 
 logger = logging.getLogger(__name__)
@@ -28,6 +28,7 @@ class EmergencyNotificationSystem:
             'safety@amts.gov.in',
             'admin@amts.gov.in'
         ])
+        self.emergency_sms_numbers = getattr(settings, 'EMERGENCY_SMS_NUMBERS', [])
     
     def get_priority_users_for_emergency(self, max_users=0):
         """
@@ -44,30 +45,51 @@ class EmergencyNotificationSystem:
             logger.error(f"Error getting priority users for emergency: {str(e)}")
             return []
     
+    def get_affected_bookings(self, bus_number):
+        """
+        Today's bookings on the affected bus. booking_date is filtered as a range
+        (local midnight to midnight) rather than with __date, so the lookup can
+        use the (bus_number, booking_date) index
+        """
+        start = timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+        return Booking.objects.filter(
+            bus_number=bus_number,
+            booking_date__gte=start,
+            booking_date__lt=start + timedelta(days=1)
+        )
+    
     def get_affected_passengers(self, bus_number):
         """
-        Get passengers who have bookings for the affected bus today
+        Distinct email addresses of passengers booked on the affected bus today,
+        streamed from the database instead of loading Booking and User objects
         """
-        try:
-            today = date.today()
-            affected_bookings = Booking.objects.filter(
-                bus_number=bus_number,
-                booking_date__date=today
-            ).select_related('user')
-            
-            passengers = []
-            for booking in affected_bookings:
-                if booking.user.email:  # Only include users with email
-                    passengers.append({
-                        'user': booking.user,
-                        'booking': booking
-                    })
-            
-            return passengers
-            
-        except Exception as e:
-            logger.error(f"Error getting affected passengers: {str(e)}")
-            return []
+        return (
+            self.get_affected_bookings(bus_number)
+            .exclude(user__email='')
+            .order_by()
+            .values_list('user__email', flat=True)
+            .distinct()
+            .iterator(chunk_size=500)
+        )
+    
+    def iter_recipients(self, bus_number):
+        """
+        Everyone to notify about an accident as (channel, recipient_type, address),
+        produced lazily so the outbox can queue them in chunks
+        """
+        for email in self.get_affected_passengers(bus_number):
+            yield 'EMAIL', 'PASSENGER', email
+        
+        contacts = EmergencyContact.objects.filter(
+            user_id__in=self.get_affected_bookings(bus_number).values('user_id')
+        ).order_by().values_list('phone_number', flat=True).distinct()
+        for phone_number in contacts.iterator(chunk_size=500):
+            yield 'SMS', 'CONTACT', phone_number
+        
+        for email in self.emergency_helplines:
+            yield 'EMAIL', 'HELPLINE', email
+        for phone_number in self.emergency_sms_numbers:
+            yield 'SMS', 'HELPLINE', phone_number
     
     def generate_google_maps_link(self, latitude, longitude):
         """
@@ -90,33 +112,26 @@ class EmergencyNotificationSystem:
         except Bus.DoesNotExist:
             return f"Route {bus_number}"
     
-    def send_emergency_emails(self, bus_number, latitude, longitude, accident_location=None):
+    def build_alert(self, bus_number, latitude, longitude, accident_location=None, affected_count=0):
         """
-        Main function to send emergency emails for bus accident
+        Compose the passenger and helpline emails for an accident
         """
-        try:
-            # Get bus and route information
-            route_name = self.get_route_name(bus_number)
-            maps_link = self.generate_google_maps_link(latitude, longitude)
-            
-            # Location string
-            if accident_location:
-                location_str = f"{accident_location} ({maps_link})"
-            else:
-                location_str = f"GPS: {latitude}, {longitude} ({maps_link})"
-            
-            # Get affected passengers (actual bookings)
-            affected_passengers = self.get_affected_passengers(bus_number)
-            
-            # For now, only use emergency helplines from settings.py to avoid rate limiting
-            priority_users = self.get_priority_users_for_emergency(max_users=0)
-            
-            # Prepare email data
-            timestamp = datetime.now().strftime('%d/%m/%Y at %I:%M %p')
-            
-            # Email content for affected passengers
-            passenger_subject = f"🚨 URGENT: Bus Accident Alert - Bus {bus_number}"
-            passenger_message = f"""EMERGENCY NOTIFICATION - AMTS
+        # Get bus and route information
+        route_name = self.get_route_name(bus_number)
+        maps_link = self.generate_google_maps_link(latitude, longitude)
+        
+        # Location string
+        if accident_location:
+            location_str = f"{accident_location} ({maps_link})"
+        else:
+            location_str = f"GPS: {latitude}, {longitude} ({maps_link})"
+        
+        # Prepare email data
+        timestamp = datetime.now().strftime('%d/%m/%Y at %I:%M %p')
+        
+        # Email content for affected passengers
+        passenger_subject = f"🚨 URGENT: Bus Accident Alert - Bus {bus_number}"
+        passenger_message = f"""EMERGENCY NOTIFICATION - AMTS
 
 🚨 ACCIDENT ALERT 🚨
 
@@ -137,9 +152,9 @@ AMTS is coordinating with emergency services for immediate assistance.
 Stay safe,
 AMTS Emergency Response Team"""
 
-            # Email content for emergency helplines (PRIORITY EMAILS ONLY)
-            helpline_subject = f"🚨 BUS ACCIDENT REPORT - Bus {bus_number} - Immediate Response Required"
-            helpline_message = f"""EMERGENCY INCIDENT REPORT - AMTS
+        # Email content for emergency helplines (PRIORITY EMAILS ONLY)
+        helpline_subject = f"🚨 BUS ACCIDENT REPORT - Bus {bus_number} - Immediate Response Required"
+        helpline_message = f"""EMERGENCY INCIDENT REPORT - AMTS
 
 🚨 BUS ACCIDENT DETECTED 🚨
 
@@ -150,7 +165,7 @@ INCIDENT DETAILS:
 - GPS Coordinates: {latitude}, {longitude}
 - Time: {timestamp}
 
-AFFECTED PASSENGERS: {len(affected_passengers)} confirmed bookings
+AFFECTED PASSENGERS: {affected_count} confirmed bookings
 EMERGENCY NOTIFICATION: Sent to priority contacts only
 
 IMMEDIATE ACTIONS REQUIRED:
@@ -167,132 +182,104 @@ Please respond immediately.
 
 AMTS Emergency Response System"""
 
-            # Send emails
-            emails_sent = 0
-            failed_emails = []
-            
-            # 1. Send to affected passengers (if any)
-            for passenger_data in affected_passengers:
-                try:
-                    send_mail(
-                        passenger_subject,
-                        passenger_message,
-                        settings.DEFAULT_FROM_EMAIL,
-                        [passenger_data['user'].email],
-                        fail_silently=False,
-                    )
-                    emails_sent += 1
-                    logger.info(f"Emergency email sent to passenger: {passenger_data['user'].email}")
-                except Exception as e:
-                    failed_emails.append(passenger_data['user'].email)
-                    logger.error(f"Failed to send email to passenger {passenger_data['user'].email}: {str(e)}")
-            
-            # 2. Skip user broadcast for now (only use emergency helplines)
-            logger.info("Skipping user broadcast - using only emergency helplines from settings.py")
-            
-            # 3. Send to emergency helplines (PRIORITY EMAILS) (with small delays)
-            for helpline_email in self.emergency_helplines:
-                try:
-                    send_mail(
-                        helpline_subject,
-                        helpline_message,
-                        settings.DEFAULT_FROM_EMAIL,
-                        [helpline_email],
-                        fail_silently=False,
-                    )
-                    emails_sent += 1
-                    logger.info(f"Emergency alert sent to helpline: {helpline_email}")
-                    time.sleep(0.5)  # Small delay between helpline emails
-                except Exception as e:
-                    failed_emails.append(helpline_email)
-                    logger.error(f"Failed to send email to helpline {helpline_email}: {str(e)}")
-            
-            # Log emergency notification
-            self.log_emergency_notification(
-                bus_number, latitude, longitude, 
-                len(affected_passengers), len(priority_users), 
-                emails_sent, failed_emails
-            )
-            
-            return {
-                'status': 'success',
-                'emails_sent': emails_sent,
-                'affected_passengers': len(affected_passengers),
-                'broadcast_alerts': len(priority_users),
-                'helpline_alerts': len(self.emergency_helplines),
-                'failed_emails': failed_emails,
-                'accident_details': {
-                    'bus_number': bus_number,
-                    'route': route_name,
-                    'location': location_str,
-                    'maps_link': maps_link,
-                    'timestamp': timestamp
-                }
-            }
-            
-        except Exception as e:
-            logger.error(f"Error in emergency notification system: {str(e)}")
-            return {
-                'status': 'error',
-                'message': str(e)
-            }
+        # Short text for SMS recipients
+        sms_message = (
+            f"AMTS ALERT: Accident reported on Bus {bus_number} ({route_name}) at {accident_location or maps_link}, "
+            f"{timestamp}. Emergency: 108. AMTS Control Room: +91-79-2658-0000"
+        )
+
+        return {
+            'route_name': route_name,
+            'maps_link': maps_link,
+            'location_str': location_str,
+            'timestamp': timestamp,
+            'passenger_subject': passenger_subject,
+            'passenger_message': passenger_message,
+            'helpline_subject': helpline_subject,
+            'helpline_message': helpline_message,
+            'sms_message': sms_message
+        }
     
-    def log_emergency_notification(self, bus_number, latitude, longitude, 
-                                 affected_count, broadcast_count, emails_sent, failed_emails):
+    def accident_details(self, bus_number, alert):
+        return {
+            'bus_number': bus_number,
+            'route': alert['route_name'],
+            'location': alert['location_str'],
+            'maps_link': alert['maps_link'],
+            'timestamp': alert['timestamp']
+        }
+    
+    def queue_emergency_notifications(self, bus_number, latitude, longitude, accident_location=None):
         """
-        Log emergency notification details for audit trail
+        Record the accident and queue its notifications in the outbox: email to
+        affected passengers and helplines, SMS to the passengers' emergency
+        contacts and EMERGENCY_SMS_NUMBERS.
+        Delivery (with retries) happens in the background, so this returns as
+        soon as the outbox rows are committed.
         """
-        try:
-            log_message = f"""
-EMERGENCY NOTIFICATION LOG
-========================
-Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-Bus Number: {bus_number}
-GPS Location: {latitude}, {longitude}
-Affected Passengers: {affected_count}
-Emergency Broadcast Sent: {broadcast_count} users
-Total Emails Sent: {emails_sent}
-Failed Emails: {len(failed_emails)}
-Failed Recipients: {', '.join(failed_emails) if failed_emails else 'None'}
-========================
-"""
-            logger.critical(log_message)
-            
-            # Also write to a separate emergency log file
-            import os
-            log_dir = os.path.join(settings.BASE_DIR, 'logs')
-            os.makedirs(log_dir, exist_ok=True)
-            
-            log_file = os.path.join(log_dir, 'emergency_notifications.log')
-            with open(log_file, 'a', encoding='utf-8') as f:
-                f.write(log_message + '\n')
-                
-        except Exception as e:
-            logger.error(f"Error logging emergency notification: {str(e)}")
+        from .notification_outbox import queue_incident
 
-    def send_sms_notifications(self, phone_numbers, message):
-        """
-        SMS notification system (placeholder for future implementation)
-        Currently logs to console for localhost testing
-        """
-        try:
-            logger.info("SMS NOTIFICATIONS (Console Mode)")
-            logger.info("=" * 50)
-            
-            for phone in phone_numbers:
-                logger.info(f"SMS to {phone}: {message}")
-            
-            logger.info("=" * 50)
-            
-            return {
-                'status': 'success',
-                'sms_sent': len(phone_numbers),
-                'mode': 'console_logging'
-            }
-            
-        except Exception as e:
-            logger.error(f"Error in SMS notification: {str(e)}")
-            return {
-                'status': 'error',
-                'message': str(e)
-            }
\ No newline at end of file
+        affected_count = self.get_affected_bookings(bus_number).count()
+        alert = self.build_alert(bus_number, latitude, longitude, accident_location, affected_count)
+
+        incident, queued, coalesced = queue_incident(
+            bus_number, latitude, longitude, accident_location, alert, self.iter_recipients(bus_number)
+        )
+        if coalesced:
+            logger.info(f"Repeat alert for bus {bus_number} attached to incident {incident.pk}; newly queued: {queued}")
+        else:
+            logger.info(f"Queued emergency notifications for bus {bus_number} (incident {incident.pk}): {queued}")
+
+        return {
+            'status': 'success',
+            'incident': incident,
+            'coalesced': coalesced,
+            'emails_queued': queued.get('EMAIL', 0),
+            'sms_queued': queued.get('SMS', 0),
+            'affected_passengers': affected_count,
+            'helpline_alerts': len(self.emergency_helplines),
+            'accident_details': self.accident_details(bus_number, alert)
+        }
+
+
+def record_emergency_audits(records):
+    """
+    Save EmergencyAuditRecords in one bulk upsert and queue a JSON line for each
+    on the audit log; the file itself is written by the audit listener thread.
+    An incident keeps a single record: one that finishes again (a coalesced
+    repeat alert queued more messages) replaces its earlier outcome, and its
+    JSON line is marked updated so readers keep the latest line per incident.
+    """
+    updated = set(
+        EmergencyAuditRecord.objects.filter(incident__in=[record.incident_id for record in records])
+        .values_list('incident_id', flat=True)
+    )
+    EmergencyAuditRecord.objects.bulk_create(
+        records,
+        update_conflicts=True,
+        unique_fields=['incident'],
+        update_fields=[
+            'bus_number', 'latitude', 'longitude', 'alert_count', 'affected_passengers',
+            'notifications_sent', 'notifications_failed', 'failed_recipients', 'channel_counts', 'recorded_at'
+        ]
+    )
+    for record in records:
+        audit(
+            'emergency_notification',
+            level=logging.WARNING if record.notifications_failed else logging.INFO,
+            incident_id=record.incident_id,
+            updated=record.incident_id in updated,
+            bus_number=record.bus_number,
+            latitude=record.latitude,
+            longitude=record.longitude,
+            alert_count=record.alert_count,
+            affected_passengers=record.affected_passengers,
+            notifications_sent=record.notifications_sent,
+            notifications_failed=record.notifications_failed,
+            failed_recipients=record.failed_recipients,
+            channel_counts=record.channel_counts
+        )
+        logger.info(
+            f"Emergency notifications for bus {record.bus_number}: "
+            f"{record.notifications_sent} sent, {record.notifications_failed} failed"
+        )
@@ -0,0 +1,220 @@
+# my_amts/fare_engine.py
+
+import time
+import uuid
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from .models import Bus, BusPass
+
+
+def get_fare_rules():
+    return {
+        'base_fare': Decimal(str(getattr(settings, 'FARE_BASE', '10.00'))),
+        'fare_per_stop': Decimal(str(getattr(settings, 'FARE_PER_STOP', '2.00'))),
+        'max_fare': Decimal(str(getattr(settings, 'FARE_MAX', '50.00'))),
+        'transfer_discount': Decimal(str(getattr(settings, 'FARE_TRANSFER_DISCOUNT', '5.00'))),
+        'journey_max': Decimal(str(getattr(settings, 'FARE_JOURNEY_MAX', '60.00')))
+    }
+
+
+class RouteFareTable:
+    """
+    Precomputed fares for a single route.
+    The fare only depends on how many stops apart two stops are, so the route's
+    full origin/destination matrix collapses to one fare per hop count; a quote is
+    two dict lookups and a list index instead of rebuilding the stop list.
+    """
+
+    def __init__(self, bus, rules=None):
+        rules = rules or get_fare_rules()
+        self.bus_number = bus.bus_number
+        self.base_fare = rules['base_fare']
+        self.fare_per_stop = rules['fare_per_stop']
+        self.max_fare = rules['max_fare']
+
+        # Keep the first occurrence of a stop name, matching list.index
+        self.positions = {}
+        for i, stop in enumerate(bus.stops):
+            self.positions.setdefault(stop['name'], i)
+
+        self.fares = [
+            min(self.base_fare + self.fare_per_stop * hops, self.max_fare)
+            for hops in range(max(len(bus.stops), 1))
+        ]
+
+    def __len__(self):
+        return len(self.fares)
+
+    def stops_between(self, from_stop, to_stop):
+        """Number of stops travelled, or None if either stop isn't on the route"""
+        start = self.positions.get(from_stop)
+        end = self.positions.get(to_stop)
+        if start is None or end is None:
+            return None
+        return abs(end - start)
+
+    def fare(self, from_stop, to_stop):
+        """Per-passenger fare between two stops, or None if either stop isn't on the route"""
+        hops = self.stops_between(from_stop, to_stop)
+        return None if hops is None else self.fares[hops]
+
+
+# Per-process fare tables, keyed by bus number. They are dropped whenever the
+# shared version in CACHES changes, so a route edit in any process reaches them all.
+FARE_TABLES_VERSION_KEY = 'fare-tables:version'
+_fare_tables = {}
+_fare_state = {'version': None, 'checked_at': None}
+
+
+def invalidate_fare_tables():
+    """Give the fare tables a new shared version; every process rebuilds on its next check"""
+    version = uuid.uuid4().hex
+    cache.set(FARE_TABLES_VERSION_KEY, version, None)
+    _fare_tables.clear()
+    _fare_state['version'] = version
+
+
+def _sync_fare_tables():
+    """Drop this process's tables if the shared version moved (checked every FARE_TABLE_CHECK_SECONDS)"""
+    now = time.monotonic()
+    checked_at = _fare_state['checked_at']
+    if checked_at is not None and now - checked_at < getattr(settings, 'FARE_TABLE_CHECK_SECONDS', 10):
+        return
+    version = cache.get(FARE_TABLES_VERSION_KEY)
+    _fare_state['checked_at'] = now
+    if version != _fare_state['version']:
+        _fare_tables.clear()
+        _fare_state['version'] = version
+
+
+def load_fare_tables():
+    """Build fare tables for the whole network in one query"""
+    rules = get_fare_rules()
+    tables = {bus.bus_number: RouteFareTable(bus, rules) for bus in Bus.objects.all()}
+    _fare_tables.clear()
+    _fare_tables.update(tables)
+    return tables
+
+
+def get_fare_table(bus_number):
+    """Return the cached fare table for a route (None if the route doesn't exist)"""
+    _sync_fare_tables()
+    if not _fare_tables:
+        load_fare_tables()
+    table = _fare_tables.get(bus_number)
+    if table is None:
+        # Route added since the tables were built
+        bus = Bus.objects.filter(bus_number=bus_number).first()
+        if bus is not None:
+            table = _fare_tables[bus_number] = RouteFareTable(bus)
+    return table
+
+
+def clear_fare_tables(sender=None, **kwargs):
+    """Invalidate the fare tables in every process (connected to Bus save/delete signals)"""
+    invalidate_fare_tables()
+
+
+def quote_fare(bus_number, from_stop, to_stop, passenger_count=1):
+    """
+    Price a booking on the server.
+    Returns a dict with the per-passenger fare and total; raises ValueError
+    for unknown routes or stops.
+    """
+    table = get_fare_table(bus_number)
+    if table is None:
+        raise ValueError(f'Unknown bus route: {bus_number}')
+
+    hops = table.stops_between(from_stop, to_stop)
+    if hops is None:
+        raise ValueError(f'{from_stop} and {to_stop} are not both on route {bus_number}')
+
+    passenger_count = int(passenger_count)
+    fare = table.fares[hops]
+    return {
+        'bus_number': bus_number,
+        'from_stop': from_stop,
+        'to_stop': to_stop,
+        'stops': hops,
+        'base_fare': table.base_fare,
+        'fare_per_stop': table.fare_per_stop,
+        'max_fare': table.max_fare,
+        'fare_per_person': fare,
+        'passengers': passenger_count,
+        'total': fare * passenger_count
+    }
+
+
+def get_pass_routes(user, on_date=None):
+    """Route numbers covered by the user's approved passes valid on the given day"""
+    if user is None or not user.is_authenticated:
+        return frozenset()
+    on_date = on_date or timezone.localdate()
+    return frozenset(
+        BusPass.objects.filter(
+            user=user,
+            is_approved=True,
+            start_date__lte=on_date,
+            end_date__gte=on_date
+        ).values_list('route_number', flat=True)
+    )
+
+
+def price_itineraries(itineraries, pass_routes=frozenset(), passenger_count=1):
+    """
+    Attach a 'fare' to every RouteFinder itinerary in one pass.
+    Each leg is priced from its route's fare table (legs already carry their stop
+    slice, so no stop lookups are needed); legs on routes covered by a pass are
+    free for the pass holder (the first passenger), every leg after a transfer gets
+    the transfer discount, and the journey total per passenger is capped.
+    Itineraries on unknown routes get fare None.
+    """
+    rules = get_fare_rules()
+    zero = Decimal('0.00')
+    passenger_count = max(int(passenger_count), 1)
+
+    for itinerary in itineraries:
+        legs = []
+        per_person = zero
+        holder = zero
+        for position, part in enumerate(itinerary['route_parts']):
+            table = get_fare_table(part['bus_number'])
+            if table is None:
+                legs = None
+                break
+
+            hops = max(part['total_stops'] - 1, 0)
+            fare = table.fares[min(hops, len(table.fares) - 1)]
+            discount = min(rules['transfer_discount'], fare) if position else zero
+            covered = part['bus_number'] in pass_routes
+
+            per_person += fare - discount
+            if not covered:
+                holder += fare - discount
+            legs.append({
+                'bus_number': part['bus_number'],
+                'stops': hops,
+                'fare': str(fare),
+                'transfer_discount': str(discount),
+                'covered_by_pass': covered
+            })
+
+        if legs is None:
+            itinerary['fare'] = None
+            continue
+
+        capped = per_person > rules['journey_max']
+        per_person = min(per_person, rules['journey_max'])
+        holder = min(holder, per_person)
+        itinerary['fare'] = {
+            'legs': legs,
+            'fare_per_person': str(per_person),
+            'capped': capped,
+            'pass_holder_fare': str(holder),
+            'passengers': passenger_count,
+            'total': str(holder + per_person * (passenger_count - 1))
+        }
+
+    return itineraries
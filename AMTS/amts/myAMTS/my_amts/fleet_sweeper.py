@@ -0,0 +1,56 @@
+# my_amts/fleet_sweeper.py
+
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from .models import ActiveBus
+from .stop_geofence import get_route_index, get_geofence_radius
+
+
+def sweep_fleet(now=None):
+    """
+    Housekeeping pass over ActiveBus:
+    1. Buses whose telemetry is older than ACTIVE_BUS_STALE_MINUTES are marked
+       inactive in a single UPDATE driven by the (is_active, last_updated) index,
+       so live queries filtering on is_active only see the working set. The
+       next telemetry for a bus marks it active again.
+    2. Active buses reporting zero speed for longer than STALL_THRESHOLD_MINUTES
+       while outside every stop geofence are flagged as stalled (and DELAYED) in
+       one bulk update; record_speed clears both once the bus moves.
+    """
+    now = now or timezone.now()
+    stale_cutoff = now - timedelta(minutes=getattr(settings, 'ACTIVE_BUS_STALE_MINUTES', 15))
+    stall_cutoff = now - timedelta(minutes=getattr(settings, 'STALL_THRESHOLD_MINUTES', 5))
+    radius_km = get_geofence_radius()
+
+    expired = ActiveBus.objects.filter(
+        is_active=True,
+        last_updated__lt=stale_cutoff
+    ).update(is_active=False)
+
+    # Manual stops and accidents are already known; only unexplained standstills matter
+    candidates = ActiveBus.objects.filter(
+        is_active=True,
+        is_stalled=False,
+        is_manual_stop=False,
+        is_accident=False,
+        speed__lte=0,
+        stopped_since__lt=stall_cutoff,
+        latitude__isnull=False,
+        longitude__isnull=False
+    ).select_related('bus')
+
+    stalled = []
+    for active_bus in candidates:
+        _, distance = get_route_index(active_bus.bus).nearest_stop(active_bus.latitude, active_bus.longitude)
+        if distance is None or distance > radius_km:
+            active_bus.is_stalled = True
+            active_bus.status = 'DELAYED'
+            stalled.append(active_bus)
+
+    ActiveBus.objects.bulk_update(stalled, ['is_stalled', 'status'])
+
+    return {
+        'expired': expired,
+        'stalled': len(stalled)
+    }
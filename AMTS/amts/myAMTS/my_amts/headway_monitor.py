@@ -0,0 +1,119 @@
+# my_amts/headway_monitor.py
+
+import re
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from .models import ActiveBus, HeadwayAlert
+from .stop_geofence import get_route_index
+
+# Direction code embedded in identifiers such as '45-F1' / '45-R2'
+DIRECTION_PATTERN = re.compile(r'-([FR])\d+$')
+
+
+def get_direction(identifier):
+    match = DIRECTION_PATTERN.search(identifier)
+    return match.group(1) if match else 'F'
+
+
+def get_headway_settings():
+    return {
+        'bunching_minutes': getattr(settings, 'HEADWAY_BUNCHING_MINUTES', 3),
+        'gap_minutes': getattr(settings, 'HEADWAY_GAP_MINUTES', 20),
+        'nominal_speed': getattr(settings, 'HEADWAY_NOMINAL_SPEED_KMH', 20)
+    }
+
+
+def compute_headways(active_buses, nominal_speed):
+    """
+    Group vehicles by (route, direction), order them by progress along the stop
+    sequence and compute the gap to the vehicle ahead. Vehicles without a
+    position fix are skipped; their progress would default to the first stop.
+    Returns a list of (bus, direction, leader_identifier, follower_identifier, gap_km, headway_minutes).
+    """
+    groups = {}
+    for active_bus in active_buses:
+        if active_bus.latitude is None or active_bus.longitude is None:
+            continue
+        direction = get_direction(active_bus.identifier)
+        route_index = get_route_index(active_bus.bus)
+        progress = route_index.progress_km(
+            active_bus.stop_index,
+            active_bus.latitude,
+            active_bus.longitude,
+            forward=direction == 'F'
+        )
+        groups.setdefault((active_bus.bus_id, direction), []).append(
+            (progress, active_bus.identifier, active_bus.bus)
+        )
+
+    minutes_per_km = 60 / nominal_speed
+    headways = []
+    for (_, direction), vehicles in groups.items():
+        if len(vehicles) < 2:
+            continue
+        vehicles.sort(key=lambda v: v[0])
+        # Pairwise pass over consecutive vehicles: each follower against the one ahead
+        for follower, leader in zip(vehicles, vehicles[1:]):
+            gap_km = leader[0] - follower[0]
+            headways.append(
+                (leader[2], direction, leader[1], follower[1], gap_km, gap_km * minutes_per_km)
+            )
+    return headways
+
+
+def run_headway_check():
+    """
+    Evaluate headways for the whole active fleet and keep HeadwayAlert in sync:
+    new bunching/gap conditions are inserted, cleared ones are resolved.
+    Only vehicles with a position fix newer than ACTIVE_BUS_STALE_MINUTES are
+    ranked. Costs a fixed four queries regardless of fleet size.
+    """
+    config = get_headway_settings()
+    fresh_since = timezone.now() - timedelta(minutes=getattr(settings, 'ACTIVE_BUS_STALE_MINUTES', 15))
+    active_buses = ActiveBus.objects.filter(
+        is_active=True,
+        is_accident=False,
+        latitude__isnull=False,
+        longitude__isnull=False,
+        last_updated__gte=fresh_since
+    ).select_related('bus')
+
+    detected = {}
+    for bus, direction, leader, follower, gap_km, minutes in compute_headways(active_buses, config['nominal_speed']):
+        if minutes < config['bunching_minutes']:
+            alert_type = 'BUNCHING'
+        elif minutes > config['gap_minutes']:
+            alert_type = 'GAP'
+        else:
+            continue
+        detected[(bus.pk, direction, alert_type, leader, follower)] = HeadwayAlert(
+            bus=bus,
+            direction=direction,
+            alert_type=alert_type,
+            leading_bus=leader,
+            following_bus=follower,
+            gap_km=round(gap_km, 3),
+            headway_minutes=round(minutes, 1)
+        )
+
+    open_alerts = {
+        (alert.bus_id, alert.direction, alert.alert_type, alert.leading_bus, alert.following_bus): alert.pk
+        for alert in HeadwayAlert.objects.filter(is_resolved=False).only(
+            'pk', 'bus_id', 'direction', 'alert_type', 'leading_bus', 'following_bus'
+        )
+    }
+
+    new_alerts = [alert for key, alert in detected.items() if key not in open_alerts]
+    cleared = [pk for key, pk in open_alerts.items() if key not in detected]
+
+    HeadwayAlert.objects.bulk_create(new_alerts)
+    if cleared:
+        HeadwayAlert.objects.filter(pk__in=cleared).update(is_resolved=True, resolved_at=timezone.now())
+
+    return {
+        'vehicles': len(active_buses),
+        'new_alerts': len(new_alerts),
+        'resolved_alerts': len(cleared),
+        'open_alerts': len(detected)
+    }
@@ -0,0 +1,52 @@
+# my_amts/mail_dispatch.py
+
+import asyncio
+import threading
+import time
+from django.conf import settings
+
+
+class RateLimiter:
+    """
+    Token bucket: allows bursts of up to `burst` sends, refilled at `rate` per
+    second. acquire() only sleeps for as long as the bucket is actually empty,
+    instead of a fixed delay after every message.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, tokens=1):
+        """Seconds until `tokens` are available, reserving them; 0 if available now"""
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self.rate
+
+    def acquire(self, tokens=1):
+        delay = self.wait_time(tokens)
+        if delay:
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens=1):
+        delay = self.wait_time(tokens)
+        if delay:
+            await asyncio.sleep(delay)
+
+
+def get_email_rate_limiter():
+    return RateLimiter(
+        getattr(settings, 'EMERGENCY_EMAIL_RATE', 10),
+        getattr(settings, 'EMERGENCY_EMAIL_BURST', 20)
+    )
@@ -0,0 +1,93 @@
+# my_amts/management/commands/benchmark_booking_contention.py
+import threading
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections
+from my_amts.booking_service import create_booking_with_tickets
+from my_amts.models import Booking, Bus, TripInventory
+from my_amts.seat_inventory import SeatsUnavailable, trip_departure
+
+BENCH_BUS = 'BENCH'
+BENCH_USER = 'booking_benchmark'
+
+
+class Command(BaseCommand):
+    help = 'Hammer one departure with parallel bookings and check seats are never oversold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Parallel booking workers')
+        parser.add_argument('--attempts', type=int, default=50, help='Booking attempts per worker')
+        parser.add_argument('--capacity', type=int, default=150, help='Seats on the benchmark departure')
+        parser.add_argument('--passengers', type=int, default=1, help='Passengers per booking')
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username=BENCH_USER)
+        Bus.objects.update_or_create(
+            bus_number=BENCH_BUS,
+            defaults={'stops': [], 'capacity': options['capacity']}
+        )
+        TripInventory.objects.filter(bus_number=BENCH_BUS).delete()
+        Booking.objects.filter(bus_number=BENCH_BUS).delete()
+
+        counts = {'booked': 0, 'sold_out': 0, 'errors': 0}
+        latencies = []
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                for _ in range(options['attempts']):
+                    started = time.perf_counter()
+                    try:
+                        create_booking_with_tickets(
+                            user, BENCH_BUS, 'A', 'B', 10 * options['passengers'], options['passengers']
+                        )
+                        outcome = 'booked'
+                    except SeatsUnavailable:
+                        outcome = 'sold_out'
+                    except Exception as e:
+                        self.stderr.write(f'Booking failed: {e}')
+                        outcome = 'errors'
+                    with lock:
+                        counts[outcome] += 1
+                        latencies.append(time.perf_counter() - started)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        try:
+            trip = TripInventory.objects.get(bus_number=BENCH_BUS, departure=trip_departure())
+            seats_booked = trip.seats_booked
+            tickets = Booking.objects.filter(bus_number=BENCH_BUS).count() * options['passengers']
+            attempts = sum(counts.values())
+            ordered = sorted(latencies)
+
+            self.stdout.write(
+                f"{options['threads']} workers, {attempts} attempts in {elapsed:.2f}s "
+                f"({attempts / elapsed:,.0f} attempts/sec)"
+            )
+            self.stdout.write(
+                f"Booked {counts['booked']}, sold out {counts['sold_out']}, errors {counts['errors']}; "
+                f"latency p50 {ordered[len(ordered) // 2] * 1000:.1f}ms, "
+                f"p95 {ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000:.1f}ms"
+            )
+            if seats_booked == tickets <= trip.capacity:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Inventory consistent: {seats_booked}/{trip.capacity} seats, {tickets} tickets issued'
+                ))
+            else:
+                self.stdout.write(self.style.ERROR(
+                    f'Inventory mismatch: counter {seats_booked}, tickets {tickets}, capacity {trip.capacity}'
+                ))
+        finally:
+            Booking.objects.filter(bus_number=BENCH_BUS).delete()
+            TripInventory.objects.filter(bus_number=BENCH_BUS).delete()
+            Bus.objects.filter(bus_number=BENCH_BUS).delete()
+            user.delete()
@@ -0,0 +1,68 @@
+# my_amts/management/commands/benchmark_fares.py
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from my_amts.models import Bus
+from my_amts.fare_engine import load_fare_tables
+
+
+def list_scan_price(from_stop, to_stop, bus):
+    """The previous pricing: rebuild the stop list and index it on every quote"""
+    stop_names = [stop['name'] for stop in bus.stops]
+    num_stops = abs(stop_names.index(to_stop) - stop_names.index(from_stop))
+    return min(Decimal('10.00') + Decimal('2.00') * num_stops, Decimal('50.00'))
+
+
+class Command(BaseCommand):
+    help = 'Price every origin/destination pair on the network and compare against list scanning'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=20, help='Passes over all OD pairs')
+
+    def handle(self, *args, **options):
+        buses = list(Bus.objects.all())
+        if not buses:
+            raise CommandError('No bus routes found. Run load_bus_data first.')
+
+        started = time.perf_counter()
+        tables = load_fare_tables()
+        build_time = time.perf_counter() - started
+
+        pairs = [
+            (bus, a['name'], b['name'])
+            for bus in buses
+            for a in bus.stops
+            for b in bus.stops
+        ]
+        self.stdout.write(
+            f'{len(tables)} routes, {len(pairs)} OD pairs, tables built in {build_time * 1000:.1f}ms'
+        )
+
+        started = time.perf_counter()
+        for _ in range(options['rounds']):
+            for bus, from_stop, to_stop in pairs:
+                tables[bus.bus_number].fare(from_stop, to_stop)
+        table_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for _ in range(options['rounds']):
+            for bus, from_stop, to_stop in pairs:
+                list_scan_price(from_stop, to_stop, bus)
+        scan_time = time.perf_counter() - started
+
+        mismatches = sum(
+            1 for bus, from_stop, to_stop in pairs
+            if tables[bus.bus_number].fare(from_stop, to_stop) != list_scan_price(from_stop, to_stop, bus)
+        )
+
+        quotes = len(pairs) * options['rounds']
+        self.stdout.write(self.style.SUCCESS(
+            f'Fare tables: {quotes} quotes in {table_time:.3f}s ({quotes / table_time:,.0f}/sec)'
+        ))
+        self.stdout.write(
+            f'List scan:   {quotes} quotes in {scan_time:.3f}s ({quotes / scan_time:,.0f}/sec)'
+        )
+        if mismatches:
+            self.stdout.write(self.style.ERROR(f'{mismatches} OD pairs priced differently'))
+        else:
+            self.stdout.write(self.style.SUCCESS('All OD pairs match the list-scan prices'))
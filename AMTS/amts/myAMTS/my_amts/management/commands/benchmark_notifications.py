@@ -0,0 +1,54 @@
+# my_amts/management/commands/benchmark_notifications.py
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from my_amts.mail_dispatch import RateLimiter
+from my_amts.models import OutboxMessage
+from my_amts.notification_fanout import EmailChannel, LocMemSMSBackend, SMSChannel, fan_out
+
+
+class Command(BaseCommand):
+    help = 'Measure how long one incident takes to reach every recipient on every channel (nothing is really sent)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--emails', type=int, default=200, help='Email recipients')
+        parser.add_argument('--sms', type=int, default=200, help='SMS recipients')
+        parser.add_argument('--sms-latency-ms', type=int, default=50, help='Simulated SMS gateway round trip')
+        parser.add_argument('--email-rate', type=float, default=getattr(settings, 'EMERGENCY_EMAIL_RATE', 10))
+        parser.add_argument('--sms-rate', type=float, default=getattr(settings, 'SMS_RATE', 20))
+        parser.add_argument('--email-concurrency', type=int, default=getattr(settings, 'OUTBOX_WORKERS', 4))
+        parser.add_argument('--sms-concurrency', type=int, default=getattr(settings, 'SMS_CONCURRENCY', 8))
+
+    def handle(self, *args, **options):
+        messages = [
+            OutboxMessage(channel='EMAIL', recipient=f'passenger{i}@example.com', subject='Benchmark', body='Benchmark')
+            for i in range(options['emails'])
+        ] + [
+            OutboxMessage(channel='SMS', recipient=f'+9190000{i:05d}', subject='', body='Benchmark')
+            for i in range(options['sms'])
+        ]
+        channels = {
+            'EMAIL': EmailChannel(
+                concurrency=options['email_concurrency'],
+                rate_limiter=RateLimiter(options['email_rate'], getattr(settings, 'EMERGENCY_EMAIL_BURST', 20)),
+                backend='django.core.mail.backends.locmem.EmailBackend'
+            ),
+            'SMS': SMSChannel(
+                concurrency=options['sms_concurrency'],
+                rate_limiter=RateLimiter(options['sms_rate'], getattr(settings, 'SMS_BURST', 20)),
+                backend=LocMemSMSBackend(latency_ms=options['sms_latency_ms'])
+            ),
+        }
+
+        result = fan_out(messages, channels=channels)
+        LocMemSMSBackend.outbox.clear()
+
+        for name, summary in result['channels'].items():
+            self.stdout.write(
+                f"{name:<6} sent {summary['sent']:>5}  failed {summary['failed']:>4}  "
+                f"p95 {summary['p95_latency']:.3f}s  max {summary['max_latency']:.3f}s"
+            )
+        budget = getattr(settings, 'NOTIFICATION_LATENCY_BUDGET_SECONDS', 30)
+        style = self.style.SUCCESS if result['within_budget'] else self.style.ERROR
+        self.stdout.write(style(
+            f"All channels done in {result['elapsed']:.3f}s (budget {budget}s)"
+        ))
@@ -0,0 +1,35 @@
+# my_amts/management/commands/benchmark_ticket_tokens.py
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from datetime import timedelta
+from my_amts.ticket_tokens import sign_ticket, verify_ticket_token, revocation_list
+
+
+class Command(BaseCommand):
+    help = 'Measure signed ticket token verification throughput on a single core'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100000, help='Number of verifications')
+
+    def handle(self, *args, **options):
+        count = options['count']
+        valid_until = timezone.now() + timedelta(hours=24)
+        tokens = [
+            sign_ticket(uuid.uuid4(), '56', 'Naroda', 'Kalupur', valid_until)
+            for _ in range(min(count, 10000))
+        ]
+        revocation_list.refresh()
+
+        started = time.perf_counter()
+        valid = 0
+        for i in range(count):
+            if verify_ticket_token(tokens[i % len(tokens)])[0]:
+                valid += 1
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f'Token length: {len(tokens[0])} characters')
+        self.stdout.write(self.style.SUCCESS(
+            f'{count} verifications in {elapsed:.2f}s ({count / elapsed:,.0f}/sec), {valid} valid'
+        ))
@@ -0,0 +1,32 @@
+# my_amts/management/commands/build_ridership_rollups.py
+import time
+from django.core.management.base import BaseCommand
+from my_amts.ridership import reset_rollups, update_rollups
+
+
+class Command(BaseCommand):
+    help = 'Fold new bookings into the daily and hourly ridership rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Bookings folded per transaction')
+        parser.add_argument('--rebuild', action='store_true', help='Drop existing rollups and rebuild from all bookings')
+        parser.add_argument('--loop', action='store_true', help='Keep running every --interval seconds')
+        parser.add_argument('--interval', type=float, default=300.0, help='Seconds between runs when looping')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            reset_rollups()
+            self.stdout.write(self.style.WARNING('Existing rollups dropped'))
+
+        while True:
+            started = time.perf_counter()
+            processed = update_rollups(batch_size=options['batch_size'])
+            elapsed = time.perf_counter() - started
+
+            self.stdout.write(self.style.SUCCESS(
+                f'Folded {processed} bookings into rollups in {elapsed * 1000:.1f}ms'
+            ))
+
+            if not options['loop']:
+                break
+            time.sleep(max(0, options['interval'] - elapsed))
@@ -0,0 +1,28 @@
+# my_amts/management/commands/build_verification_bundles.py
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from my_amts.verification_bundles import build_bundles
+
+
+class Command(BaseCommand):
+    help = 'Incrementally refresh offline conductor verification bundles per route and day'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=str, help='Service date (YYYY-MM-DD), defaults to today')
+        parser.add_argument('--days', type=int, default=1, help='Number of consecutive days to build')
+        parser.add_argument('--bus', action='append', dest='buses', help='Limit to these bus numbers')
+
+    def handle(self, *args, **options):
+        if options['date']:
+            try:
+                start = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Date must be in YYYY-MM-DD format')
+        else:
+            start = timezone.localdate()
+
+        for offset in range(options['days']):
+            service_date = start + timedelta(days=offset)
+            changed = build_bundles(service_date, options['buses'])
+            self.stdout.write(self.style.SUCCESS(f'{service_date}: {changed} bundles updated'))
@@ -0,0 +1,72 @@
+# my_amts/management/commands/cleanup_qr_files.py
+import os
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from my_amts.models import Ticket
+from my_amts.qr_codes import stores_qr_files
+
+QR_DIRECTORY = 'qr_codes'
+
+
+class Command(BaseCommand):
+    help = 'Delete stored ticket QR PNGs once QR codes are rendered on demand'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Tickets cleared per UPDATE')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be deleted without deleting')
+        parser.add_argument('--orphans', action='store_true',
+                            help=f'Also delete files in {QR_DIRECTORY}/ not referenced by any ticket')
+
+    def handle(self, *args, **options):
+        if stores_qr_files():
+            raise CommandError("QR_CODE_STORAGE is 'files'; switch to 'on_demand' before removing stored QR codes.")
+
+        dry_run = options['dry_run']
+        batch_size = options['batch_size']
+        deleted = 0
+        # In a dry run referenced files are still on disk; remember them so they aren't counted as orphans
+        referenced = set()
+
+        stored = Ticket.objects.exclude(qr_code='').values_list('ticket_id', 'qr_code')
+        if dry_run:
+            for _, name in stored.iterator(chunk_size=batch_size):
+                referenced.add(os.path.basename(name))
+                deleted += 1
+        else:
+            # Each pass clears its tickets, so the next query returns the following batch
+            while True:
+                batch = list(stored[:batch_size])
+                if not batch:
+                    break
+                self.delete_batch(batch)
+                deleted += len(batch)
+
+        # Tickets whose file was never written render on demand now
+        unrendered = Ticket.objects.filter(qr_status__in=['PENDING', 'FAILED'])
+        ready = unrendered.count() if dry_run else unrendered.update(qr_status='READY')
+
+        orphans = 0
+        if options['orphans'] and default_storage.exists(QR_DIRECTORY):
+            _, files = default_storage.listdir(QR_DIRECTORY)
+            for filename in files:
+                if filename in referenced:
+                    continue
+                if not dry_run:
+                    default_storage.delete(os.path.join(QR_DIRECTORY, filename))
+                orphans += 1
+
+        verb = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {deleted} ticket QR files and {orphans} orphaned files; '
+            f'{ready} unrendered tickets {"would be" if dry_run else "were"} marked ready'
+        ))
+
+    def delete_batch(self, batch):
+        """
+        Clear the tickets' references before deleting their files, so a crash
+        part way through leaves orphaned files (removed by --orphans) rather
+        than tickets pointing at missing files
+        """
+        Ticket.objects.filter(ticket_id__in=[ticket_id for ticket_id, _ in batch]).update(qr_code='')
+        for _, name in batch:
+            default_storage.delete(name)
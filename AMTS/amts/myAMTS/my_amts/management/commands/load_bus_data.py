@@ -1,6 +1,7 @@
 # my_amts/management/commands/load_bus_data.py
 from django.core.management.base import BaseCommand
 from my_amts.models import Bus
+from my_amts.fare_engine import invalidate_fare_tables
 
 class Command(BaseCommand):
     help = 'Load initial bus data'
@@ -458,4 +459,8 @@ class Command(BaseCommand):
                 updated_count += 1
                 self.stdout.write(self.style.SUCCESS(f'Successfully updated bus {bus.bus_number}'))
                 
-        self.stdout.write(self.style.SUCCESS(f'Operation Complete: {created_count} created, {updated_count} updated.'))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS(f'Operation Complete: {created_count} created, {updated_count} updated.'))
+
+        # Fare tables live in each server process; a new shared version makes them rebuild
+        invalidate_fare_tables()
+        self.stdout.write(self.style.SUCCESS('Fare tables invalidated; servers rebuild them on their next check.'))
\ No newline at end of file
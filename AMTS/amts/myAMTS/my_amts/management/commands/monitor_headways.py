@@ -0,0 +1,28 @@
+# my_amts/management/commands/monitor_headways.py
+import time
+from django.core.management.base import BaseCommand
+from my_amts.headway_monitor import run_headway_check
+
+
+class Command(BaseCommand):
+    help = 'Detect bus bunching and long gaps between vehicles on each route'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running every --interval seconds')
+        parser.add_argument('--interval', type=float, default=30.0, help='Seconds between checks when looping')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            result = run_headway_check()
+            elapsed = (time.perf_counter() - started) * 1000
+
+            self.stdout.write(self.style.SUCCESS(
+                f"Checked {result['vehicles']} vehicles in {elapsed:.1f}ms: "
+                f"{result['new_alerts']} new, {result['resolved_alerts']} resolved, "
+                f"{result['open_alerts']} open alerts"
+            ))
+
+            if not options['loop']:
+                break
+            time.sleep(max(0, options['interval'] - elapsed / 1000))
@@ -0,0 +1,34 @@
+# my_amts/management/commands/process_bus_passes.py
+import time
+from django.core.management.base import BaseCommand
+from my_amts.pass_documents import process_pending_passes, requeue_passes
+
+
+class Command(BaseCommand):
+    help = 'Background worker that renders and emails PDFs for submitted bus passes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20, help='Passes processed per batch')
+        parser.add_argument('--requeue', action='store_true',
+                            help='Retry failed passes and emails, and ones stuck past the lease, before starting')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new passes')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+
+    def handle(self, *args, **options):
+        if options['requeue']:
+            self.stdout.write(self.style.WARNING(f'Requeued {requeue_passes()} passes'))
+
+        while True:
+            started = time.perf_counter()
+            processed = process_pending_passes(options['batch_size'])
+
+            if processed:
+                elapsed = time.perf_counter() - started
+                self.stdout.write(self.style.SUCCESS(
+                    f'Processed {processed} bus passes in {elapsed:.2f}s'
+                ))
+                continue
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,34 @@
+# my_amts/management/commands/process_notifications.py
+import time
+from django.core.management.base import BaseCommand
+from my_amts.notification_outbox import process_outbox, requeue_failed_messages
+
+
+class Command(BaseCommand):
+    help = 'Background worker that delivers queued emergency notifications from the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Messages claimed per batch')
+        parser.add_argument('--workers', type=int, default=None, help='Concurrent SMTP connections')
+        parser.add_argument('--requeue', action='store_true', help='Retry permanently failed messages before starting')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new messages')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when nothing is due')
+
+    def handle(self, *args, **options):
+        if options['requeue']:
+            self.stdout.write(self.style.WARNING(f'Requeued {requeue_failed_messages()} messages'))
+
+        while True:
+            started = time.perf_counter()
+            processed = process_outbox(options['batch_size'], options['workers'])
+
+            if processed:
+                elapsed = time.perf_counter() - started
+                self.stdout.write(self.style.SUCCESS(
+                    f'Processed {processed} notifications in {elapsed:.2f}s'
+                ))
+                continue
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
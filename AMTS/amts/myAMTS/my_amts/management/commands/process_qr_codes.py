@@ -0,0 +1,35 @@
+# my_amts/management/commands/process_qr_codes.py
+import time
+from django.core.management.base import BaseCommand
+from my_amts.models import Ticket
+from my_amts.qr_codes import generate_ticket_qr_codes
+
+
+class Command(BaseCommand):
+    help = 'Background worker that renders QR codes for tickets still pending'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='Tickets rendered per batch')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new tickets')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+
+    def handle(self, *args, **options):
+        # Encoding is CPU-bound and holds the GIL, so batches are rendered one after
+        # another in this process; a thread pool would only add handoffs
+        while True:
+            pending = list(
+                Ticket.objects.filter(qr_status='PENDING').values_list('ticket_id', flat=True)[:options['batch_size']]
+            )
+
+            if pending:
+                started = time.perf_counter()
+                generated = generate_ticket_qr_codes(pending)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(self.style.SUCCESS(
+                    f'Rendered {generated} QR codes in {elapsed:.2f}s'
+                ))
+                continue
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,127 @@
+# my_amts/management/commands/rerender_bus_passes.py
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from my_amts.models import BusPass
+from my_amts.pass_documents import PASS_RENDER_FIELDS, render_pass_row, warm_pdf_renderer
+
+# Passes still PENDING or PROCESSING belong to the process_bus_passes pipeline,
+# which also sends their email; only passes it has finished with are re-rendered
+RERENDERABLE_STATUSES = ('READY', 'FAILED')
+
+
+class Command(BaseCommand):
+    help = 'Regenerate PDFs for processed (READY or FAILED) bus passes in parallel across a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pass-type', choices=['MONTHLY', 'STUDENT'], help='Only passes of this type')
+        parser.add_argument('--since', type=str, help='Only passes applied for on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--valid-on', type=str, help='Only passes valid on this date (YYYY-MM-DD)')
+        parser.add_argument('--ids', nargs='+', help='Only these pass IDs')
+        parser.add_argument('--missing', action='store_true', help='Only passes without a PDF')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Rendering processes')
+        parser.add_argument('--chunk-size', type=int, default=200, help='Rows fetched per database query')
+        parser.add_argument('--batch-size', type=int, default=200, help='Passes saved per bulk update')
+
+    def handle(self, *args, **options):
+        # Materialise the matching IDs first: results are written back while we go,
+        # and with --missing those writes would change an open cursor's result set
+        pass_ids = list(self.get_queryset(options).values_list('pk', flat=True))
+        total = len(pass_ids)
+        if not total:
+            self.stdout.write('No passes to render')
+            return
+
+        workers = max(1, options['workers'])
+        self.stdout.write(f'Rendering {total} passes with {workers} worker processes')
+
+        rendered = 0
+        failures = []
+        updates = []
+        in_flight = set()
+        max_in_flight = workers * 4
+        started = time.perf_counter()
+
+        def collect(done):
+            nonlocal rendered
+            for future in done:
+                pass_id, pdf_path, error = future.result()
+                if error:
+                    failures.append((pass_id, error))
+                else:
+                    rendered += 1
+                    updates.append(BusPass(pass_id=pass_id, pdf_file=pdf_path, pdf_status='READY',
+                                           processing_error='', processed_at=timezone.now()))
+            if len(updates) >= options['batch_size']:
+                self.save(updates)
+
+        # Workers are forked on the first submits, so they inherit the parent's open
+        # database connection; they only render the rows handed to them and never use it
+        with ProcessPoolExecutor(max_workers=workers, initializer=warm_pdf_renderer) as executor:
+            # Rows are loaded a chunk at a time and only a few batches are in flight,
+            # so memory stays flat however many passes match
+            chunk_size = options['chunk_size']
+            for start in range(0, total, chunk_size):
+                rows = list(
+                    BusPass.objects.filter(pk__in=pass_ids[start:start + chunk_size]).values(*PASS_RENDER_FIELDS)
+                )
+                for row in rows:
+                    in_flight.add(executor.submit(render_pass_row, row))
+                    if len(in_flight) >= max_in_flight:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        collect(done)
+
+            done, _ = wait(in_flight)
+            collect(done)
+
+        self.save(updates)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {rendered}/{total} passes in {elapsed:.2f}s ({rendered / elapsed:,.1f} passes/sec)'
+        ))
+        if failures:
+            self.stdout.write(self.style.ERROR(f'{len(failures)} passes failed:'))
+            for pass_id, error in failures[:20]:
+                self.stdout.write(f'  {pass_id}: {error}')
+
+    def get_queryset(self, options):
+        passes = BusPass.objects.filter(pdf_status__in=RERENDERABLE_STATUSES).order_by('pk')
+        try:
+            if options['since']:
+                since = datetime.strptime(options['since'], '%Y-%m-%d').date()
+                passes = passes.filter(application_date__date__gte=since)
+            if options['valid_on']:
+                valid_on = datetime.strptime(options['valid_on'], '%Y-%m-%d').date()
+                passes = passes.filter(start_date__lte=valid_on, end_date__gte=valid_on)
+        except ValueError:
+            raise CommandError('Dates must be in YYYY-MM-DD format')
+        if options['pass_type']:
+            passes = passes.filter(pass_type=options['pass_type'])
+        if options['ids']:
+            passes = passes.filter(pass_id__in=options['ids'])
+        if options['missing']:
+            passes = passes.filter(Q(pdf_file='') | Q(pdf_file__isnull=True))
+        return passes
+
+    def save(self, updates):
+        if not updates:
+            return
+        with transaction.atomic():
+            # Skip passes requeued into the pipeline while they were rendering
+            owned = set(
+                BusPass.objects.select_for_update().filter(
+                    pk__in=[bus_pass.pk for bus_pass in updates],
+                    pdf_status__in=RERENDERABLE_STATUSES
+                ).values_list('pk', flat=True)
+            )
+            BusPass.objects.bulk_update(
+                [bus_pass for bus_pass in updates if bus_pass.pk in owned],
+                ['pdf_file', 'pdf_status', 'processing_error', 'processed_at']
+            )
+        updates.clear()
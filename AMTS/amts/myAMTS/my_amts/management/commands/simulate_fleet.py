@@ -0,0 +1,243 @@
+# my_amts/management/commands/simulate_fleet.py
+import json
+import random
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from math import radians, sin, cos, sqrt, atan2
+
+from django.core.management.base import BaseCommand, CommandError
+from my_amts.models import Bus, ActiveBus
+from my_amts.stop_geofence import snap_fleet
+
+SIM_PREFIX = 'SIM'
+
+
+def segment_length(a, b):
+    """Haversine distance in km between two [lat, lng] coordinates"""
+    lat1, lon1, lat2, lon2 = map(radians, [float(a[0]), float(a[1]), float(b[0]), float(b[1])])
+    h = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 6371 * 2 * atan2(sqrt(h), sqrt(1 - h))
+
+
+class SimulatedVehicle:
+    """A vehicle moving back and forth along its route's stop coordinates"""
+
+    def __init__(self, identifier, bus, speed, offset_km):
+        self.identifier = identifier
+        self.points = [stop['coordinates'] for stop in bus.stops]
+        self.lengths = [segment_length(a, b) for a, b in zip(self.points, self.points[1:])]
+        self.route_km = sum(self.lengths)
+        self.cruise_speed = speed
+        self.speed = speed
+        self.distance = offset_km % self.route_km if self.route_km else 0
+        self.forward = True
+        self.event = None
+        self.event_ticks = 0
+
+    def advance(self, km):
+        if not self.route_km:
+            return
+        self.distance += km if self.forward else -km
+        # Bounce at the termini
+        while self.distance > self.route_km or self.distance < 0:
+            if self.distance > self.route_km:
+                self.distance = 2 * self.route_km - self.distance
+                self.forward = False
+            else:
+                self.distance = -self.distance
+                self.forward = True
+
+    def position(self):
+        remaining = self.distance
+        for i, length in enumerate(self.lengths):
+            if remaining <= length:
+                t = remaining / length if length else 0
+                a, b = self.points[i], self.points[i + 1]
+                return (
+                    float(a[0]) + (float(b[0]) - float(a[0])) * t,
+                    float(a[1]) + (float(b[1]) - float(a[1])) * t
+                )
+            remaining -= length
+        return float(self.points[-1][0]), float(self.points[-1][1])
+
+
+class Command(BaseCommand):
+    help = 'Simulate a fleet of buses moving along their routes to load test live tracking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vehicles', type=int, default=20, help='Number of simulated vehicles')
+        parser.add_argument('--ticks', type=int, default=60, help='Number of ticks to run')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds between ticks (0 runs as fast as possible)')
+        parser.add_argument('--time-scale', type=float, default=10.0,
+                            help='Simulated seconds per real second of tick interval')
+        parser.add_argument('--speed', type=float, default=35.0, help='Cruise speed in km/h')
+        parser.add_argument('--mode', choices=['direct', 'http'], default='direct',
+                            help='Write straight into ActiveBus or POST to update_bus_status')
+        parser.add_argument('--url', default='http://127.0.0.1:8000',
+                            help='Base URL of the running server for --mode http')
+        parser.add_argument('--concurrency', type=int, default=8, help='Parallel HTTP requests')
+        parser.add_argument('--accident-rate', type=float, default=0.0,
+                            help='Per-vehicle, per-tick probability of an accident')
+        parser.add_argument('--stop-rate', type=float, default=0.0,
+                            help='Per-vehicle, per-tick probability of a manual stop')
+        parser.add_argument('--event-ticks', type=int, default=10,
+                            help='Ticks an accident or manual stop lasts before the vehicle resumes')
+        parser.add_argument('--seed', type=int, help='Random seed for repeatable runs')
+        parser.add_argument('--cleanup', action='store_true',
+                            help='Delete the simulated ActiveBus rows when finished')
+
+    def handle(self, *args, **options):
+        if options['seed'] is not None:
+            random.seed(options['seed'])
+
+        buses = [bus for bus in Bus.objects.all() if len(bus.stops) >= 2]
+        if not buses:
+            raise CommandError('No bus routes found. Run load_bus_data first.')
+
+        vehicles = self.create_vehicles(buses, options['vehicles'], options['speed'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Simulating {len(vehicles)} vehicles on {len(buses)} routes ({options['mode']} mode)"
+        ))
+
+        tick_seconds = (options['interval'] or 1.0) * options['time_scale']
+        tick_times = []
+        total_updates = 0
+
+        executor = ThreadPoolExecutor(max_workers=options['concurrency']) if options['mode'] == 'http' else None
+        try:
+            for tick in range(options['ticks']):
+                started = time.perf_counter()
+
+                changed = self.step(vehicles, tick_seconds, options)
+                if executor:
+                    self.emit_http(executor, vehicles, changed, options['url'])
+                else:
+                    self.emit_direct(vehicles, changed)
+                total_updates += len(vehicles)
+
+                elapsed = time.perf_counter() - started
+                tick_times.append(elapsed)
+                if options['interval'] and elapsed < options['interval']:
+                    time.sleep(options['interval'] - elapsed)
+        finally:
+            if executor:
+                executor.shutdown()
+            if options['cleanup']:
+                ActiveBus.objects.filter(identifier__in=[v.identifier for v in vehicles]).delete()
+
+        self.report(tick_times, total_updates)
+
+    def create_vehicles(self, buses, count, speed):
+        vehicles = []
+        for i in range(count):
+            bus = buses[i % len(buses)]
+            identifier = f"{SIM_PREFIX}{i}-{bus.bus_number}"[:20]
+            vehicle = SimulatedVehicle(identifier, bus, speed, offset_km=random.uniform(0, 50))
+            latitude, longitude = vehicle.position()
+            ActiveBus.objects.update_or_create(
+                identifier=identifier,
+                defaults={
+                    'bus': bus,
+                    'current_location': bus.stops[0]['name'],
+                    'status': 'ON_TIME',
+                    'speed': speed,
+                    'is_active': True,
+                    'is_manual_stop': False,
+                    'is_accident': False,
+                    'latitude': latitude,
+                    'longitude': longitude
+                }
+            )
+            vehicles.append(vehicle)
+        return vehicles
+
+    def step(self, vehicles, tick_seconds, options):
+        """Move every vehicle one tick and roll events. Returns vehicles whose event state changed."""
+        changed = []
+        for vehicle in vehicles:
+            if vehicle.event:
+                vehicle.event_ticks -= 1
+                if vehicle.event_ticks <= 0:
+                    vehicle.event = None
+                    vehicle.speed = vehicle.cruise_speed
+                    changed.append(vehicle)
+                continue
+
+            roll = random.random()
+            if roll < options['accident_rate']:
+                vehicle.event = 'accident'
+            elif roll < options['accident_rate'] + options['stop_rate']:
+                vehicle.event = 'manual_stop'
+
+            if vehicle.event:
+                vehicle.event_ticks = options['event_ticks']
+                vehicle.speed = 0
+                changed.append(vehicle)
+                continue
+
+            vehicle.advance(vehicle.speed * tick_seconds / 3600)
+        return changed
+
+    def emit_direct(self, vehicles, changed):
+        positions = {}
+        for vehicle in vehicles:
+            latitude, longitude = vehicle.position()
+            positions[vehicle.identifier] = (latitude, longitude, vehicle.speed)
+        snap_fleet(positions)
+
+        for event, status in [('accident', 'OUT_OF_SERVICE'), ('manual_stop', 'DELAYED'), (None, 'ON_TIME')]:
+            identifiers = [v.identifier for v in changed if v.event == event]
+            if identifiers:
+                ActiveBus.objects.filter(identifier__in=identifiers).update(
+                    is_accident=event == 'accident',
+                    is_manual_stop=event == 'manual_stop',
+                    status=status
+                )
+
+    def emit_http(self, executor, vehicles, changed, base_url):
+        changed_ids = {v.identifier for v in changed}
+        url = base_url.rstrip('/') + '/api/update-bus-status/'
+
+        def post(vehicle):
+            latitude, longitude = vehicle.position()
+            payload = {
+                'bus_id': vehicle.identifier,
+                'speed': vehicle.speed,
+                'latitude': latitude,
+                'longitude': longitude
+            }
+            if vehicle.identifier in changed_ids:
+                payload['is_accident'] = vehicle.event == 'accident'
+                payload['is_manual_stop'] = vehicle.event == 'manual_stop'
+            request = urllib.request.Request(
+                url,
+                data=json.dumps(payload).encode('utf-8'),
+                headers={'Content-Type': 'application/json'},
+                method='POST'
+            )
+            try:
+                with urllib.request.urlopen(request, timeout=10) as response:
+                    return response.status == 200
+            except Exception:
+                return False
+
+        failures = sum(1 for ok in executor.map(post, vehicles) if not ok)
+        if failures:
+            self.stdout.write(self.style.WARNING(f'{failures} updates failed this tick'))
+
+    def report(self, tick_times, total_updates):
+        if not tick_times:
+            return
+        busy = sum(tick_times)
+        ordered = sorted(tick_times)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(tick_times)} ticks, {total_updates} updates in {busy:.2f}s busy time '
+            f'({total_updates / busy if busy else 0:.0f} updates/sec)'
+        ))
+        self.stdout.write(
+            f'Tick latency: avg {busy / len(tick_times) * 1000:.1f}ms, '
+            f'p95 {p95 * 1000:.1f}ms, max {ordered[-1] * 1000:.1f}ms'
+        )
@@ -0,0 +1,27 @@
+# my_amts/management/commands/sweep_active_buses.py
+import time
+from django.core.management.base import BaseCommand
+from my_amts.fleet_sweeper import sweep_fleet
+
+
+class Command(BaseCommand):
+    help = 'Expire ActiveBus rows with stale telemetry and flag stalled vehicles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running every --interval seconds')
+        parser.add_argument('--interval', type=float, default=60.0, help='Seconds between sweeps when looping')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            result = sweep_fleet()
+            elapsed = (time.perf_counter() - started) * 1000
+
+            self.stdout.write(self.style.SUCCESS(
+                f"Sweep finished in {elapsed:.1f}ms: {result['expired']} expired, "
+                f"{result['stalled']} newly stalled"
+            ))
+
+            if not options['loop']:
+                break
+            time.sleep(max(0, options['interval'] - elapsed / 1000))
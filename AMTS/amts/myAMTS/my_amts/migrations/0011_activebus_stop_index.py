@@ -0,0 +1,20 @@
+# Generated by Django 5.2.10 on 2026-10-19 17:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("my_amts", "0010_accidentnotification_emergencycontact"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="activebus",
+            name="stop_index",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Index in bus.stops of the last stop reached"
+            ),
+        ),
+    ]
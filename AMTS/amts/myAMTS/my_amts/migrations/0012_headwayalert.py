@@ -0,0 +1,78 @@
+# Generated by Django 5.2.10 on 2026-10-19 17:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("my_amts", "0011_activebus_stop_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HeadwayAlert",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "direction",
+                    models.CharField(
+                        choices=[("F", "Forward"), ("R", "Reverse")], max_length=1
+                    ),
+                ),
+                (
+                    "alert_type",
+                    models.CharField(
+                        choices=[("BUNCHING", "Bus Bunching"), ("GAP", "Long Gap")],
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "leading_bus",
+                    models.CharField(
+                        help_text="Identifier of the ActiveBus ahead", max_length=20
+                    ),
+                ),
+                (
+                    "following_bus",
+                    models.CharField(
+                        help_text="Identifier of the ActiveBus behind", max_length=20
+                    ),
+                ),
+                ("gap_km", models.FloatField()),
+                ("headway_minutes", models.FloatField()),
+                ("detected_at", models.DateTimeField(auto_now_add=True)),
+                ("is_resolved", models.BooleanField(default=False)),
+                ("resolved_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "bus",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="headway_alerts",
+                        to="my_amts.bus",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Headway Alert",
+                "verbose_name_plural": "Headway Alerts",
+                "ordering": ["-detected_at"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="headwayalert",
+            index=models.Index(
+                fields=["is_resolved", "detected_at"],
+                name="my_amts_hea_is_reso_a391ba_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.10 on 2026-10-19 17:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("my_amts", "0012_headwayalert"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="activebus",
+            name="is_stalled",
+            field=models.BooleanField(
+                default=False,
+                help_text="True if stopped away from any stop for too long",
+            ),
+        ),
+        migrations.AddField(
+            model_name="activebus",
+            name="stopped_since",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="When telemetry first reported zero speed",
+                null=True,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="activebus",
+            index=models.Index(
+                fields=["is_active", "last_updated"],
+                name="my_amts_act_is_acti_5434d3_idx",
+            ),
+        ),
+    ]
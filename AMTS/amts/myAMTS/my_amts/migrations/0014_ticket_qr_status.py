@@ -0,0 +1,34 @@
+# Generated by Django 5.2.10 on 2026-10-19 17:21
+
+from django.db import migrations, models
+
+
+def mark_existing_qr_codes_ready(apps, schema_editor):
+    # Tickets created before background rendering already have their QR image
+    Ticket = apps.get_model("my_amts", "Ticket")
+    Ticket.objects.exclude(qr_code="").update(qr_status="READY")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("my_amts", "0013_activebus_stall_tracking"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ticket",
+            name="qr_status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pending"),
+                    ("READY", "Ready"),
+                    ("FAILED", "Failed"),
+                ],
+                db_index=True,
+                default="PENDING",
+                max_length=10,
+            ),
+        ),
+        migrations.RunPython(mark_existing_qr_codes_ready, migrations.RunPython.noop),
+    ]
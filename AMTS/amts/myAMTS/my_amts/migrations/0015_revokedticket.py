@@ -0,0 +1,25 @@
+# Generated by Django 5.2.10 on 2026-10-19 17:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("my_amts", "0014_ticket_qr_status"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RevokedTicket",
+            fields=[
+                ("ticket_id", models.UUIDField(primary_key=True, serialize=False)),
+                ("reason", models.CharField(default="REFUND", max_length=50)),
+                ("revoked_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name": "Revoked Ticket",
+                "verbose_name_plural": "Revoked Tickets",
+            },
+        ),
+    ]
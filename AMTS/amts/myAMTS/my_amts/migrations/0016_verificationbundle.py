@@ -0,0 +1,45 @@
+# Generated by Django 5.2.10 on 2026-10-19 17:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("my_amts", "0015_revokedticket"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VerificationBundle",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("bus_number", models.CharField(max_length=10)),
+                ("service_date", models.DateField()),
+                ("version", models.PositiveIntegerField(default=0)),
+                ("revoked_entries", models.JSONField(default=dict)),
+                (
+                    "revoked_through",
+                    models.DateTimeField(
+                        blank=True,
+                        help_text="High-water mark of RevokedTicket.revoked_at",
+                        null=True,
+                    ),
+                ),
+                ("generated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Verification Bundle",
+                "verbose_name_plural": "Verification Bundles",
+                "unique_together": {("bus_number", "service_date")},
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.10 on 2026-10-19 17:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("my_amts", "0016_verificationbundle"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="booking",
+            index=models.Index(
+                fields=["user", "booking_date"], name="my_amts_boo_user_id_17e9bb_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.10 on 2026-10-19 17:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("my_amts", "0017_booking_user_date_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RidershipRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "granularity",
+                    models.CharField(
+                        choices=[("DAY", "Daily"), ("HOUR", "Hourly")], max_length=4
+                    ),
+                ),
+                ("period_start", models.DateTimeField()),
+                ("bus_number", models.CharField(max_length=10)),
+                ("from_stop", models.CharField(max_length=100)),
+                ("to_stop", models.CharField(max_length=100)),
+                ("bookings", models.PositiveIntegerField(default=0)),
+                ("tickets", models.PositiveIntegerField(default=0)),
+                (
+                    "revenue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+            ],
+            options={
+                "verbose_name": "Ridership Rollup",
+                "verbose_name_plural": "Ridership Rollups",
+            },
+        ),
+        migrations.CreateModel(
+            name="RollupWatermark",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=50, unique=True)),
+                ("last_booking_date", models.DateTimeField(blank=True, null=True)),
+                ("last_booking_id", models.UUIDField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="ridershiprollup",
+            index=models.Index(
+                fields=["granularity", "bus_number", "period_start"],
+                name="my_amts_rid_granula_77fd49_idx",
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="ridershiprollup",
+            unique_together={
+                ("granularity", "period_start", "bus_number", "from_stop", "to_stop")
+            },
+        ),
+    ]
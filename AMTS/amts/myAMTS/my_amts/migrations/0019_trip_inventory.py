@@ -0,0 +1,58 @@
+# Generated by Django 5.2.10 on 2026-10-19 17:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("my_amts", "0018_ridership_rollups"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TripInventory",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("bus_number", models.CharField(max_length=10)),
+                (
+                    "departure",
+                    models.DateTimeField(help_text="Start of the departure slot"),
+                ),
+                ("capacity", models.PositiveIntegerField()),
+                ("seats_booked", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "Trip Inventory",
+                "verbose_name_plural": "Trip Inventories",
+                "unique_together": {("bus_number", "departure")},
+            },
+        ),
+        migrations.AddField(
+            model_name="bus",
+            name="capacity",
+            field=models.PositiveIntegerField(
+                default=60, help_text="Passengers one vehicle can carry"
+            ),
+        ),
+        migrations.AddField(
+            model_name="booking",
+            name="trip",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="bookings",
+                to="my_amts.tripinventory",
+            ),
+        ),
+    ]
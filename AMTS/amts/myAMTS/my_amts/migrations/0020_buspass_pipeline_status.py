@@ -0,0 +1,60 @@
+# Generated by Django 5.2.10 on 2026-10-19 17:34
+
+from django.db import migrations, models
+
+
+def mark_existing_passes_processed(apps, schema_editor):
+    # Passes submitted before the background pipeline were rendered and emailed inline
+    BusPass = apps.get_model("my_amts", "BusPass")
+    BusPass.objects.exclude(pdf_file="").exclude(pdf_file=None).update(pdf_status="READY")
+    BusPass.objects.update(email_status="SKIPPED")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("my_amts", "0019_trip_inventory"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="buspass",
+            name="email_status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pending"),
+                    ("SENT", "Sent"),
+                    ("FAILED", "Failed"),
+                    ("SKIPPED", "Skipped"),
+                ],
+                default="PENDING",
+                max_length=10,
+            ),
+        ),
+        migrations.AddField(
+            model_name="buspass",
+            name="pdf_status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pending"),
+                    ("PROCESSING", "Processing"),
+                    ("READY", "Ready"),
+                    ("FAILED", "Failed"),
+                ],
+                db_index=True,
+                default="PENDING",
+                max_length=10,
+            ),
+        ),
+        migrations.AddField(
+            model_name="buspass",
+            name="processed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="buspass",
+            name="processing_error",
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(mark_existing_passes_processed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.10 on 2026-10-19 17:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("my_amts", "0020_buspass_pipeline_status"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="buspass",
+            index=models.Index(
+                fields=["end_date", "is_approved"], name="buspass_end_date_idx"
+            ),
+        ),
+    ]
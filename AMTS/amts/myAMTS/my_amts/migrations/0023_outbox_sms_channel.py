@@ -0,0 +1,34 @@
+# Generated by Django 5.2.10 on 2026-10-19 17:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("my_amts", "0022_notification_outbox"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="outboxmessage",
+            name="channel",
+            field=models.CharField(
+                choices=[("EMAIL", "Email"), ("SMS", "SMS")],
+                default="EMAIL",
+                max_length=10,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="outboxmessage",
+            name="recipient_type",
+            field=models.CharField(
+                choices=[
+                    ("PASSENGER", "Passenger"),
+                    ("CONTACT", "Passenger's Emergency Contact"),
+                    ("HELPLINE", "Emergency Helpline"),
+                ],
+                max_length=10,
+            ),
+        ),
+    ]
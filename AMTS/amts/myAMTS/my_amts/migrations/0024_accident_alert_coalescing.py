@@ -0,0 +1,31 @@
+# Generated by Django 5.2.10 on 2026-10-19 17:48
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("my_amts", "0023_outbox_sms_channel"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="accidentnotification",
+            name="alert_count",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="accidentnotification",
+            name="last_reported_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name="accidentnotification",
+            index=models.Index(
+                fields=["bus_number", "last_reported_at"],
+                name="my_amts_acc_bus_num_583b3c_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.10 on 2026-10-19 17:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("my_amts", "0024_accident_alert_coalescing"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="booking",
+            index=models.Index(
+                fields=["bus_number", "booking_date"],
+                name="my_amts_boo_bus_num_b4b547_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.10 on 2026-10-19 17:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("my_amts", "0025_booking_bus_date_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EmergencyAuditRecord",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("bus_number", models.CharField(max_length=10)),
+                ("latitude", models.FloatField()),
+                ("longitude", models.FloatField()),
+                ("alert_count", models.PositiveIntegerField(default=1)),
+                ("affected_passengers", models.PositiveIntegerField(default=0)),
+                ("notifications_sent", models.PositiveIntegerField(default=0)),
+                ("notifications_failed", models.PositiveIntegerField(default=0)),
+                ("failed_recipients", models.JSONField(default=list)),
+                (
+                    "channel_counts",
+                    models.JSONField(
+                        default=dict, help_text="{channel: {status: count}}"
+                    ),
+                ),
+                ("recorded_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "incident",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="audit_records",
+                        to="my_amts.accidentnotification",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Emergency Audit Record",
+                "verbose_name_plural": "Emergency Audit Records",
+                "ordering": ["-recorded_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["bus_number", "recorded_at"],
+                        name="my_amts_eme_bus_num_b657b9_idx",
+                    )
+                ],
+            },
+        ),
+    ]
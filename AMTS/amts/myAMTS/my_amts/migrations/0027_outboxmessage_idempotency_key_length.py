@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-19 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("my_amts", "0026_emergency_audit_record"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="outboxmessage",
+            name="idempotency_key",
+            field=models.CharField(max_length=300, unique=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-19 18:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("my_amts", "0027_outboxmessage_idempotency_key_length"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="buspass",
+            name="processing_started_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.10 on 2026-10-19 18:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def keep_latest_record_per_incident(apps, schema_editor):
+    # Incidents that finished more than once got a record each time; keep the newest
+    EmergencyAuditRecord = apps.get_model("my_amts", "EmergencyAuditRecord")
+    seen = set()
+    stale = []
+    for pk, incident_id in (
+        EmergencyAuditRecord.objects.exclude(incident=None)
+        .order_by("incident_id", "-recorded_at", "-pk")
+        .values_list("pk", "incident_id")
+    ):
+        if incident_id in seen:
+            stale.append(pk)
+        seen.add(incident_id)
+    EmergencyAuditRecord.objects.filter(pk__in=stale).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("my_amts", "0028_buspass_processing_started_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            keep_latest_record_per_incident, migrations.RunPython.noop
+        ),
+        migrations.AlterField(
+            model_name="emergencyauditrecord",
+            name="incident",
+            field=models.OneToOneField(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="audit_record",
+                to="my_amts.accidentnotification",
+            ),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.10 on 2026-10-19 18:26
+
+from django.db import migrations, models
+
+
+def count_earlier_email_attempts(apps, schema_editor):
+    # Passes emailed before attempts were counted have had one try
+    BusPass = apps.get_model("my_amts", "BusPass")
+    BusPass.objects.filter(email_status__in=["SENT", "FAILED"]).update(email_attempts=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("my_amts", "0029_emergencyauditrecord_one_per_incident"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="buspass",
+            name="email_attempts",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="buspass",
+            name="email_status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pending"),
+                    ("SENDING", "Sending"),
+                    ("SENT", "Sent"),
+                    ("FAILED", "Failed"),
+                    ("SKIPPED", "Skipped"),
+                ],
+                default="PENDING",
+                max_length=10,
+            ),
+        ),
+        migrations.RunPython(count_earlier_email_attempts, migrations.RunPython.noop),
+    ]
@@ -2,6 +2,7 @@
 
 from django.db import models
 import qrcode
+import qrcode.image.svg
 from io import BytesIO
 from django.core.files import File
 from PIL import Image, ImageDraw
@@ -11,10 +12,38 @@ import uuid
 from django.utils import timezone
 from datetime import datetime, time
 from django.contrib.auth.models import User
+from django.urls import reverse
+
+# Shared QR settings for every ticket image
+QR_CODE_OPTIONS = {
+    'version': 1,
+    'error_correction': qrcode.constants.ERROR_CORRECT_L,
+    'box_size': 10,
+    'border': 4,
+}
+
+def render_qr_png(data):
+    """Encode data as a QR code and return the PNG bytes"""
+    qr = qrcode.QRCode(**QR_CODE_OPTIONS)
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    qr_image = qr.make_image(fill_color="black", back_color="white")
+    stream = BytesIO()
+    qr_image.save(stream, 'PNG')
+    return stream.getvalue()
+
+def render_qr_svg(data):
+    """Encode data as a QR code and return the SVG document bytes"""
+    qr = qrcode.QRCode(image_factory=qrcode.image.svg.SvgPathImage, **QR_CODE_OPTIONS)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.make_image().to_string()
 
 class Bus(models.Model):
     bus_number = models.CharField(max_length=10, unique=True)
     stops = models.JSONField()
+    capacity = models.PositiveIntegerField(default=60, help_text="Passengers one vehicle can carry")
 
     def __str__(self):
         return self.bus_number
@@ -58,6 +87,9 @@ class ActiveBus(models.Model):
     is_accident = models.BooleanField(default=False, help_text="True if accident/breakdown detected")
     latitude = models.FloatField(null=True, blank=True, help_text="Current latitude position")
     longitude = models.FloatField(null=True, blank=True, help_text="Current longitude position")
+    stop_index = models.PositiveIntegerField(default=0, help_text="Index in bus.stops of the last stop reached")
+    stopped_since = models.DateTimeField(null=True, blank=True, help_text="When telemetry first reported zero speed")
+    is_stalled = models.BooleanField(default=False, help_text="True if stopped away from any stop for too long")
 
     def __str__(self):
         return f"{self.identifier} - {self.current_location}"
@@ -66,6 +98,9 @@ class ActiveBus(models.Model):
         verbose_name = "Active Bus"
         verbose_name_plural = "Active Buses"
         ordering = ['identifier']
+        indexes = [
+            models.Index(fields=['is_active', 'last_updated']),
+        ]
 
 class Booking(models.Model):
     booking_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -76,41 +111,52 @@ class Booking(models.Model):
     booking_date = models.DateTimeField(auto_now_add=True)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
     payment_status = models.CharField(max_length=20, default='COMPLETED')
+    trip = models.ForeignKey('TripInventory', on_delete=models.SET_NULL, null=True, blank=True, related_name='bookings')
 
     def __str__(self):
         return f"Booking {self.booking_id}"
 
     class Meta:
         db_table = 'my_amts_booking'
+        indexes = [
+            models.Index(fields=['user', 'booking_date']),
+            # Today's bookings on a route (accident alerts)
+            models.Index(fields=['bus_number', 'booking_date']),
+        ]
 
 class Ticket(models.Model):
+    QR_STATUSES = [
+        ('PENDING', 'Pending'),
+        ('READY', 'Ready'),
+        ('FAILED', 'Failed'),
+    ]
+
     ticket_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='tickets')
     qr_code = models.ImageField(upload_to='qr_codes/', blank=True)
+    qr_status = models.CharField(max_length=10, choices=QR_STATUSES, default='PENDING', db_index=True)
+
+    def signed_token(self):
+        """Compact Ed25519-signed token conductors can verify without a database lookup"""
+        from .ticket_tokens import sign_ticket_for_booking
+        return sign_ticket_for_booking(self, self.booking)
+
+    def qr_payload(self):
+        return self.signed_token()
+
+    def qr_filename(self):
+        return f'qr_code_{self.ticket_id}.png'
 
     def generate_qr_code(self):
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(f"Ticket ID: {self.ticket_id}\n"
-                   f"Bus: {self.booking.bus_number}\nFrom: {self.booking.from_stop}\n"
-                   f"To: {self.booking.to_stop}\n"
-                   f'Valid until : {self.booking.booking_date}')
-        qr.make(fit=True)
-
-        qr_image = qr.make_image(fill_color="black", back_color="white")
-        stream = BytesIO()
-        qr_image.save(stream, 'PNG')
-        filename = f'qr_code_{self.ticket_id}.png'
-        self.qr_code.save(filename, File(stream), save=False)
-
-    def save(self, *args, **kwargs):
-        if not self.qr_code:
-            self.generate_qr_code()
-        super().save(*args, **kwargs)
+        stream = BytesIO(render_qr_png(self.qr_payload()))
+        self.qr_code.save(self.qr_filename(), File(stream), save=False)
+
+    @property
+    def qr_image_url(self):
+        """Stored PNG if one was written, otherwise the on-demand rendering endpoint"""
+        if self.qr_code:
+            return self.qr_code.url
+        return reverse('ticket_qr', args=[self.ticket_id, 'png'])
 
     def __str__(self):
         return f"Ticket {self.ticket_id}"
@@ -118,6 +164,39 @@ class Ticket(models.Model):
     class Meta:
         db_table = 'my_amts_ticket'
 
+class RevokedTicket(models.Model):
+    ticket_id = models.UUIDField(primary_key=True)
+    reason = models.CharField(max_length=50, default='REFUND')
+    revoked_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Revoked {self.ticket_id}"
+
+    class Meta:
+        verbose_name = "Revoked Ticket"
+        verbose_name_plural = "Revoked Tickets"
+
+class VerificationBundle(models.Model):
+    """
+    Offline verification data for conductors on one route for one service day.
+    revoked_entries maps a revoked ticket's 64-bit ID prefix (hex) to the bundle
+    version it was added in, so devices can fetch only what changed since their copy.
+    """
+    bus_number = models.CharField(max_length=10)
+    service_date = models.DateField()
+    version = models.PositiveIntegerField(default=0)
+    revoked_entries = models.JSONField(default=dict)
+    revoked_through = models.DateTimeField(null=True, blank=True, help_text="High-water mark of RevokedTicket.revoked_at")
+    generated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Bundle {self.bus_number} {self.service_date} v{self.version}"
+
+    class Meta:
+        verbose_name = "Verification Bundle"
+        verbose_name_plural = "Verification Bundles"
+        unique_together = [('bus_number', 'service_date')]
+
 class SearchHistory(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     from_stop = models.CharField(max_length=100)
@@ -136,6 +215,21 @@ class BusPass(models.Model):
         ('MONTHLY', 'Monthly Pass'),
         ('STUDENT', 'Student Pass'),
     ]
+
+    PDF_STATUSES = [
+        ('PENDING', 'Pending'),
+        ('PROCESSING', 'Processing'),
+        ('READY', 'Ready'),
+        ('FAILED', 'Failed'),
+    ]
+
+    EMAIL_STATUSES = [
+        ('PENDING', 'Pending'),
+        ('SENDING', 'Sending'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+        ('SKIPPED', 'Skipped'),
+    ]
     
     GENDER_CHOICES = [
         ('M', 'Male'),
@@ -178,6 +272,14 @@ class BusPass(models.Model):
     application_date = models.DateTimeField(auto_now_add=True)
     is_approved = models.BooleanField(default=False)
     pdf_file = models.FileField(upload_to='pass_pdfs/', blank=True, null=True)
+
+    # Background PDF / email pipeline
+    pdf_status = models.CharField(max_length=10, choices=PDF_STATUSES, default='PENDING', db_index=True)
+    email_status = models.CharField(max_length=10, choices=EMAIL_STATUSES, default='PENDING')
+    email_attempts = models.PositiveSmallIntegerField(default=0)
+    processing_error = models.TextField(blank=True)
+    processing_started_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
     
     def __str__(self):
         return f"{self.get_pass_type_display()} - {self.full_name}"
@@ -185,4 +287,225 @@ class BusPass(models.Model):
     class Meta:
         verbose_name = "Bus Pass"
         verbose_name_plural = "Bus Passes"
-        ordering = ['-application_date']
\ No newline at end of file
+        ordering = ['-application_date']
+        indexes = [
+            # Loading the passes valid today for conductor checks
+            models.Index(fields=['end_date', 'is_approved'], name='buspass_end_date_idx'),
+        ]
+
+class HeadwayAlert(models.Model):
+    ALERT_TYPES = [
+        ('BUNCHING', 'Bus Bunching'),
+        ('GAP', 'Long Gap'),
+    ]
+
+    bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='headway_alerts')
+    direction = models.CharField(max_length=1, choices=[('F', 'Forward'), ('R', 'Reverse')])
+    alert_type = models.CharField(max_length=10, choices=ALERT_TYPES)
+    leading_bus = models.CharField(max_length=20, help_text="Identifier of the ActiveBus ahead")
+    following_bus = models.CharField(max_length=20, help_text="Identifier of the ActiveBus behind")
+    gap_km = models.FloatField()
+    headway_minutes = models.FloatField()
+    detected_at = models.DateTimeField(auto_now_add=True)
+    is_resolved = models.BooleanField(default=False)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_alert_type_display()} on {self.bus.bus_number}: {self.following_bus} → {self.leading_bus}"
+
+    class Meta:
+        verbose_name = "Headway Alert"
+        verbose_name_plural = "Headway Alerts"
+        ordering = ['-detected_at']
+        indexes = [
+            models.Index(fields=['is_resolved', 'detected_at']),
+        ]
+
+class RidershipRollup(models.Model):
+    """
+    Bookings, tickets and revenue per route and origin/destination pair, bucketed
+    by local day or hour. Maintained incrementally by ridership.update_rollups.
+    """
+    GRANULARITIES = [
+        ('DAY', 'Daily'),
+        ('HOUR', 'Hourly'),
+    ]
+
+    granularity = models.CharField(max_length=4, choices=GRANULARITIES)
+    period_start = models.DateTimeField()
+    bus_number = models.CharField(max_length=10)
+    from_stop = models.CharField(max_length=100)
+    to_stop = models.CharField(max_length=100)
+    bookings = models.PositiveIntegerField(default=0)
+    tickets = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.granularity} {self.period_start:%Y-%m-%d %H:%M} {self.bus_number} {self.from_stop} → {self.to_stop}"
+
+    class Meta:
+        verbose_name = "Ridership Rollup"
+        verbose_name_plural = "Ridership Rollups"
+        unique_together = [('granularity', 'period_start', 'bus_number', 'from_stop', 'to_stop')]
+        indexes = [
+            models.Index(fields=['granularity', 'bus_number', 'period_start']),
+        ]
+
+class RollupWatermark(models.Model):
+    """Position (booking_date, booking_id) of the last booking folded into the rollups"""
+    name = models.CharField(max_length=50, unique=True)
+    last_booking_date = models.DateTimeField(null=True, blank=True)
+    last_booking_id = models.UUIDField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_booking_date}"
+
+class TripInventory(models.Model):
+    """
+    Seats sold on one departure of a route. seats_booked is only changed with
+    conditional F() updates (see seat_inventory), so concurrent bookings can
+    never push it past capacity.
+    """
+    bus_number = models.CharField(max_length=10)
+    departure = models.DateTimeField(help_text="Start of the departure slot")
+    capacity = models.PositiveIntegerField()
+    seats_booked = models.PositiveIntegerField(default=0)
+
+    @property
+    def seats_available(self):
+        return max(self.capacity - self.seats_booked, 0)
+
+    def __str__(self):
+        return f"{self.bus_number} {self.departure:%Y-%m-%d %H:%M} ({self.seats_booked}/{self.capacity})"
+
+    class Meta:
+        verbose_name = "Trip Inventory"
+        verbose_name_plural = "Trip Inventories"
+        unique_together = [('bus_number', 'departure')]
+
+class EmergencyContact(models.Model):
+    """Someone to text if the user's bus is in an accident"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='emergency_contacts')
+    name = models.CharField(max_length=200)
+    phone_number = models.CharField(max_length=15)
+    relationship = models.CharField(max_length=50, blank=True)
+    is_primary = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.phone_number}) for {self.user.username}"
+
+    class Meta:
+        verbose_name = "Emergency Contact"
+        verbose_name_plural = "Emergency Contacts"
+        ordering = ['-is_primary', 'name']
+
+class AccidentNotification(models.Model):
+    """An accident incident; its notifications are delivered through OutboxMessage rows"""
+    notification_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    bus_number = models.CharField(max_length=10)
+    route_name = models.CharField(max_length=200)
+    accident_location = models.CharField(max_length=200)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    timestamp = models.DateTimeField(auto_now_add=True)
+    total_notifications_sent = models.IntegerField(default=0)
+    notification_details = models.JSONField(default=list)
+    # Repeat alerts for the same bus within the coalescing window attach here
+    alert_count = models.PositiveIntegerField(default=1)
+    last_reported_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Accident on bus {self.bus_number} at {self.timestamp:%Y-%m-%d %H:%M}"
+
+    class Meta:
+        verbose_name = "Accident Notification"
+        verbose_name_plural = "Accident Notifications"
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['bus_number', 'last_reported_at']),
+        ]
+
+class OutboxMessage(models.Model):
+    """
+    One notification to one recipient, written in the same transaction as its
+    incident and delivered later by notification_outbox workers.
+    idempotency_key stops a recipient being queued twice for an incident.
+    """
+    CHANNELS = [
+        ('EMAIL', 'Email'),
+        ('SMS', 'SMS'),
+    ]
+
+    RECIPIENT_TYPES = [
+        ('PASSENGER', 'Passenger'),
+        ('CONTACT', "Passenger's Emergency Contact"),
+        ('HELPLINE', 'Emergency Helpline'),
+    ]
+
+    STATUSES = [
+        ('PENDING', 'Pending'),
+        ('SENDING', 'Sending'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+    ]
+
+    incident = models.ForeignKey(AccidentNotification, on_delete=models.CASCADE, related_name='messages')
+    channel = models.CharField(max_length=10, choices=CHANNELS, default='EMAIL')
+    recipient_type = models.CharField(max_length=10, choices=RECIPIENT_TYPES)
+    recipient = models.CharField(max_length=254)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    idempotency_key = models.CharField(max_length=300, unique=True)  # incident UUID + channel + recipient (254)
+
+    status = models.CharField(max_length=10, choices=STATUSES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=36, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def message_id(self):
+        # Stable across retries so mail servers can drop a duplicate if a send
+        # succeeded but its result was never recorded
+        return f'<outbox-{self.pk}.{self.incident_id}@amts>' if self.pk else None
+
+    def __str__(self):
+        return f"{self.channel} to {self.recipient} ({self.status})"
+
+    class Meta:
+        verbose_name = "Outbox Message"
+        verbose_name_plural = "Outbox Messages"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+class EmergencyAuditRecord(models.Model):
+    """Outcome of one accident incident, for the audit trail (alongside the JSON-lines log)"""
+    incident = models.OneToOneField(AccidentNotification, on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='audit_record')
+    bus_number = models.CharField(max_length=10)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    alert_count = models.PositiveIntegerField(default=1)
+    affected_passengers = models.PositiveIntegerField(default=0)
+    notifications_sent = models.PositiveIntegerField(default=0)
+    notifications_failed = models.PositiveIntegerField(default=0)
+    failed_recipients = models.JSONField(default=list)
+    channel_counts = models.JSONField(default=dict, help_text="{channel: {status: count}}")
+    recorded_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Audit: bus {self.bus_number} at {self.recorded_at:%Y-%m-%d %H:%M} ({self.notifications_sent} sent)"
+
+    class Meta:
+        verbose_name = "Emergency Audit Record"
+        verbose_name_plural = "Emergency Audit Records"
+        ordering = ['-recorded_at']
+        indexes = [
+            models.Index(fields=['bus_number', 'recorded_at']),
+        ]
@@ -0,0 +1,207 @@
+# my_amts/notification_fanout.py
+
+import asyncio
+import logging
+import time
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils.module_loading import import_string
+from .mail_dispatch import RateLimiter, get_email_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+
+class ConsoleSMSBackend:
+    """Writes SMS to the log instead of sending them (localhost default)"""
+
+    async def send(self, phone_number, text):
+        logger.info(f"SMS to {phone_number}: {text}")
+
+
+class LocMemSMSBackend:
+    """
+    Keeps sent SMS in LocMemSMSBackend.outbox, like Django's locmem email
+    backend. SMS_FAKE_LATENCY_MS simulates a gateway round trip, and numbers in
+    SMS_FAKE_FAILING_NUMBERS are rejected, for testing retries and fan-out timing.
+    """
+    outbox = []
+
+    def __init__(self, latency_ms=None):
+        self.latency_ms = getattr(settings, 'SMS_FAKE_LATENCY_MS', 0) if latency_ms is None else latency_ms
+
+    async def send(self, phone_number, text):
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        if phone_number in getattr(settings, 'SMS_FAKE_FAILING_NUMBERS', []):
+            raise RuntimeError(f'Gateway rejected {phone_number}')
+        self.outbox.append((phone_number, text))
+
+
+SMS_BACKENDS = {
+    'console': ConsoleSMSBackend,
+    'locmem': LocMemSMSBackend,
+}
+
+
+def get_sms_backend(name=None):
+    """SMS backend by alias ('console', 'locmem') or dotted path to a class with an async send()"""
+    name = name or getattr(settings, 'SMS_BACKEND', 'console')
+    backend_class = SMS_BACKENDS.get(name) or import_string(name)
+    return backend_class()
+
+
+class EmailChannel:
+    """
+    Sends email over a pool of `concurrency` connections to the configured
+    EMAIL_BACKEND. Django's mail backends are blocking, so each send runs in a
+    thread; a connection is only used by one send at a time and stays open
+    between messages.
+    """
+    name = 'EMAIL'
+
+    def __init__(self, concurrency=None, rate_limiter=None, backend=None):
+        self.concurrency = concurrency or getattr(settings, 'OUTBOX_WORKERS', 4)
+        self.rate_limiter = rate_limiter or get_email_rate_limiter()
+        self.backend = backend
+        self._connections = None
+
+    async def open(self):
+        self._connections = asyncio.Queue()
+        for _ in range(self.concurrency):
+            self._connections.put_nowait(get_connection(self.backend, fail_silently=False))
+
+    @staticmethod
+    def _send(connection, email):
+        try:
+            connection.open()
+            if not connection.send_messages([email]):
+                raise RuntimeError('Message was not accepted')
+        except Exception:
+            # Drop a possibly broken session; the next send reopens it
+            try:
+                connection.close()
+            except Exception:
+                pass
+            raise
+
+    async def send(self, message):
+        headers = {'Message-ID': message.message_id} if message.message_id else None
+        email = EmailMessage(message.subject, message.body, settings.DEFAULT_FROM_EMAIL,
+                             [message.recipient], headers=headers)
+        connection = await self._connections.get()
+        try:
+            await asyncio.to_thread(self._send, connection, email)
+        finally:
+            self._connections.put_nowait(connection)
+
+    async def close(self):
+        while not self._connections.empty():
+            connection = self._connections.get_nowait()
+            try:
+                await asyncio.to_thread(connection.close)
+            except Exception:
+                pass
+
+
+class SMSChannel:
+    """Sends the message body as an SMS through the SMS_BACKEND"""
+    name = 'SMS'
+
+    def __init__(self, concurrency=None, rate_limiter=None, backend=None):
+        self.concurrency = concurrency or getattr(settings, 'SMS_CONCURRENCY', 8)
+        self.rate_limiter = rate_limiter or RateLimiter(
+            getattr(settings, 'SMS_RATE', 20),
+            getattr(settings, 'SMS_BURST', 20)
+        )
+        self.backend = backend or get_sms_backend()
+
+    async def open(self):
+        pass
+
+    async def send(self, message):
+        await self.backend.send(message.recipient, message.body)
+
+    async def close(self):
+        pass
+
+
+def get_channels(workers=None):
+    return {'EMAIL': EmailChannel(concurrency=workers), 'SMS': SMSChannel()}
+
+
+async def _send_channel(channel, messages, started):
+    """Send one channel's messages, at most channel.concurrency at a time, under its rate limit"""
+    semaphore = asyncio.Semaphore(channel.concurrency)
+
+    async def send_one(message):
+        async with semaphore:
+            await channel.rate_limiter.acquire_async()
+            try:
+                await channel.send(message)
+                error = None
+            except Exception as e:
+                error = str(e) or e.__class__.__name__
+                logger.error(f"Failed to send {channel.name} to {message.recipient}: {error}")
+            return error, time.perf_counter() - started
+
+    await channel.open()
+    try:
+        return await asyncio.gather(*(send_one(message) for message in messages))
+    finally:
+        await channel.close()
+
+
+async def fan_out_async(messages, channels):
+    started = time.perf_counter()
+    by_channel = {}
+    for index, message in enumerate(messages):
+        by_channel.setdefault(message.channel, []).append(index)
+
+    async def run(channel_name, indexes):
+        channel = channels.get(channel_name)
+        if channel is None:
+            return channel_name, indexes, [(f'No {channel_name} channel configured', 0.0)] * len(indexes)
+        outcomes = await _send_channel(channel, [messages[i] for i in indexes], started)
+        return channel_name, indexes, outcomes
+
+    # Every channel runs at once; each one's limits only apply to itself
+    results = await asyncio.gather(*(run(name, indexes) for name, indexes in by_channel.items()))
+    return results, time.perf_counter() - started
+
+
+def fan_out(messages, channels=None, workers=None):
+    """
+    Deliver messages (anything with channel, recipient, subject, body and
+    message_id, e.g. OutboxMessage) on all channels concurrently.
+    Returns an aggregate result: 'errors' holds an error (None if sent) per
+    message in order; 'channels' has sent/failed counts and latencies (seconds
+    from the start of the fan-out until each message was done) per channel;
+    'within_budget' compares the slowest message to NOTIFICATION_LATENCY_BUDGET_SECONDS.
+    """
+    if not messages:
+        return {'errors': [], 'channels': {}, 'elapsed': 0.0, 'within_budget': True}
+
+    channels = channels or get_channels(workers)
+    results, elapsed = asyncio.run(fan_out_async(messages, channels))
+
+    errors = [None] * len(messages)
+    summary = {}
+    for channel_name, indexes, outcomes in results:
+        latencies = sorted(latency for _, latency in outcomes)
+        for index, (error, _) in zip(indexes, outcomes):
+            errors[index] = error
+        failed = sum(1 for error, _ in outcomes if error)
+        summary[channel_name] = {
+            'sent': len(outcomes) - failed,
+            'failed': failed,
+            'p95_latency': round(latencies[int(0.95 * (len(latencies) - 1))], 3),
+            'max_latency': round(latencies[-1], 3)
+        }
+
+    budget = getattr(settings, 'NOTIFICATION_LATENCY_BUDGET_SECONDS', 30)
+    return {
+        'errors': errors,
+        'channels': summary,
+        'elapsed': round(elapsed, 3),
+        'within_budget': elapsed <= budget
+    }
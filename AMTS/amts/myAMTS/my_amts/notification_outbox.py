@@ -0,0 +1,317 @@
+# my_amts/notification_outbox.py
+
+import logging
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+from .background import run_in_background, run_later
+from .models import AccidentNotification, EmergencyAuditRecord, OutboxMessage
+from .notification_fanout import fan_out
+
+logger = logging.getLogger(__name__)
+
+QUEUE_CHUNK_SIZE = 500
+
+
+class IncidentLockTimeout(Exception):
+    """Raised when another alert for the same bus holds the accident lock for too long"""
+
+
+def idempotency_key(incident_id, channel, recipient):
+    return f'{incident_id}:{channel}:{recipient.strip().lower()}'
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter: ~base, 2*base, 4*base ... capped at OUTBOX_RETRY_MAX_SECONDS"""
+    base = getattr(settings, 'OUTBOX_RETRY_BASE_SECONDS', 2)
+    cap = getattr(settings, 'OUTBOX_RETRY_MAX_SECONDS', 300)
+    delay = min(base * 2 ** max(attempts - 1, 0), cap)
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def message_content(alert, channel, recipient_type):
+    """(subject, body) of a notification; SMS recipients get the short text"""
+    if channel == 'SMS':
+        return alert['passenger_subject'], alert['sms_message']
+    if recipient_type == 'HELPLINE':
+        return alert['helpline_subject'], alert['helpline_message']
+    return alert['passenger_subject'], alert['passenger_message']
+
+
+@contextmanager
+def incident_lock(bus_number):
+    """
+    Serialise alert handling for one bus across requests and processes with a
+    lock in the shared database cache (cache.add only succeeds for one caller).
+    If the lock can't be had within ACCIDENT_LOCK_WAIT_SECONDS, IncidentLockTimeout
+    is raised: going ahead unlocked could open a second incident for the bus and
+    queue a full duplicate set of notifications, so the caller must retry instead.
+    """
+    key = f'accident-lock:{bus_number}'
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + getattr(settings, 'ACCIDENT_LOCK_WAIT_SECONDS', 10)
+    timeout = getattr(settings, 'ACCIDENT_LOCK_TIMEOUT_SECONDS', 30)
+
+    acquired = cache.add(key, token, timeout)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(0.05)
+        acquired = cache.add(key, token, timeout)
+    if not acquired:
+        logger.warning(f"Timed out waiting for the accident lock on bus {bus_number}")
+        raise IncidentLockTimeout(f"Another alert for bus {bus_number} is still being processed")
+
+    try:
+        yield
+    finally:
+        if cache.get(key) == token:
+            cache.delete(key)
+
+
+def queue_incident(bus_number, latitude, longitude, accident_location, alert, recipients):
+    """
+    Record an accident and queue one outbox message per recipient in a single
+    transaction, then hand delivery to the background runner once it commits.
+    recipients is an iterable of (channel, recipient_type, address); email
+    recipients get the passenger or helpline email and SMS recipients the short
+    SMS text. recipients may be a generator; rows are inserted in chunks of
+    QUEUE_CHUNK_SIZE as it is consumed. Nothing is sent in the request.
+
+    Repeat alerts for a bus (double clicks, driver and admin both reporting)
+    within ACCIDENT_COALESCE_WINDOW_SECONDS of its last report attach to the
+    open incident instead of starting a new one, and only recipients that
+    incident hasn't already queued are notified.
+    Returns (incident, {channel: queued_count}, coalesced).
+    """
+    window = timedelta(seconds=getattr(settings, 'ACCIDENT_COALESCE_WINDOW_SECONDS', 900))
+
+    with incident_lock(bus_number), transaction.atomic():
+        now = timezone.now()
+        incident = AccidentNotification.objects.filter(
+            bus_number=bus_number,
+            last_reported_at__gte=now - window
+        ).order_by('-last_reported_at').first()
+
+        coalesced = incident is not None
+        if coalesced:
+            incident.alert_count += 1
+            incident.last_reported_at = now
+            incident.save(update_fields=['alert_count', 'last_reported_at'])
+        else:
+            incident = AccidentNotification.objects.create(
+                bus_number=bus_number,
+                route_name=alert['route_name'][:200],
+                accident_location=(accident_location or alert['location_str'])[:200],
+                latitude=float(latitude),
+                longitude=float(longitude),
+                last_reported_at=now
+            )
+
+        # Recipients may be a lazy stream; insert them a chunk at a time
+        queued = {}
+        seen = set()
+        chunk = {}
+        for channel, recipient_type, recipient in recipients:
+            key = idempotency_key(incident.pk, channel, recipient)
+            if key in seen:
+                continue
+            seen.add(key)
+            subject, body = message_content(alert, channel, recipient_type)
+            chunk[key] = OutboxMessage(
+                incident=incident,
+                channel=channel,
+                recipient_type=recipient_type,
+                recipient=recipient,
+                subject=subject[:255],
+                body=body,
+                idempotency_key=key
+            )
+            if len(chunk) >= QUEUE_CHUNK_SIZE:
+                _queue_messages(chunk, coalesced, queued)
+                chunk = {}
+        _queue_messages(chunk, coalesced, queued)
+
+        if queued:
+            run_in_background(deliver_incident, incident.pk)
+
+    return incident, queued, coalesced
+
+
+def _queue_messages(messages, skip_existing, queued):
+    """Bulk insert one chunk of {idempotency_key: OutboxMessage}, adding to the per-channel counts in queued"""
+    if skip_existing:
+        already_queued = set(
+            OutboxMessage.objects.filter(idempotency_key__in=list(messages)).values_list('idempotency_key', flat=True)
+        )
+        messages = {key: message for key, message in messages.items() if key not in already_queued}
+    if not messages:
+        return
+
+    OutboxMessage.objects.bulk_create(messages.values(), ignore_conflicts=True)
+    for message in messages.values():
+        queued[message.channel] = queued.get(message.channel, 0) + 1
+
+
+def claim_messages(batch_size=100, incident_id=None):
+    """
+    Claim due messages for this worker. The PENDING -> SENDING update only
+    matches rows nobody else has claimed, and the random token tells us which
+    rows we won, so concurrent workers never send the same message.
+    """
+    now = timezone.now()
+    due = OutboxMessage.objects.filter(status='PENDING', next_attempt_at__lte=now)
+    if incident_id is not None:
+        due = due.filter(incident_id=incident_id)
+    ids = list(due.order_by('next_attempt_at', 'id').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return []
+
+    token = uuid.uuid4().hex
+    OutboxMessage.objects.filter(id__in=ids, status='PENDING').update(
+        status='SENDING', locked_by=token, locked_at=now
+    )
+    return list(OutboxMessage.objects.filter(locked_by=token, status='SENDING'))
+
+
+def deliver_messages(messages, workers=None):
+    """Send claimed messages on every channel concurrently and record each one's outcome"""
+    max_attempts = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5)
+    result = fan_out(messages, workers=workers)
+    errors = result['errors']
+    logger.info(
+        f"Delivered {errors.count(None)}/{len(messages)} notifications in {result['elapsed']}s: {result['channels']}"
+    )
+
+    now = timezone.now()
+    for message, error in zip(messages, errors):
+        message.attempts += 1
+        message.locked_by = ''
+        message.locked_at = None
+        if error is None:
+            message.status = 'SENT'
+            message.sent_at = now
+            message.last_error = ''
+        else:
+            message.last_error = error
+            if message.attempts >= max_attempts:
+                message.status = 'FAILED'
+            else:
+                message.status = 'PENDING'
+                message.next_attempt_at = now + retry_delay(message.attempts)
+
+    OutboxMessage.objects.bulk_update(
+        messages, ['status', 'attempts', 'next_attempt_at', 'locked_by', 'locked_at', 'last_error', 'sent_at']
+    )
+    update_incident_totals({message.incident_id for message in messages})
+    return errors.count(None)
+
+
+def update_incident_totals(incident_ids):
+    """
+    Refresh the sent count on each incident. Once an incident has nothing left
+    to send, its per-recipient outcome is stored in notification_details, and
+    the incidents finished in this batch get their audit records in one upsert.
+    """
+    from .emergency_notifications import record_emergency_audits
+
+    totals = dict(
+        OutboxMessage.objects.filter(incident_id__in=incident_ids, status='SENT')
+        .values_list('incident_id').annotate(sent=Count('id'))
+    )
+    unfinished = set(
+        OutboxMessage.objects.filter(incident_id__in=incident_ids, status__in=['PENDING', 'SENDING'])
+        .values_list('incident_id', flat=True).distinct()
+    )
+
+    audit_records = []
+    for incident in AccidentNotification.objects.filter(pk__in=incident_ids):
+        incident.total_notifications_sent = totals.get(incident.pk, 0)
+        if incident.pk in unfinished:
+            incident.save(update_fields=['total_notifications_sent'])
+            continue
+
+        incident.notification_details = list(
+            incident.messages.order_by('id').values(
+                'recipient', 'recipient_type', 'channel', 'status', 'attempts', 'last_error'
+            )
+        )
+        incident.save(update_fields=['total_notifications_sent', 'notification_details'])
+
+        channel_counts = {}
+        for detail in incident.notification_details:
+            counts = channel_counts.setdefault(detail['channel'], {})
+            counts[detail['status']] = counts.get(detail['status'], 0) + 1
+        failed = [detail['recipient'] for detail in incident.notification_details if detail['status'] == 'FAILED']
+        audit_records.append(EmergencyAuditRecord(
+            incident=incident,
+            bus_number=incident.bus_number,
+            latitude=incident.latitude,
+            longitude=incident.longitude,
+            alert_count=incident.alert_count,
+            affected_passengers=sum(
+                1 for detail in incident.notification_details if detail['recipient_type'] == 'PASSENGER'
+            ),
+            notifications_sent=incident.total_notifications_sent,
+            notifications_failed=len(failed),
+            failed_recipients=failed,
+            channel_counts=channel_counts
+        ))
+
+    if audit_records:
+        record_emergency_audits(audit_records)
+
+
+def requeue_stale_messages():
+    """Return messages stuck in SENDING (their worker died) to the queue"""
+    lease = timedelta(seconds=getattr(settings, 'OUTBOX_LEASE_SECONDS', 300))
+    return OutboxMessage.objects.filter(status='SENDING', locked_at__lt=timezone.now() - lease).update(
+        status='PENDING', locked_by='', locked_at=None
+    )
+
+
+def requeue_failed_messages():
+    """Give permanently failed messages a fresh set of attempts"""
+    return OutboxMessage.objects.filter(status='FAILED').update(
+        status='PENDING', attempts=0, next_attempt_at=timezone.now()
+    )
+
+
+def process_outbox(batch_size=100, workers=None, incident_id=None):
+    """
+    Deliver the next batch of due messages (used by the process_notifications worker).
+    Returns how many messages were picked up, including ones that failed.
+    """
+    requeue_stale_messages()
+    messages = claim_messages(batch_size, incident_id)
+    if messages:
+        deliver_messages(messages, workers)
+    return len(messages)
+
+
+def deliver_incident(incident_id):
+    """
+    Background task queued by queue_incident: deliver an incident's due messages
+    once. If retries are pending it schedules itself again for the earliest one
+    instead of sleeping through the backoff (in 'sync' and 'worker' mode the
+    retries are left to the process_notifications worker).
+    """
+    while process_outbox(incident_id=incident_id):
+        pass
+
+    next_attempt = OutboxMessage.objects.filter(
+        incident_id=incident_id, status='PENDING'
+    ).aggregate(next_attempt=Min('next_attempt_at'))['next_attempt']
+    if next_attempt is not None:
+        run_later(max((next_attempt - timezone.now()).total_seconds(), 0.1), deliver_incident, incident_id)
+
+
+def incident_status(incident):
+    """Delivery counts for an incident, by status"""
+    counts = dict(incident.messages.values_list('status').annotate(total=Count('id')))
+    return {status: counts.get(status, 0) for status, _ in OutboxMessage.STATUSES}
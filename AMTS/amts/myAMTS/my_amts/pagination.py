@@ -0,0 +1,48 @@
+# my_amts/pagination.py
+
+import base64
+import uuid
+from datetime import datetime
+from django.db.models import Q
+
+BOOKINGS_PER_PAGE = 20
+
+
+def encode_cursor(booking):
+    raw = f'{booking.booking_date.isoformat()}|{booking.booking_id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (booking_date, booking_id) from a cursor, or None if it is missing or invalid"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        booking_date, booking_id = raw.split('|')
+        return datetime.fromisoformat(booking_date), uuid.UUID(booking_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def keyset_page(bookings, cursor=None, page_size=BOOKINGS_PER_PAGE):
+    """
+    Newest-first page of bookings after the given cursor.
+    Seeks on (booking_date, booking_id) instead of using OFFSET, so every page
+    is an index range scan no matter how far back the user pages; booking_id
+    breaks ties between bookings created in the same instant.
+    Returns (bookings, next_cursor); next_cursor is None on the last page.
+    """
+    bookings = bookings.order_by('-booking_date', '-booking_id')
+    position = decode_cursor(cursor)
+    if position is not None:
+        booking_date, booking_id = position
+        bookings = bookings.filter(
+            Q(booking_date__lt=booking_date) |
+            Q(booking_date=booking_date, booking_id__lt=booking_id)
+        )
+
+    # One extra row tells us whether there is another page without a COUNT
+    page = list(bookings[:page_size + 1])
+    next_cursor = encode_cursor(page[page_size - 1]) if len(page) > page_size else None
+    return page[:page_size], next_cursor
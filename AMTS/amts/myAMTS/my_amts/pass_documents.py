@@ -0,0 +1,335 @@
+# my_amts/pass_documents.py
+
+import logging
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from .background import run_in_background
+from .models import BusPass
+
+logger = logging.getLogger(__name__)
+
+
+def generate_bus_pass_pdf(bus_pass):
+    """Generate PDF for bus pass"""
+    import os
+    from django.conf import settings
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.units import inch
+    
+    # Create PDF file path
+    filename = f"bus_pass_{bus_pass.pass_id}.pdf"
+    filepath = os.path.join(settings.MEDIA_ROOT, 'pass_pdfs', filename)
+    
+    # Ensure directory exists
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    
+    # Create PDF in a temporary file so readers never see a half-written pass
+    temp_path = f"{filepath}.{os.getpid()}.tmp"
+    c = canvas.Canvas(temp_path, pagesize=A4)
+    width, height = A4
+    
+    # Header
+    c.setFillColorRGB(0.1, 0.14, 0.49)  # AMTS Blue
+    c.rect(0, height - 2*inch, width, 2*inch, fill=True)
+    
+    c.setFillColorRGB(1, 1, 1)  # White text
+    c.setFont("Helvetica-Bold", 24)
+    c.drawCentredString(width/2, height - 1*inch, "AHMEDABAD MUNICIPAL")
+    c.drawCentredString(width/2, height - 1.4*inch, "TRANSPORT SERVICE (AMTS)")
+    
+    c.setFont("Helvetica-Bold", 18)
+    c.drawCentredString(width/2, height - 1.8*inch, bus_pass.get_pass_type_display().upper())
+    
+    # Pass Details Box
+    y = height - 3*inch
+    c.setFillColorRGB(0, 0, 0)
+    c.setFont("Helvetica-Bold", 12)
+    
+    # Personal Information
+    c.drawString(1*inch, y, "PERSONAL INFORMATION")
+    y -= 0.3*inch
+    c.setFont("Helvetica", 10)
+    
+    c.drawString(1*inch, y, f"Pass ID: {bus_pass.pass_id}")
+    y -= 0.25*inch
+    c.drawString(1*inch, y, f"Full Name: {bus_pass.full_name}")
+    y -= 0.25*inch
+    c.drawString(1*inch, y, f"Date of Birth: {bus_pass.date_of_birth.strftime('%d/%m/%Y')}")
+    y -= 0.25*inch
+    c.drawString(1*inch, y, f"Gender: {bus_pass.get_gender_display()}")
+    y -= 0.25*inch
+    c.drawString(1*inch, y, f"Phone: {bus_pass.phone_number}")
+    y -= 0.25*inch
+    c.drawString(1*inch, y, f"Email: {bus_pass.email}")
+    y -= 0.25*inch
+    c.drawString(1*inch, y, f"Address: {bus_pass.address}")
+    
+    # Route Information
+    y -= 0.5*inch
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(1*inch, y, "ROUTE INFORMATION")
+    y -= 0.3*inch
+    c.setFont("Helvetica", 10)
+    
+    c.drawString(1*inch, y, f"From: {bus_pass.from_stop}")
+    y -= 0.25*inch
+    c.drawString(1*inch, y, f"To: {bus_pass.to_stop}")
+    y -= 0.25*inch
+    c.drawString(1*inch, y, f"Route Number: {bus_pass.route_number}")
+    
+    # Student Information (if applicable)
+    if bus_pass.pass_type == 'STUDENT':
+        y -= 0.5*inch
+        c.setFont("Helvetica-Bold", 12)
+        c.drawString(1*inch, y, "STUDENT INFORMATION")
+        y -= 0.3*inch
+        c.setFont("Helvetica", 10)
+        
+        c.drawString(1*inch, y, f"Institution: {bus_pass.school_college_name}")
+        y -= 0.25*inch
+        c.drawString(1*inch, y, f"Student ID: {bus_pass.student_id}")
+        y -= 0.25*inch
+        c.drawString(1*inch, y, f"Class/Year: {bus_pass.class_year}")
+    
+    # Validity
+    y -= 0.5*inch
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(1*inch, y, "VALIDITY")
+    y -= 0.3*inch
+    c.setFont("Helvetica", 10)
+    
+    c.drawString(1*inch, y, f"Valid From: {bus_pass.start_date.strftime('%d/%m/%Y')}")
+    y -= 0.25*inch
+    c.drawString(1*inch, y, f"Valid Until: {bus_pass.end_date.strftime('%d/%m/%Y')}")
+    
+    # Footer
+    c.setFont("Helvetica-Oblique", 8)
+    c.drawCentredString(width/2, 1*inch, "This is a computer-generated pass. No signature required.")
+    c.drawCentredString(width/2, 0.7*inch, f"Generated on: {datetime.now().strftime('%d/%m/%Y %I:%M %p')}")
+    
+    # Border
+    c.setStrokeColorRGB(0.1, 0.14, 0.49)
+    c.setLineWidth(2)
+    c.rect(0.5*inch, 0.5*inch, width - 1*inch, height - 1*inch)
+    
+    try:
+        c.save()
+        os.replace(temp_path, filepath)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    
+    return f"pass_pdfs/{filename}"
+
+
+def send_bus_pass_email(bus_pass, email_address, pdf_path):
+    """Send bus pass PDF via email"""
+    try:
+        from django.core.mail import EmailMessage
+        from django.conf import settings
+        import os
+        
+        # Email subject and content
+        subject = f"🚌 Your AMTS {bus_pass.get_pass_type_display()} Pass - Ready for Use!"
+        
+        message = f"""
+Dear {bus_pass.full_name},
+
+🎉 Congratulations! Your AMTS {bus_pass.get_pass_type_display()} Pass has been successfully generated and is ready for use.
+
+📋 Pass Details:
+• Pass ID: {bus_pass.pass_id}
+• Type: {bus_pass.get_pass_type_display()}
+• Route: {bus_pass.from_stop} ↔ {bus_pass.to_stop}
+• Route Number: {bus_pass.route_number}
+• Valid From: {bus_pass.start_date.strftime('%d/%m/%Y')}
+• Valid Until: {bus_pass.end_date.strftime('%d/%m/%Y')}
+
+📱 How to Use Your Pass:
+1. Download and save the attached PDF to your phone
+2. Show the PDF pass to the bus conductor when boarding
+3. Keep a backup copy for your records
+4. The pass is valid for the specified route and dates
+
+🚌 Important Notes:
+• This pass is non-transferable and valid only for the registered user
+• Please carry a valid ID along with your pass
+• Report any issues to AMTS customer service: +91-79-2658-0000
+• Keep your pass safe - replacement charges may apply
+
+Thank you for choosing AMTS for your daily commute!
+
+Best regards,
+AMTS Pass Department
+Ahmedabad Municipal Transport Service
+
+---
+This is an automated email. Please do not reply to this message.
+For support, contact: support@amts.gov.in
+        """
+        
+        # Create email with attachment
+        email = EmailMessage(
+            subject=subject,
+            body=message,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[email_address],
+        )
+        
+        # Attach PDF file
+        pdf_full_path = os.path.join(settings.MEDIA_ROOT, pdf_path)
+        if os.path.exists(pdf_full_path):
+            with open(pdf_full_path, 'rb') as pdf_file:
+                email.attach(
+                    f"AMTS_{bus_pass.get_pass_type_display()}_Pass_{bus_pass.pass_id}.pdf",
+                    pdf_file.read(),
+                    'application/pdf'
+                )
+        
+        # Send email
+        email.send(fail_silently=False)
+        
+        print(f"✅ Bus pass PDF sent successfully to: {email_address}")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Failed to send bus pass email to {email_address}: {str(e)}")
+        return False
+
+
+# Fields needed to render a pass without touching the database
+PASS_RENDER_FIELDS = [
+    'pass_id', 'pass_type', 'full_name', 'date_of_birth', 'gender', 'phone_number',
+    'email', 'address', 'from_stop', 'to_stop', 'route_number', 'school_college_name',
+    'student_id', 'class_year', 'start_date', 'end_date'
+]
+
+
+def warm_pdf_renderer():
+    """
+    Process pool initializer: import ReportLab and load the fonts passes use once
+    per worker, instead of paying for it on the first pass each worker renders.
+    """
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfgen import canvas  # noqa: F401
+
+    for font in ('Helvetica', 'Helvetica-Bold', 'Helvetica-Oblique'):
+        pdfmetrics.getFont(font)
+
+
+def render_pass_row(row):
+    """
+    Render one pass from a values() row (runs in a worker process).
+    Returns (pass_id, pdf_path, error); exactly one of pdf_path / error is set.
+    """
+    try:
+        return row['pass_id'], generate_bus_pass_pdf(BusPass(**row)), None
+    except Exception as e:
+        return row['pass_id'], None, str(e)
+
+
+def process_bus_pass(pass_id):
+    """
+    Render a pass's PDF and email it to the applicant, recording progress on the pass.
+    The PENDING -> PROCESSING claim is a conditional UPDATE, so a pass is only
+    picked up once even with several workers polling.
+    Returns True if the PDF was rendered.
+    """
+    claimed = BusPass.objects.filter(pk=pass_id, pdf_status='PENDING').update(
+        pdf_status='PROCESSING', processing_started_at=timezone.now()
+    )
+    if not claimed:
+        return False
+
+    bus_pass = BusPass.objects.get(pk=pass_id)
+    try:
+        bus_pass.pdf_file = generate_bus_pass_pdf(bus_pass)
+    except Exception as e:
+        logger.exception(f"Failed to render PDF for bus pass {pass_id}")
+        bus_pass.pdf_status = 'FAILED'
+        bus_pass.processing_error = str(e)
+        bus_pass.processed_at = timezone.now()
+        bus_pass.save(update_fields=['pdf_status', 'processing_error', 'processed_at'])
+        return False
+
+    bus_pass.pdf_status = 'READY'
+    bus_pass.processing_error = ''
+    bus_pass.save(update_fields=['pdf_file', 'pdf_status', 'processing_error'])
+
+    deliver_pass_email(bus_pass)
+    return True
+
+
+def deliver_pass_email(bus_pass):
+    """
+    Email a rendered pass to the applicant if its email is still PENDING.
+    The PENDING -> SENDING claim is a conditional UPDATE that also counts the
+    attempt, so a pass is never emailed twice by workers racing on a retry.
+    """
+    if bus_pass.email_status == 'PENDING':
+        if not bus_pass.email:
+            bus_pass.email_status = 'SKIPPED'
+        else:
+            claimed = BusPass.objects.filter(pk=bus_pass.pk, email_status='PENDING').update(
+                email_status='SENDING', email_attempts=F('email_attempts') + 1, processing_started_at=timezone.now()
+            )
+            if not claimed:
+                return
+            if send_bus_pass_email(bus_pass, bus_pass.email, bus_pass.pdf_file.name):
+                bus_pass.email_status = 'SENT'
+            else:
+                bus_pass.email_status = 'FAILED'
+    bus_pass.processed_at = timezone.now()
+    bus_pass.save(update_fields=['email_status', 'processed_at'])
+
+
+def enqueue_pass_processing(bus_pass):
+    """Queue PDF rendering and email for a newly submitted pass off the request path"""
+    run_in_background(process_bus_pass, bus_pass.pass_id)
+
+
+def process_pending_passes(batch_size=20):
+    """
+    Process the next batch of pending passes (used by the process_bus_passes worker),
+    then resend the emails requeue_passes put back for passes already rendered.
+    Returns how many passes were picked up, including ones that failed.
+    """
+    pass_ids = list(
+        BusPass.objects.filter(pdf_status='PENDING')
+        .order_by('application_date')
+        .values_list('pass_id', flat=True)[:batch_size]
+    )
+    for pass_id in pass_ids:
+        process_bus_pass(pass_id)
+
+    email_retries = list(
+        BusPass.objects.filter(pdf_status='READY', email_status='PENDING')
+        .order_by('application_date')[:batch_size]
+    )
+    for bus_pass in email_retries:
+        deliver_pass_email(bus_pass)
+    return len(pass_ids) + len(email_retries)
+
+
+def requeue_passes():
+    """
+    Put failed passes, and ones stuck in PROCESSING past the lease (their worker
+    died), back in the queue. Failed emails, and ones stuck in SENDING past the
+    lease, are queued for another send until PASS_EMAIL_MAX_ATTEMPTS is reached.
+    Returns how many passes were requeued.
+    """
+    stale_before = timezone.now() - timedelta(seconds=getattr(settings, 'PASS_PROCESSING_LEASE_SECONDS', 600))
+    stale = Q(processing_started_at__lt=stale_before) | Q(processing_started_at__isnull=True)
+
+    requeued = BusPass.objects.filter(Q(pdf_status='FAILED') | Q(pdf_status='PROCESSING') & stale).update(
+        pdf_status='PENDING', processing_error='', processing_started_at=None
+    )
+    requeued += BusPass.objects.filter(
+        Q(email_status='FAILED') | Q(email_status='SENDING') & stale,
+        pdf_status='READY',
+        email_attempts__lt=getattr(settings, 'PASS_EMAIL_MAX_ATTEMPTS', 3)
+    ).update(email_status='PENDING', processing_started_at=None)
+    return requeued
@@ -0,0 +1,213 @@
+# my_amts/pass_uploads.py
+
+import hashlib
+import os
+import tempfile
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+UPLOAD_ROOT = 'pass_uploads'
+THUMBNAIL_DIR = 'thumbs'
+
+# Upload fields on BusPass and the extensions each accepts
+UPLOAD_FIELDS = {
+    'photo': {'.jpg', '.jpeg', '.png'},
+    'id_proof': {'.jpg', '.jpeg', '.png', '.pdf'},
+    'student_id_card': {'.jpg', '.jpeg', '.png', '.pdf'},
+}
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+# Stored extension for each image format Pillow detects
+IMAGE_FORMATS = {'JPEG': '.jpg', 'PNG': '.png'}
+
+
+class UploadRejected(ValueError):
+    """Raised when an upload is too large or of a type we don't accept"""
+
+
+def get_max_upload_bytes():
+    return getattr(settings, 'PASS_UPLOAD_MAX_BYTES', 5 * 1024 * 1024)
+
+
+def get_max_request_bytes():
+    """Largest pass application body: every upload field at the limit plus the form fields"""
+    return get_max_upload_bytes() * len(UPLOAD_FIELDS) + settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+
+
+class UploadSizeLimitHandler(FileUploadHandler):
+    """
+    First upload handler for pass applications: counts each file's bytes as the
+    request is parsed and stops reading the body once one passes
+    PASS_UPLOAD_MAX_BYTES, before the rest is buffered in memory or spooled to disk.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.max_bytes = get_max_upload_bytes()
+        self.received = 0
+        self.rejected = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_bytes:
+            self.rejected = f'{self.file_name} is larger than {format_size(self.max_bytes)}'
+            raise StopUpload(connection_reset=True)
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+    def check(self):
+        """Parse the request (if not done yet) and raise UploadRejected if a file was cut off"""
+        self.request.FILES
+        if self.rejected:
+            raise UploadRejected(self.rejected)
+
+
+def limit_upload_size(request):
+    """
+    Enforce the upload limits while the request body is read; call before
+    request.POST or request.FILES is touched, then call check() on the result.
+    Bodies whose Content-Length is already over the total limit are rejected unread.
+    """
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    if content_length > get_max_request_bytes():
+        raise UploadRejected(f'Uploads must total less than {format_size(get_max_request_bytes())}')
+
+    handler = UploadSizeLimitHandler(request)
+    request.upload_handlers.insert(0, handler)
+    return handler
+
+
+def upload_extension(name):
+    ext = os.path.splitext(name or '')[1].lower()
+    return '.jpg' if ext == '.jpeg' else ext
+
+
+def format_size(num_bytes):
+    if num_bytes >= 1024 * 1024:
+        return f'{num_bytes / (1024 * 1024):g} MB'
+    return f'{num_bytes / 1024:g} KB'
+
+
+def image_extension(path, original_name):
+    """
+    Extension for an uploaded image, taken from its actual format rather than its name.
+    Rejects files that don't parse as a JPEG or PNG (header check only).
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            image.verify()
+            image_format = image.format
+    except Exception:
+        raise UploadRejected(f'{original_name} is not a valid image')
+
+    if image_format not in IMAGE_FORMATS:
+        raise UploadRejected(f'{original_name} must be a JPEG or PNG image')
+    return IMAGE_FORMATS[image_format]
+
+
+def store_upload(uploaded_file, field):
+    """
+    Stream an uploaded file to content-addressed storage and return its name
+    relative to MEDIA_ROOT (pass_uploads/<ab>/<sha256><ext>).
+    The file is copied chunk by chunk while it is hashed, so memory use doesn't
+    depend on its size, and the size limit is enforced on the bytes actually
+    read (requests installing limit_upload_size are already cut off while
+    parsing; this covers any other caller). Identical files (e.g. a re-uploaded ID card) resolve to the same name
+    and are stored once, whichever field they were uploaded to.
+    """
+    ext = upload_extension(uploaded_file.name)
+    if ext not in UPLOAD_FIELDS[field]:
+        raise UploadRejected(f'{field.replace("_", " ").capitalize()} must be one of: {", ".join(sorted(UPLOAD_FIELDS[field]))}')
+
+    max_bytes = get_max_upload_bytes()
+    if uploaded_file.size and uploaded_file.size > max_bytes:
+        raise UploadRejected(f'{uploaded_file.name} is larger than {format_size(max_bytes)}')
+
+    upload_dir = os.path.join(settings.MEDIA_ROOT, UPLOAD_ROOT)
+    os.makedirs(upload_dir, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=upload_dir, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            for chunk in uploaded_file.chunks():
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadRejected(f'{uploaded_file.name} is larger than {format_size(max_bytes)}')
+                digest.update(chunk)
+                temp_file.write(chunk)
+
+        if ext in IMAGE_EXTENSIONS:
+            ext = image_extension(temp_path, uploaded_file.name)
+
+        hex_digest = digest.hexdigest()
+        name = f'{UPLOAD_ROOT}/{hex_digest[:2]}/{hex_digest}{ext}'
+        final_path = os.path.join(settings.MEDIA_ROOT, name)
+        if os.path.exists(final_path):
+            # Duplicate content: keep the copy we already have
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(temp_path, final_path)
+        return name
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def store_pass_uploads(files):
+    """
+    Store every BusPass upload field present in request.FILES.
+    Returns {field: stored name}, ready to pass to BusPass(**...).
+    """
+    return {
+        field: store_upload(files[field], field)
+        for field in UPLOAD_FIELDS
+        if files.get(field)
+    }
+
+
+def get_thumbnail(name, width=None):
+    """
+    Return the thumbnail name for a stored image upload, rendering it on first use.
+    Uploads are content-addressed, so a thumbnail can never go stale and is cached
+    on disk forever. Returns None for uploads that aren't images.
+    """
+    if upload_extension(name) not in IMAGE_EXTENSIONS:
+        return None
+    width = width or getattr(settings, 'PASS_THUMBNAIL_WIDTH', 240)
+
+    digest = os.path.splitext(os.path.basename(name))[0]
+    thumb_name = f'{UPLOAD_ROOT}/{THUMBNAIL_DIR}/{digest[:2]}/{digest}_{width}.jpg'
+    thumb_path = os.path.join(settings.MEDIA_ROOT, thumb_name)
+    if os.path.exists(thumb_path):
+        return thumb_name
+
+    from PIL import Image
+
+    os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(thumb_path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file, Image.open(os.path.join(settings.MEDIA_ROOT, name)) as image:
+            # draft() lets the JPEG decoder downscale while reading instead of
+            # decoding the full-resolution photo first
+            image.draft('RGB', (width, width * 2))
+            image = image.convert('RGB')
+            image.thumbnail((width, width * 2))
+            image.save(temp_file, 'JPEG', quality=85)
+        os.replace(temp_path, thumb_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return thumb_name
@@ -0,0 +1,139 @@
+# my_amts/pass_verification.py
+
+import threading
+import time
+from django.conf import settings
+from django.utils import timezone
+from .models import BusPass
+
+PASS_FIELDS = ('pass_id', 'pass_type', 'full_name', 'route_number', 'from_stop', 'to_stop',
+               'start_date', 'end_date', 'is_approved')
+
+
+class ValidPassCache:
+    """
+    In-memory snapshot of the approved passes valid today (the set conductors
+    actually scan), reloaded at most every PASS_CACHE_REFRESH_SECONDS and
+    whenever the local date changes. Anything not in the snapshot falls back to
+    an indexed database lookup, so a pass approved since the last reload is
+    still accepted straight away.
+    """
+
+    def __init__(self):
+        self._passes = {}
+        self._loaded_at = None
+        self._loaded_for = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        today = timezone.localdate()
+        passes = {
+            row['pass_id']: row
+            for row in BusPass.objects.filter(
+                is_approved=True,
+                start_date__lte=today,
+                end_date__gte=today
+            ).values(*PASS_FIELDS)
+        }
+        with self._lock:
+            self._passes = passes
+            self._loaded_at = time.monotonic()
+            self._loaded_for = today
+
+    def clear(self, sender=None, **kwargs):
+        """Force a reload on next use"""
+        with self._lock:
+            self._loaded_at = None
+
+    def pass_saved(self, sender=None, instance=None, update_fields=None, **kwargs):
+        """
+        Reload only when a pass in the snapshot has one of its PASS_FIELDS changed
+        (connected to the BusPass post_save signal). Pipeline saves of the PDF and
+        email status leave the snapshot alone, and passes missing from it are
+        looked up in the database anyway. Other processes catch up within
+        PASS_CACHE_REFRESH_SECONDS.
+        """
+        if update_fields is not None and not set(update_fields) & set(PASS_FIELDS):
+            return
+        row = self._passes.get(instance.pk)
+        if row is not None and any(getattr(instance, field) != row[field] for field in PASS_FIELDS):
+            self.clear()
+
+    def pass_deleted(self, sender=None, instance=None, **kwargs):
+        """Reload if a pass in the snapshot was deleted (connected to BusPass post_delete)"""
+        if instance.pk in self._passes:
+            self.clear()
+
+    def _is_stale(self):
+        ttl = getattr(settings, 'PASS_CACHE_REFRESH_SECONDS', 60)
+        return (
+            self._loaded_at is None
+            or self._loaded_for != timezone.localdate()
+            or time.monotonic() - self._loaded_at > ttl
+        )
+
+    def get_many(self, pass_ids):
+        if self._is_stale():
+            self.refresh()
+        passes = self._passes
+        return {pass_id: passes[pass_id] for pass_id in pass_ids if pass_id in passes}
+
+
+valid_passes = ValidPassCache()
+
+
+def pass_status(row, bus_number=None, today=None):
+    """Return (is_valid, reason) for a pass row from PASS_FIELDS"""
+    today = today or timezone.localdate()
+    if row is None:
+        return False, 'not_found'
+    if not row['is_approved']:
+        return False, 'not_approved'
+    if row['start_date'] > today:
+        return False, 'not_started'
+    if row['end_date'] < today:
+        return False, 'expired'
+    if bus_number and row['route_number'] != bus_number:
+        return False, 'wrong_route'
+    return True, 'valid'
+
+
+def _pass_summary(row):
+    return {
+        'pass_id': str(row['pass_id']),
+        'pass_type': row['pass_type'],
+        'full_name': row['full_name'],
+        'route_number': row['route_number'],
+        'from_stop': row['from_stop'],
+        'to_stop': row['to_stop'],
+        'start_date': row['start_date'].strftime('%Y-%m-%d'),
+        'end_date': row['end_date'].strftime('%Y-%m-%d')
+    }
+
+
+def verify_passes(pass_ids, bus_number=None):
+    """
+    Check approval, validity dates and (optionally) route coverage for a list
+    of pass IDs. Hits come from the in-memory snapshot; the misses are fetched
+    together in one primary-key lookup.
+    Returns one result dict per requested ID, in order.
+    """
+    today = timezone.localdate()
+    rows = valid_passes.get_many(pass_ids)
+
+    missing = [pass_id for pass_id in pass_ids if pass_id not in rows]
+    if missing:
+        rows.update(
+            (row['pass_id'], row)
+            for row in BusPass.objects.filter(pass_id__in=missing).values(*PASS_FIELDS)
+        )
+
+    results = []
+    for pass_id in pass_ids:
+        row = rows.get(pass_id)
+        is_valid, reason = pass_status(row, bus_number, today)
+        result = {'pass_id': str(pass_id), 'is_valid': is_valid, 'reason': reason}
+        if row is not None:
+            result['pass'] = _pass_summary(row)
+        results.append(result)
+    return results
@@ -0,0 +1,91 @@
+# my_amts/qr_codes.py
+
+import logging
+from functools import lru_cache
+from django.conf import settings
+from django.core.files.base import ContentFile
+from .background import run_in_background
+from .models import Ticket, render_qr_png, render_qr_svg
+
+logger = logging.getLogger(__name__)
+
+QR_FORMATS = {
+    'png': ('image/png', render_qr_png),
+    'svg': ('image/svg+xml', render_qr_svg),
+}
+
+
+def stores_qr_files():
+    """
+    'files' keeps writing a PNG per ticket under qr_codes/;
+    'on_demand' renders QR codes per request from the ticket data instead.
+    """
+    return getattr(settings, 'QR_CODE_STORAGE', 'on_demand') == 'files'
+
+
+def mark_on_demand_ready(ticket):
+    """
+    In 'on_demand' mode every ticket's QR can be rendered, so a ticket still
+    PENDING or FAILED from the 'files' mode is marked READY instead of leaving
+    clients polling for a file that will never be written.
+    """
+    if ticket.qr_status != 'READY' and not stores_qr_files():
+        ticket.qr_status = 'READY'
+        Ticket.objects.filter(pk=ticket.pk).update(qr_status='READY')
+    return ticket
+
+
+@lru_cache(maxsize=getattr(settings, 'QR_CACHE_SIZE', 2048))
+def encode_qr(payload, fmt='png'):
+    """Encoded QR bytes for a payload, kept in a bounded LRU so hot tickets skip re-encoding"""
+    return QR_FORMATS[fmt][1](payload)
+
+
+def generate_ticket_qr_codes(ticket_ids):
+    """
+    Render QR images for a batch of pending tickets.
+    Encoding is pure-Python CPU work that holds the GIL, so it runs in a plain
+    loop (threads would only add overhead); every ticket's qr_code/qr_status
+    is then stored with a single bulk UPDATE.
+    """
+    tickets = list(
+        Ticket.objects.filter(
+            ticket_id__in=ticket_ids,
+            qr_status='PENDING'
+        ).select_related('booking')
+    )
+    if not tickets:
+        return 0
+
+    generated = 0
+    for ticket in tickets:
+        try:
+            png = render_qr_png(ticket.qr_payload())
+            ticket.qr_code.save(ticket.qr_filename(), ContentFile(png), save=False)
+            ticket.qr_status = 'READY'
+            generated += 1
+        except Exception as e:
+            ticket.qr_status = 'FAILED'
+            logger.error(f"QR generation failed for ticket {ticket.ticket_id}: {str(e)}")
+
+    Ticket.objects.bulk_update(tickets, ['qr_code', 'qr_status'])
+    return generated
+
+
+def enqueue_qr_generation(tickets):
+    """Queue QR rendering for newly created tickets off the request path"""
+    if not stores_qr_files():
+        return
+    ticket_ids = [ticket.ticket_id for ticket in tickets]
+    if ticket_ids:
+        run_in_background(generate_ticket_qr_codes, ticket_ids)
+
+
+def process_pending_qr_codes(batch_size=50):
+    """Render the next batch of pending QR codes (used by the process_qr_codes worker)"""
+    ticket_ids = list(
+        Ticket.objects.filter(qr_status='PENDING').values_list('ticket_id', flat=True)[:batch_size]
+    )
+    if not ticket_ids:
+        return 0
+    return generate_ticket_qr_codes(ticket_ids)
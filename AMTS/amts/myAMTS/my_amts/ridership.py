@@ -0,0 +1,155 @@
+# my_amts/ridership.py
+
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from .models import Booking, RidershipRollup, RollupWatermark
+
+WATERMARK_NAME = 'ridership'
+
+# Ways the read API can group rollup rows
+GROUPINGS = {
+    'period': ['period_start'],
+    'bus': ['bus_number'],
+    'od': ['bus_number', 'from_stop', 'to_stop'],
+    'stop': ['from_stop'],
+}
+
+
+def period_starts(booking_date):
+    """Local hour and day buckets a booking falls into"""
+    local = timezone.localtime(booking_date)
+    hour = local.replace(minute=0, second=0, microsecond=0)
+    return {'HOUR': hour, 'DAY': hour.replace(hour=0)}
+
+
+def _apply_deltas(deltas):
+    """Add per-bucket deltas to the rollup rows: one SELECT, one bulk UPDATE, one bulk INSERT"""
+    existing = {
+        (row.granularity, row.period_start, row.bus_number, row.from_stop, row.to_stop): row
+        for row in RidershipRollup.objects.filter(
+            period_start__in={key[1] for key in deltas},
+            bus_number__in={key[2] for key in deltas}
+        )
+    }
+
+    changed = []
+    created = []
+    for key, (bookings, tickets, revenue) in deltas.items():
+        row = existing.get(key)
+        if row is None:
+            granularity, period_start, bus_number, from_stop, to_stop = key
+            created.append(RidershipRollup(
+                granularity=granularity,
+                period_start=period_start,
+                bus_number=bus_number,
+                from_stop=from_stop,
+                to_stop=to_stop,
+                bookings=bookings,
+                tickets=tickets,
+                revenue=revenue
+            ))
+        else:
+            row.bookings += bookings
+            row.tickets += tickets
+            row.revenue += revenue
+            changed.append(row)
+
+    RidershipRollup.objects.bulk_update(changed, ['bookings', 'tickets', 'revenue'])
+    RidershipRollup.objects.bulk_create(created)
+
+
+def update_rollups(batch_size=1000, now=None):
+    """
+    Fold bookings made since the high-water mark into the daily and hourly rollups.
+    Bookings are read in (booking_date, booking_id) order in batches; each batch
+    and the watermark advance commit together, so a crash never double counts.
+    Bookings younger than RIDERSHIP_ROLLUP_LAG_SECONDS are left for the next run
+    so transactions still in flight can't slip in behind the watermark.
+    Rollups record gross sales at booking time; later refunds are not subtracted.
+    Returns the number of bookings processed.
+    """
+    lag = timedelta(seconds=getattr(settings, 'RIDERSHIP_ROLLUP_LAG_SECONDS', 120))
+    cutoff = (now or timezone.now()) - lag
+    processed = 0
+
+    while True:
+        with transaction.atomic():
+            # The row lock keeps concurrent runs from folding the same batch twice
+            RollupWatermark.objects.get_or_create(name=WATERMARK_NAME)
+            watermark = RollupWatermark.objects.select_for_update().get(name=WATERMARK_NAME)
+
+            bookings = Booking.objects.filter(booking_date__lte=cutoff)
+            if watermark.last_booking_date is not None:
+                bookings = bookings.filter(
+                    Q(booking_date__gt=watermark.last_booking_date) |
+                    Q(booking_date=watermark.last_booking_date, booking_id__gt=watermark.last_booking_id)
+                )
+            rows = list(
+                bookings.order_by('booking_date', 'booking_id').values(
+                    'booking_id', 'booking_date', 'bus_number', 'from_stop', 'to_stop', 'total_amount'
+                ).annotate(ticket_count=Count('tickets'))[:batch_size]
+            )
+            if not rows:
+                break
+
+            deltas = {}
+            for row in rows:
+                for granularity, period_start in period_starts(row['booking_date']).items():
+                    key = (granularity, period_start, row['bus_number'], row['from_stop'], row['to_stop'])
+                    totals = deltas.setdefault(key, [0, 0, Decimal('0.00')])
+                    totals[0] += 1
+                    totals[1] += row['ticket_count']
+                    totals[2] += row['total_amount']
+            _apply_deltas(deltas)
+
+            watermark.last_booking_date = rows[-1]['booking_date']
+            watermark.last_booking_id = rows[-1]['booking_id']
+            watermark.save()
+
+        processed += len(rows)
+        if len(rows) < batch_size:
+            break
+
+    return processed
+
+
+def reset_rollups():
+    """Drop all rollups and the watermark so the next update rebuilds from scratch"""
+    with transaction.atomic():
+        RidershipRollup.objects.all().delete()
+        RollupWatermark.objects.filter(name=WATERMARK_NAME).delete()
+
+
+def ridership_summary(start_date, end_date, granularity='DAY', group_by='period',
+                      bus_number=None, from_stop=None, to_stop=None):
+    """
+    Totals from the rollups for local days start_date..end_date (inclusive),
+    grouped by one of GROUPINGS. Only rollup rows are read, never Booking.
+    """
+    start = timezone.make_aware(datetime.combine(start_date, time.min))
+    end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min))
+
+    rollups = RidershipRollup.objects.filter(
+        granularity=granularity,
+        period_start__gte=start,
+        period_start__lt=end
+    )
+    if bus_number:
+        rollups = rollups.filter(bus_number=bus_number)
+    if from_stop:
+        rollups = rollups.filter(from_stop=from_stop)
+    if to_stop:
+        rollups = rollups.filter(to_stop=to_stop)
+
+    fields = GROUPINGS[group_by]
+    return list(
+        rollups.values(*fields).annotate(
+            total_bookings=Sum('bookings'),
+            total_tickets=Sum('tickets'),
+            total_revenue=Sum('revenue')
+        ).order_by(*fields)
+    )
@@ -0,0 +1,105 @@
+# my_amts/seat_inventory.py
+
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from .models import Bus, TripInventory
+
+
+class SeatsUnavailable(Exception):
+    """Raised when a departure doesn't have enough seats left for a booking"""
+
+
+def trip_departure(when=None):
+    """Start of the departure slot (TRIP_SLOT_MINUTES long) a passenger travelling at `when` rides in"""
+    slot_minutes = getattr(settings, 'TRIP_SLOT_MINUTES', 60)
+    local = timezone.localtime(when or timezone.now())
+    midnight = local.replace(hour=0, minute=0, second=0, microsecond=0)
+    elapsed = (local - midnight).total_seconds() // 60
+    return midnight + timedelta(minutes=elapsed - elapsed % slot_minutes)
+
+
+def parse_travel_time(value):
+    """
+    Travel time from a request ('YYYY-MM-DDTHH:MM', local time unless it carries
+    an offset); empty means travelling now. It must fall in the current departure
+    slot or later, up to SEAT_BOOKING_DAYS_AHEAD days ahead. Raises ValueError.
+    """
+    if not value:
+        return None
+    travel_time = datetime.fromisoformat(value)
+    if timezone.is_naive(travel_time):
+        travel_time = timezone.make_aware(travel_time)
+
+    now = timezone.now()
+    if travel_time < trip_departure(now):
+        raise ValueError('Travel time is in the past')
+    if travel_time > now + timedelta(days=getattr(settings, 'SEAT_BOOKING_DAYS_AHEAD', 7)):
+        raise ValueError('Travel time is too far ahead')
+    return travel_time
+
+
+def route_capacity(bus_number):
+    """
+    Seats per departure slot on a route: one vehicle's capacity times the
+    vehicles running it (its active ActiveBus rows, at least one; rows the fleet
+    sweeper expired don't count). None for unknown routes.
+    """
+    route = Bus.objects.filter(bus_number=bus_number).annotate(
+        vehicles=Count('active_instances', filter=Q(active_instances__is_active=True))
+    ).values('capacity', 'vehicles').first()
+    if route is None:
+        return None
+    return route['capacity'] * max(route['vehicles'], 1)
+
+
+def get_trip(bus_number, departure):
+    """Inventory row for a departure, created with the route's capacity on first use"""
+    trip = TripInventory.objects.filter(bus_number=bus_number, departure=departure).first()
+    if trip is None:
+        capacity = route_capacity(bus_number)
+        # get_or_create absorbs the race where another request creates the row first
+        trip, _ = TripInventory.objects.get_or_create(
+            bus_number=bus_number,
+            departure=departure,
+            defaults={'capacity': capacity or Bus._meta.get_field('capacity').default}
+        )
+    return trip
+
+
+def reserve_seats(bus_number, seats, when=None):
+    """
+    Take seats on the departure a passenger travelling at `when` (default now) rides.
+    The capacity check and increment are one conditional UPDATE, so the database
+    serialises concurrent bookings on the row without a read-modify-write race.
+    Call inside the booking transaction so a failed booking gives the seats back.
+    Returns the TripInventory; raises SeatsUnavailable if the trip is full.
+    """
+    trip = get_trip(bus_number, trip_departure(when))
+    reserved = TripInventory.objects.filter(
+        pk=trip.pk,
+        seats_booked__lte=F('capacity') - seats
+    ).update(seats_booked=F('seats_booked') + seats)
+
+    if not reserved:
+        trip.refresh_from_db(fields=['capacity', 'seats_booked'])
+        raise SeatsUnavailable(
+            f'Only {trip.seats_available} seat(s) left on bus {bus_number} '
+            f'departing {timezone.localtime(trip.departure):%H:%M}'
+        )
+    return trip
+
+
+def release_seats(trip_id, seats):
+    """Give seats back (e.g. on refund) without going below zero"""
+    TripInventory.objects.filter(pk=trip_id, seats_booked__gte=seats).update(
+        seats_booked=F('seats_booked') - seats
+    )
+
+
+def seats_available(bus_number, when=None):
+    trip = TripInventory.objects.filter(bus_number=bus_number, departure=trip_departure(when)).first()
+    if trip is not None:
+        return trip.seats_available
+    return route_capacity(bus_number)
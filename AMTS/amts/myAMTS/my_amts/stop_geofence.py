@@ -0,0 +1,200 @@
+# my_amts/stop_geofence.py
+
+from math import radians, cos, sqrt
+from django.conf import settings
+from django.utils import timezone
+from .models import ActiveBus
+
+EARTH_RADIUS_KM = 6371
+
+# Fields written back when GPS fixes are snapped to stops
+POSITION_FIELDS = [
+    'latitude', 'longitude', 'speed', 'stopped_since', 'is_stalled', 'status',
+    'current_location', 'stop_index', 'last_updated', 'is_active'
+]
+
+
+def get_geofence_radius():
+    """Radius (km) around a stop inside which a bus counts as arrived"""
+    return getattr(settings, 'STOP_GEOFENCE_RADIUS_KM', 0.15)
+
+
+class RouteStopIndex:
+    """
+    Precomputed stop coordinates for a single route.
+    Coordinates are kept in radians alongside the cosine of each stop's latitude,
+    so snapping a GPS fix is a flat scan using the equirectangular approximation
+    (accurate to a few metres at city scale) instead of a full Haversine per stop.
+    """
+
+    def __init__(self, bus):
+        self.bus_number = bus.bus_number
+        self.names = [stop['name'] for stop in bus.stops]
+        self.lats = [radians(float(stop['coordinates'][0])) for stop in bus.stops]
+        self.lngs = [radians(float(stop['coordinates'][1])) for stop in bus.stops]
+        self.cos_lats = [cos(lat) for lat in self.lats]
+
+        # Cumulative distance (km) from the first stop to each stop
+        self.cum_km = [0.0]
+        for i in range(1, len(self.names)):
+            self.cum_km.append(self.cum_km[-1] + self.distance_km(i - 1, self.lats[i], self.lngs[i]))
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def route_km(self):
+        return self.cum_km[-1] if self.cum_km else 0.0
+
+    def distance_km(self, stop_index, lat, lng):
+        """Equirectangular distance (km) from a stop to a position given in radians"""
+        x = (lng - self.lngs[stop_index]) * self.cos_lats[stop_index]
+        y = lat - self.lats[stop_index]
+        return EARTH_RADIUS_KM * sqrt(x * x + y * y)
+
+    def progress_km(self, stop_index, latitude=None, longitude=None, forward=True):
+        """
+        Distance travelled along the route in the direction of travel.
+        Uses the last stop reached plus how far the bus has moved past it,
+        capped at the length of the next segment.
+        """
+        if not self.names:
+            return 0.0
+        stop_index = min(stop_index, len(self.names) - 1)
+        progress = self.cum_km[stop_index]
+
+        next_index = stop_index + 1 if forward else stop_index - 1
+        if latitude is not None and longitude is not None and 0 <= next_index < len(self.names):
+            moved = self.distance_km(stop_index, radians(float(latitude)), radians(float(longitude)))
+            segment = abs(self.cum_km[next_index] - self.cum_km[stop_index])
+            progress += min(moved, segment) if forward else -min(moved, segment)
+
+        return progress if forward else self.route_km - progress
+
+    def nearest_stop(self, latitude, longitude):
+        """Return (stop_index, distance_km) of the stop closest to the given position"""
+        lat = radians(float(latitude))
+        lng = radians(float(longitude))
+
+        best_index = None
+        best_dist_sq = None
+        for i in range(len(self.names)):
+            x = (lng - self.lngs[i]) * self.cos_lats[i]
+            y = lat - self.lats[i]
+            dist_sq = x * x + y * y
+            if best_dist_sq is None or dist_sq < best_dist_sq:
+                best_index = i
+                best_dist_sq = dist_sq
+
+        if best_index is None:
+            return None, None
+        return best_index, EARTH_RADIUS_KM * sqrt(best_dist_sq)
+
+
+# Per-process cache of route indexes, keyed by Bus primary key
+_route_indexes = {}
+
+
+def get_route_index(bus):
+    """Return the cached RouteStopIndex for a bus route, building it on first use"""
+    index = _route_indexes.get(bus.pk)
+    if index is None:
+        index = RouteStopIndex(bus)
+        _route_indexes[bus.pk] = index
+    return index
+
+
+def clear_route_cache(sender=None, **kwargs):
+    """Drop cached route indexes (connected to Bus save/delete signals)"""
+    _route_indexes.clear()
+
+
+def mark_reporting(active_bus):
+    """Telemetry arrived: bring a bus the fleet sweeper expired back into the live set"""
+    active_bus.is_active = True
+
+
+def record_speed(active_bus, speed, now=None):
+    """
+    Record a speed reading, tracking when the bus came to a standstill.
+    Any movement clears the stall flag raised by the fleet sweeper, and the
+    DELAYED status it set unless a manual stop or accident explains the delay.
+    """
+    active_bus.speed = float(speed)
+    if active_bus.speed <= 0:
+        if active_bus.stopped_since is None:
+            active_bus.stopped_since = now or timezone.now()
+    else:
+        active_bus.stopped_since = None
+        if active_bus.is_stalled:
+            active_bus.is_stalled = False
+            if (active_bus.status == 'DELAYED'
+                    and not active_bus.is_manual_stop and not active_bus.is_accident):
+                active_bus.status = 'ON_TIME'
+
+
+def apply_position(active_bus, latitude, longitude, radius_km=None):
+    """
+    Record a GPS fix on an ActiveBus and snap it to the nearest stop on its route.
+    current_location and stop_index only advance while the bus is inside a stop's
+    geofence; between stops they keep the last stop reached.
+    Returns True if the fix placed the bus at a stop.
+    """
+    if radius_km is None:
+        radius_km = get_geofence_radius()
+
+    active_bus.latitude = float(latitude)
+    active_bus.longitude = float(longitude)
+
+    route_index = get_route_index(active_bus.bus)
+    stop_index, distance = route_index.nearest_stop(latitude, longitude)
+    if stop_index is None or distance > radius_km:
+        return False
+
+    active_bus.stop_index = stop_index
+    active_bus.current_location = route_index.names[stop_index]
+    return True
+
+
+def snap_fleet(positions, batch_size=500, radius_km=None):
+    """
+    Apply a batch of GPS fixes for the whole fleet.
+    positions maps ActiveBus identifier -> (latitude, longitude) or
+    (latitude, longitude, speed).
+    Buses are loaded and written back in chunks of batch_size, so each chunk
+    costs one SELECT and one bulk UPDATE regardless of how many buses it holds.
+    Returns a dict with counts of updated buses, stop arrivals and unknown identifiers.
+    """
+    if radius_km is None:
+        radius_km = get_geofence_radius()
+
+    identifiers = list(positions.keys())
+    updated = 0
+    arrivals = 0
+    now = timezone.now()
+
+    for start in range(0, len(identifiers), batch_size):
+        chunk = identifiers[start:start + batch_size]
+        buses = list(
+            ActiveBus.objects.filter(identifier__in=chunk).select_related('bus')
+        )
+
+        for active_bus in buses:
+            fix = positions[active_bus.identifier]
+            latitude, longitude = fix[0], fix[1]
+            mark_reporting(active_bus)
+            if len(fix) > 2 and fix[2] is not None:
+                record_speed(active_bus, fix[2], now)
+            if apply_position(active_bus, latitude, longitude, radius_km):
+                arrivals += 1
+            # bulk_update bypasses auto_now, so stamp the fix time explicitly
+            active_bus.last_updated = now
+
+        ActiveBus.objects.bulk_update(buses, POSITION_FIELDS)
+        updated += len(buses)
+
+    return {
+        'updated': updated,
+        'arrivals': arrivals,
+        'unknown': len(identifiers) - updated
+    }
@@ -1,3 +1,795 @@
-from django.test import TestCase
+import base64
+import hashlib
+import hmac
+import io
+import json
+import os
+import tempfile
+import time
+import uuid
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+from datetime import date, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from unittest import mock
+from . import views
+from .booking_service import create_booking_with_tickets, refund_booking
+from .fare_engine import FARE_TABLES_VERSION_KEY, invalidate_fare_tables, quote_fare
+from .fleet_sweeper import sweep_fleet
+from .headway_monitor import run_headway_check
+from .models import (
+    AccidentNotification, ActiveBus, Booking, Bus, BusPass, EmergencyAuditRecord, HeadwayAlert, OutboxMessage,
+    RevokedTicket, RidershipRollup, RollupWatermark, Ticket, TripInventory, VerificationBundle
+)
+from .notification_outbox import IncidentLockTimeout, incident_lock, process_outbox, queue_incident
+from .pagination import keyset_page
+from .pass_documents import process_pending_passes, requeue_passes
+from .pass_verification import valid_passes, verify_passes
+from .pass_uploads import THUMBNAIL_DIR, UPLOAD_ROOT, get_thumbnail
+from .qr_codes import generate_ticket_qr_codes, stores_qr_files
+from .ridership import update_rollups
+from .seat_inventory import SeatsUnavailable, parse_travel_time, route_capacity, trip_departure
+from .stop_geofence import snap_fleet
+from .ticket_tokens import (
+    revocation_list, route_day_key, route_day_signing_key, ticket_valid_until, token_service_date, verify_ticket_token
+)
+from .verification_bundles import build_bundles, id_prefix
 
-# Create your tests here.
+STOPS = [
+    {'name': 'Gokul Park', 'coordinates': [23.03145, 72.65191]},
+    {'name': 'Gandhi Park', 'coordinates': [23.02777, 72.64104]},
+    {'name': 'Bapu Nagar', 'coordinates': [23.03388, 72.63406]},
+    {'name': 'Kalupur', 'coordinates': [23.03017, 72.60041]},
+]
+
+
+class AMTSTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bus = Bus.objects.create(bus_number='T1', stops=STOPS, capacity=2)
+        cls.passenger = User.objects.create_user('passenger', 'passenger@example.com', 'pw')
+        cls.conductor = User.objects.create_user('conductor', 'conductor@example.com', 'pw')
+        cls.conductor.groups.add(Group.objects.create(name='Conductors'))
+
+    def create_pass(self, **fields):
+        today = timezone.localdate()
+        values = dict(
+            user=self.passenger, pass_type='MONTHLY', full_name='Test Passenger', date_of_birth=date(2000, 1, 1),
+            gender='O', phone_number='9000000000', email='passenger@example.com', address='Ahmedabad',
+            from_stop='Gokul Park', to_stop='Kalupur', route_number='T1',
+            start_date=today - timedelta(days=1), end_date=today + timedelta(days=29), is_approved=True
+        )
+        values.update(fields)
+        return BusPass.objects.create(**values)
+
+
+class VerificationBundleTests(AMTSTestCase):
+    def bundle_url(self, bus_number='T1', service_date=None):
+        service_date = service_date or timezone.localdate()
+        return reverse('verification_bundle', args=[bus_number, service_date.isoformat()])
+
+    def test_passengers_cannot_download_signing_keys(self):
+        self.client.force_login(self.passenger)
+        response = self.client.get(self.bundle_url())
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(VerificationBundle.objects.exists())
+
+    def test_conductor_gets_bundle(self):
+        self.client.force_login(self.conductor)
+        response = self.client.get(self.bundle_url())
+        self.assertEqual(response.status_code, 200)
+        bundle = response.json()['bundle']
+        self.assertEqual(bundle['bus_number'], 'T1')
+        self.assertTrue(bundle['token']['keys'])
+
+    def test_bundle_keys_verify_tokens_but_are_not_signing_keys(self):
+        _, tickets = create_booking_with_tickets(self.passenger, 'T1', 'Gokul Park', 'Kalupur', '16.00')
+        _, body, signature = tickets[0].signed_token().split('.')
+        self.client.force_login(self.conductor)
+        keys = self.client.get(self.bundle_url()).json()['bundle']['token']['keys']
+
+        signing_date = token_service_date(ticket_valid_until(tickets[0].booking).timestamp())
+        shipped = base64.b64decode(keys[signing_date.isoformat()])
+        public_key = Ed25519PublicKey.from_public_bytes(shipped)
+        public_key.verify(base64.urlsafe_b64decode(signature + '=' * (-len(signature) % 4)), body.encode('ascii'))
+        self.assertNotEqual(shipped, route_day_key('T1', signing_date))
+        self.assertNotEqual(shipped, route_day_signing_key('T1', signing_date).private_bytes_raw())
+
+    def test_unknown_bus_and_far_dates_are_rejected(self):
+        self.client.force_login(self.conductor)
+        self.assertEqual(self.client.get(self.bundle_url('NOPE')).status_code, 404)
+        far = timezone.localdate() + timedelta(days=365)
+        self.assertEqual(self.client.get(self.bundle_url(service_date=far)).status_code, 400)
+        self.assertFalse(VerificationBundle.objects.exists())
+
+    def test_rebuilding_keeps_one_bundle_per_route_and_day(self):
+        today = timezone.localdate()
+        VerificationBundle.objects.create(bus_number='T1', service_date=today)
+        build_bundles(today, ['T1'])
+        build_bundles(today, ['T1'])
+        self.assertEqual(VerificationBundle.objects.filter(bus_number='T1').count(), 1)
+
+    @override_settings(VERIFICATION_BUNDLE_LAG_SECONDS=60)
+    def test_revocation_committed_after_a_build_reaches_the_next_one(self):
+        today = timezone.localdate()
+        _, tickets = create_booking_with_tickets(self.passenger, 'T1', 'Gokul Park', 'Kalupur', '16.00', 2)
+        built_at = timezone.now()
+        RevokedTicket.objects.create(ticket_id=tickets[0].ticket_id)
+        RevokedTicket.objects.filter(pk=tickets[0].ticket_id).update(revoked_at=built_at - timedelta(seconds=30))
+        build_bundles(today, ['T1'], now=built_at)
+        self.assertEqual(VerificationBundle.objects.get().revoked_entries, {})
+
+        # Stamped before the other revocation but only committed after the first build
+        RevokedTicket.objects.create(ticket_id=tickets[1].ticket_id)
+        RevokedTicket.objects.filter(pk=tickets[1].ticket_id).update(revoked_at=built_at - timedelta(seconds=40))
+        build_bundles(today, ['T1'], now=built_at + timedelta(seconds=60))
+        self.assertEqual(
+            set(VerificationBundle.objects.get().revoked_entries),
+            {id_prefix(ticket.ticket_id) for ticket in tickets}
+        )
+
+
+class FleetSweeperTests(AMTSTestCase):
+    def setUp(self):
+        self.active_bus = ActiveBus.objects.create(
+            bus=self.bus, identifier='T1-1', current_location='Gokul Park', latitude=23.03145, longitude=72.65191
+        )
+
+    def make_stale(self, minutes=30):
+        ActiveBus.objects.filter(pk=self.active_bus.pk).update(
+            last_updated=timezone.now() - timedelta(minutes=minutes)
+        )
+
+    def test_stale_bus_is_reactivated_by_batch_telemetry(self):
+        self.make_stale()
+        self.assertEqual(sweep_fleet()['expired'], 1)
+        self.active_bus.refresh_from_db()
+        self.assertFalse(self.active_bus.is_active)
+
+        snap_fleet({'T1-1': (23.02777, 72.64104, 20)})
+        self.active_bus.refresh_from_db()
+        self.assertTrue(self.active_bus.is_active)
+        self.assertEqual(self.active_bus.current_location, 'Gandhi Park')
+        self.assertEqual(sweep_fleet()['expired'], 0)
+
+    def test_stale_bus_is_reactivated_by_status_update(self):
+        self.make_stale()
+        sweep_fleet()
+        response = self.client.post(
+            reverse('update_bus_status'), json.dumps({'bus_id': 'T1-1', 'speed': 25}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.active_bus.refresh_from_db()
+        self.assertTrue(self.active_bus.is_active)
+
+    def test_stall_clears_and_status_recovers_when_bus_moves(self):
+        # Stopped between stops for longer than the stall threshold
+        ActiveBus.objects.filter(pk=self.active_bus.pk).update(
+            speed=0, latitude=23.0300, longitude=72.6200,
+            stopped_since=timezone.now() - timedelta(minutes=10)
+        )
+        self.assertEqual(sweep_fleet()['stalled'], 1)
+        self.active_bus.refresh_from_db()
+        self.assertEqual((self.active_bus.is_stalled, self.active_bus.status), (True, 'DELAYED'))
+
+        snap_fleet({'T1-1': (23.0301, 72.6190, 18)})
+        self.active_bus.refresh_from_db()
+        self.assertEqual((self.active_bus.is_stalled, self.active_bus.status), (False, 'ON_TIME'))
+
+    def test_moving_keeps_delay_from_manual_stop(self):
+        ActiveBus.objects.filter(pk=self.active_bus.pk).update(
+            is_stalled=True, is_manual_stop=True, status='DELAYED'
+        )
+        snap_fleet({'T1-1': (23.0301, 72.6190, 18)})
+        self.active_bus.refresh_from_db()
+        self.assertFalse(self.active_bus.is_stalled)
+        self.assertEqual(self.active_bus.status, 'DELAYED')
+
+
+class HeadwayMonitorTests(AMTSTestCase):
+    def add_vehicle(self, identifier, **fields):
+        return ActiveBus.objects.create(bus=self.bus, identifier=identifier, current_location='Gokul Park', **fields)
+
+    def test_seeded_vehicles_start_at_their_displayed_stop(self):
+        self.client.force_login(self.passenger)
+        for params in ({'from': 'Gokul Park', 'to': 'Kalupur'}, {'from': 'Kalupur', 'to': 'Gokul Park'}):
+            response = self.client.get(reverse('active_buses', args=['T1']), params)
+            for vehicle in response.json()['buses']:
+                self.assertEqual(STOPS[vehicle['stop_index']]['name'], vehicle['current_location'])
+        self.assertEqual(
+            sorted(ActiveBus.objects.values_list('identifier', 'stop_index')),
+            [('T1-F1', 1), ('T1-F2', 2), ('T1-R1', 3), ('T1-R2', 2)]
+        )
+
+    def test_vehicles_without_a_fix_are_not_ranked(self):
+        # As seeded by the active buses view before any telemetry arrives
+        for identifier in ('T1-F1', 'T1-F2', 'T1-R1', 'T1-R2'):
+            self.add_vehicle(identifier)
+        result = run_headway_check()
+        self.assertEqual((result['vehicles'], result['new_alerts']), (0, 0))
+        self.assertFalse(HeadwayAlert.objects.exists())
+
+    def test_stale_fix_is_ignored_and_fresh_pairs_are_checked(self):
+        self.add_vehicle('T1-F1', latitude=23.03145, longitude=72.65191)
+        stale = self.add_vehicle('T1-F2', latitude=23.03145, longitude=72.65191)
+        ActiveBus.objects.filter(pk=stale.pk).update(last_updated=timezone.now() - timedelta(hours=1))
+        self.assertEqual(run_headway_check()['new_alerts'], 0)
+
+        self.add_vehicle('T1-F3', latitude=23.03145, longitude=72.65191)
+        self.assertEqual(run_headway_check()['new_alerts'], 1)
+        self.assertEqual(HeadwayAlert.objects.get().alert_type, 'BUNCHING')
+
+
+ALERT = {
+    'route_name': 'Gokul Park - Kalupur',
+    'location_str': 'Near Gandhi Park',
+    'passenger_subject': 'Accident on your bus',
+    'passenger_message': 'Your bus T1 was in an accident.',
+    'helpline_subject': 'Accident reported on bus T1',
+    'helpline_message': 'Bus T1 reported an accident.',
+    'sms_message': 'AMTS: bus T1 accident near Gandhi Park.',
+}
+
+
+@override_settings(BACKGROUND_TASK_MODE='sync', SMS_BACKEND='locmem', SMS_FAKE_FAILING_NUMBERS=['+910000000000'],
+                   OUTBOX_MAX_ATTEMPTS=2)
+class NotificationOutboxTests(AMTSTestCase):
+    def queue(self, recipients):
+        with self.captureOnCommitCallbacks(execute=True):
+            return queue_incident('T1', 23.03, 72.64, '', ALERT, recipients)
+
+    def test_failed_send_is_scheduled_for_retry_not_waited_for(self):
+        incident, queued, _ = self.queue([
+            ('EMAIL', 'PASSENGER', 'passenger@example.com'),
+            ('SMS', 'HELPLINE', '+910000000000'),
+        ])
+        self.assertEqual(queued, {'EMAIL': 1, 'SMS': 1})
+
+        sent = incident.messages.get(channel='EMAIL')
+        failing = incident.messages.get(channel='SMS')
+        self.assertEqual(sent.status, 'SENT')
+        # Delivery returned after one attempt; the retry waits for its backoff
+        self.assertEqual((failing.status, failing.attempts), ('PENDING', 1))
+        self.assertGreater(failing.next_attempt_at, timezone.now())
+
+        # Nothing is due yet, then the worker retries it and gives up at OUTBOX_MAX_ATTEMPTS
+        self.assertEqual(process_outbox(), 0)
+        OutboxMessage.objects.filter(pk=failing.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(process_outbox(), 1)
+        failing.refresh_from_db()
+        self.assertEqual((failing.status, failing.attempts), ('FAILED', 2))
+
+    def test_repeat_alerts_coalesce_into_one_incident(self):
+        first, queued, coalesced = self.queue([('EMAIL', 'PASSENGER', 'passenger@example.com')])
+        self.assertFalse(coalesced)
+        second, queued, coalesced = self.queue([
+            ('EMAIL', 'PASSENGER', 'Passenger@Example.com'),
+            ('EMAIL', 'PASSENGER', 'late@example.com'),
+        ])
+        self.assertTrue(coalesced)
+        self.assertEqual(second.pk, first.pk)
+        # Only the recipient the incident hadn't notified yet is queued
+        self.assertEqual(queued, {'EMAIL': 1})
+        second.refresh_from_db()
+        self.assertEqual(second.alert_count, 2)
+        self.assertEqual(second.messages.count(), 2)
+
+    def test_incident_finishing_again_replaces_its_audit_record(self):
+        with self.assertLogs('my_amts.audit') as first_log:
+            incident, _, _ = self.queue([('EMAIL', 'PASSENGER', 'passenger@example.com')])
+        self.assertEqual(incident.audit_record.notifications_sent, 1)
+        self.assertFalse(first_log.records[-1].audit['updated'])
+
+        # A repeat alert notifies one more passenger and the incident finishes again
+        with self.assertLogs('my_amts.audit') as second_log:
+            self.queue([('EMAIL', 'PASSENGER', 'late@example.com')])
+        self.assertEqual(EmergencyAuditRecord.objects.filter(incident=incident).count(), 1)
+        record = EmergencyAuditRecord.objects.get(incident=incident)
+        self.assertEqual((record.alert_count, record.notifications_sent), (2, 2))
+        self.assertTrue(second_log.records[-1].audit['updated'])
+
+    def test_alerts_outside_the_window_start_a_new_incident(self):
+        first, _, _ = self.queue([('EMAIL', 'PASSENGER', 'passenger@example.com')])
+        AccidentNotification.objects.filter(pk=first.pk).update(
+            last_reported_at=timezone.now() - timedelta(hours=1)
+        )
+        second, queued, coalesced = self.queue([('EMAIL', 'PASSENGER', 'passenger@example.com')])
+        self.assertFalse(coalesced)
+        self.assertNotEqual(second.pk, first.pk)
+
+    def test_alert_lock_is_held_in_the_shared_cache(self):
+        with incident_lock('T1'):
+            self.assertIsNotNone(cache.get('accident-lock:T1'))
+        self.assertIsNone(cache.get('accident-lock:T1'))
+
+    @override_settings(ACCIDENT_LOCK_WAIT_SECONDS=0)
+    def test_alert_that_misses_the_lock_is_refused_not_duplicated(self):
+        cache.add('accident-lock:T1', 'another-request', 30)
+        self.addCleanup(cache.delete, 'accident-lock:T1')
+        with self.assertRaises(IncidentLockTimeout):
+            self.queue([('EMAIL', 'PASSENGER', 'passenger@example.com')])
+
+        response = self.client.post(reverse('emergency_accident_alert'), json.dumps({
+            'bus_number': 'T1', 'latitude': 23.03, 'longitude': 72.64
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(AccidentNotification.objects.exists())
+        # The other request's lock is left alone
+        self.assertEqual(cache.get('accident-lock:T1'), 'another-request')
+
+    def test_long_recipient_fits_idempotency_key(self):
+        recipient = 'a' * 240 + '@example.com'
+        incident, queued, _ = self.queue([('EMAIL', 'PASSENGER', recipient)])
+        key = incident.messages.get().idempotency_key
+        self.assertLessEqual(len(key), OutboxMessage._meta.get_field('idempotency_key').max_length)
+
+    def test_claimed_messages_are_not_claimed_again(self):
+        with override_settings(BACKGROUND_TASK_MODE='worker'):
+            incident, _, _ = self.queue([('EMAIL', 'PASSENGER', 'passenger@example.com')])
+        OutboxMessage.objects.filter(incident=incident).update(
+            status='SENDING', locked_by='other-worker', locked_at=timezone.now()
+        )
+        self.assertEqual(process_outbox(), 0)
+
+        # A worker that died mid-send has its messages requeued once the lease runs out
+        OutboxMessage.objects.filter(incident=incident).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(process_outbox(), 1)
+        self.assertEqual(incident.messages.get().status, 'SENT')
+
+
+class TicketTokenTests(AMTSTestCase):
+    def setUp(self):
+        self.booking, self.tickets = create_booking_with_tickets(
+            self.passenger, 'T1', 'Gokul Park', 'Kalupur', '16.00'
+        )
+        self.token = self.tickets[0].signed_token()
+        revocation_list.refresh()
+
+    def test_signed_token_verifies(self):
+        is_valid, reason, claims = verify_ticket_token(self.token)
+        self.assertEqual((is_valid, reason), (True, 'valid'))
+        self.assertEqual(claims['ticket_id'], str(self.tickets[0].ticket_id))
+        self.assertEqual(claims['bus_number'], 'T1')
+
+    def test_tampered_and_expired_tokens_are_rejected(self):
+        version, body, signature = self.token.split('.')
+        forged = f"{version}.{body[:-2]}{'A' if body[-2] != 'A' else 'B'}{body[-1]}.{signature}"
+        self.assertFalse(verify_ticket_token(forged)[0])
+        self.assertEqual(verify_ticket_token('garbage')[1], 'malformed')
+        later = time.time() + 3 * 24 * 3600
+        self.assertEqual(verify_ticket_token(self.token, now=later)[1], 'expired')
+
+    def test_legacy_hmac_tokens_still_verify(self):
+        _, body, _ = self.token.split('.')
+        valid_until = ticket_valid_until(self.booking)
+        key = route_day_key('T1', token_service_date(valid_until.timestamp()))
+        signature = hmac.new(key, body.encode('ascii'), hashlib.sha256).digest()[:16]
+        legacy = f"v1.{body}.{base64.urlsafe_b64encode(signature).decode('ascii').rstrip('=')}"
+        self.assertEqual(verify_ticket_token(legacy)[:2], (True, 'valid'))
+
+    def test_refund_endpoint_revokes_tickets(self):
+        self.client.force_login(self.passenger)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('refund_booking', args=[self.booking.booking_id]))
+        self.assertEqual(response.status_code, 200)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.payment_status, 'REFUNDED')
+        self.assertEqual(RevokedTicket.objects.count(), 1)
+        # The process-local revocation list was refreshed on commit, not before
+        self.assertEqual(verify_ticket_token(self.token)[1], 'revoked')
+
+        second = self.client.post(reverse('refund_booking', args=[self.booking.booking_id]))
+        self.assertEqual(second.status_code, 400)
+
+    def test_lookup_views_agree_with_tokens_on_revoked_tickets(self):
+        # Revoked while the booking row still says COMPLETED
+        ticket_id = self.tickets[0].ticket_id
+        RevokedTicket.objects.create(ticket_id=ticket_id, reason='FRAUD')
+        revocation_list.refresh()
+        self.assertEqual(verify_ticket_token(self.token)[1], 'revoked')
+
+        self.client.force_login(self.conductor)
+        single = self.client.get(reverse('verify_ticket', args=[ticket_id])).json()
+        self.assertEqual((single['is_valid'], single['reason']), (False, 'revoked'))
+        batch = self.client.post(reverse('verify_tickets'), json.dumps({'ticket_ids': [str(ticket_id)]}),
+                                 content_type='application/json').json()
+        self.assertEqual((batch['valid_count'], batch['results'][0]['reason']), (0, 'revoked'))
+
+    def test_only_the_owner_can_refund(self):
+        self.client.force_login(self.conductor)
+        response = self.client.post(reverse('refund_booking', args=[self.booking.booking_id]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Booking.objects.get(pk=self.booking.pk).payment_status, 'COMPLETED')
+
+    def test_verify_token_accepts_form_and_json_posts(self):
+        url = reverse('verify_ticket_token')
+        form = self.client.post(url, {'token': self.token})
+        self.assertTrue(form.json()['is_valid'])
+        body = self.client.post(url, json.dumps({'token': self.token}), content_type='application/json')
+        self.assertTrue(body.json()['is_valid'])
+
+
+class SeatInventoryTests(AMTSTestCase):
+    def book(self, passengers=1, travel_time=None):
+        return create_booking_with_tickets(
+            self.passenger, 'T1', 'Gokul Park', 'Kalupur', '16.00', passengers, travel_time
+        )[0]
+
+    def test_full_departure_rejects_bookings(self):
+        self.book(2)
+        with self.assertRaises(SeatsUnavailable):
+            self.book(1)
+        trip = TripInventory.objects.get()
+        self.assertEqual((trip.seats_booked, trip.capacity), (2, 2))
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_seats_are_counted_against_the_travel_slot(self):
+        later = timezone.now() + timedelta(hours=3)
+        self.book(2)
+        booking = self.book(2, later)
+        self.assertEqual(booking.trip.departure, trip_departure(later))
+        self.assertEqual(TripInventory.objects.count(), 2)
+
+    def test_capacity_covers_every_vehicle_on_the_route(self):
+        for identifier in ('T1-F1', 'T1-F2', 'T1-R1'):
+            ActiveBus.objects.create(bus=self.bus, identifier=identifier, current_location='Gokul Park')
+        self.assertEqual(route_capacity('T1'), 6)
+        self.book(5)
+        self.assertEqual(TripInventory.objects.get().seats_available, 1)
+
+    def test_expired_vehicles_do_not_add_capacity(self):
+        ActiveBus.objects.create(bus=self.bus, identifier='T1-F1', current_location='Gokul Park')
+        ActiveBus.objects.create(bus=self.bus, identifier='T1-F2', current_location='Gokul Park', is_active=False)
+        self.assertEqual(route_capacity('T1'), 2)
+        ActiveBus.objects.update(is_active=False)
+        self.assertEqual(route_capacity('T1'), 2)
+
+    def test_travel_time_must_be_current_or_upcoming(self):
+        self.assertIsNone(parse_travel_time(''))
+        with self.assertRaises(ValueError):
+            parse_travel_time((timezone.localtime() - timedelta(days=1)).strftime('%Y-%m-%dT%H:%M'))
+        with self.assertRaises(ValueError):
+            parse_travel_time((timezone.localtime() + timedelta(days=30)).strftime('%Y-%m-%dT%H:%M'))
+
+    def test_refund_releases_seats_once(self):
+        booking = self.book(2)
+        stale_copy = Booking.objects.get(pk=booking.pk)
+        self.assertTrue(refund_booking(booking))
+        # A second refund working from a copy loaded before the first one committed
+        self.assertFalse(refund_booking(stale_copy))
+        self.assertEqual(TripInventory.objects.get().seats_booked, 0)
+        self.assertEqual(RevokedTicket.objects.count(), 2)
+
+
+class BookingPaginationTests(AMTSTestCase):
+    def create_bookings(self, count, booking_date):
+        bookings = [
+            Booking.objects.create(user=self.passenger, bus_number='T1', from_stop='Gokul Park',
+                                   to_stop='Kalupur', total_amount='16.00')
+            for _ in range(count)
+        ]
+        Booking.objects.filter(pk__in=[booking.pk for booking in bookings]).update(booking_date=booking_date)
+        return bookings
+
+    def test_pages_cover_every_booking_once_newest_first(self):
+        now = timezone.now()
+        # Bookings sharing a timestamp are split across pages by booking_id
+        self.create_bookings(3, now)
+        self.create_bookings(4, now - timedelta(hours=1))
+
+        seen = []
+        cursor = None
+        while True:
+            page, cursor = keyset_page(Booking.objects.all(), cursor, page_size=2)
+            seen.extend(page)
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len({booking.pk for booking in seen}), 7)
+        keys = [(booking.booking_date, booking.booking_id) for booking in seen]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+
+    def test_last_full_page_has_no_cursor_and_bad_cursors_restart(self):
+        self.create_bookings(2, timezone.now())
+        page, cursor = keyset_page(Booking.objects.all(), page_size=2)
+        self.assertEqual((len(page), cursor), (2, None))
+        page, _ = keyset_page(Booking.objects.all(), 'not-a-cursor', page_size=2)
+        self.assertEqual(len(page), 2)
+
+
+class RidershipRollupTests(AMTSTestCase):
+    def book(self, booking_date):
+        booking = Booking.objects.create(user=self.passenger, bus_number='T1', from_stop='Gokul Park',
+                                         to_stop='Kalupur', total_amount='16.00')
+        Ticket.objects.create(booking=booking)
+        Booking.objects.filter(pk=booking.pk).update(booking_date=booking_date)
+        booking.booking_date = booking_date
+        return booking
+
+    def day_totals(self):
+        totals = RidershipRollup.objects.filter(granularity='DAY').aggregate(
+            bookings=Sum('bookings'), tickets=Sum('tickets'), revenue=Sum('revenue')
+        )
+        return totals['bookings'], totals['tickets'], totals['revenue']
+
+    def test_each_booking_is_counted_once_across_runs(self):
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        self.book(an_hour_ago)
+        self.book(an_hour_ago + timedelta(seconds=1))
+        self.assertEqual(update_rollups(batch_size=1), 2)
+        self.assertEqual(update_rollups(), 0)
+        self.assertEqual(self.day_totals(), (2, 2, Decimal('32.00')))
+
+        self.book(an_hour_ago + timedelta(minutes=5))
+        self.assertEqual(update_rollups(), 1)
+        self.assertEqual(self.day_totals(), (3, 3, Decimal('48.00')))
+        watermark = RollupWatermark.objects.get()
+        self.assertEqual(watermark.last_booking_date, an_hour_ago + timedelta(minutes=5))
+
+    @override_settings(RIDERSHIP_ROLLUP_LAG_SECONDS=120)
+    def test_bookings_inside_the_lag_wait_for_the_next_run(self):
+        booking = self.book(timezone.now())
+        self.assertEqual(update_rollups(), 0)
+        self.assertEqual(update_rollups(now=booking.booking_date + timedelta(minutes=5)), 1)
+
+
+class QRStorageTests(AMTSTestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media_root = media.name
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, BACKGROUND_TASK_MODE='worker')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        with override_settings(QR_CODE_STORAGE='files'):
+            _, self.tickets = create_booking_with_tickets(
+                self.passenger, 'T1', 'Gokul Park', 'Kalupur', '16.00', 2
+            )
+        stored = self.tickets[0]
+        stored.generate_qr_code()
+        stored.qr_status = 'READY'
+        stored.save()
+        self.stored_path = os.path.join(self.media_root, stored.qr_code.name)
+
+    def test_on_demand_is_the_default(self):
+        with override_settings():
+            del settings.QR_CODE_STORAGE
+            self.assertFalse(stores_qr_files())
+
+    def test_cleanup_clears_references_and_readies_unrendered_tickets(self):
+        self.assertTrue(os.path.exists(self.stored_path))
+        with override_settings(QR_CODE_STORAGE='on_demand'):
+            call_command('cleanup_qr_files', stdout=io.StringIO())
+
+        self.assertFalse(os.path.exists(self.stored_path))
+        self.assertFalse(Ticket.objects.exclude(qr_code='').exists())
+        self.assertEqual(set(Ticket.objects.values_list('qr_status', flat=True)), {'READY'})
+
+    def test_worker_batch_renders_pending_tickets(self):
+        pending = self.tickets[1]
+        self.assertEqual(generate_ticket_qr_codes([ticket.ticket_id for ticket in self.tickets]), 1)
+        pending.refresh_from_db()
+        self.assertEqual(pending.qr_status, 'READY')
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, pending.qr_code.name)))
+
+    def test_worker_command_renders_every_pending_ticket(self):
+        output = io.StringIO()
+        call_command('process_qr_codes', '--batch-size', '1', stdout=output)
+        self.assertIn('Rendered 1 QR codes', output.getvalue())
+        self.assertFalse(Ticket.objects.filter(qr_status='PENDING').exists())
+
+    def test_pending_ticket_stops_polling_in_on_demand_mode(self):
+        self.client.force_login(self.passenger)
+        with override_settings(QR_CODE_STORAGE='on_demand'):
+            response = self.client.get(reverse('ticket_qr_status', args=[self.tickets[1].ticket_id]))
+        self.assertEqual(response.json()['qr_status'], 'READY')
+        self.assertTrue(response.json()['qr_code'])
+
+
+class FareQuoteTests(AMTSTestCase):
+    def quote(self, passengers):
+        return self.client.get(reverse('fare_quote'), {
+            'bus': 'T1', 'from': 'Gokul Park', 'to': 'Kalupur', 'passengers': passengers
+        })
+
+    def test_total_scales_with_passengers(self):
+        one = self.quote(1).json()['fare']
+        three = self.quote(3).json()['fare']
+        self.assertEqual(float(three['total']), 3 * float(one['total']))
+
+    def test_invalid_passenger_counts_are_rejected(self):
+        for passengers in ('0', '-2', '1.5', 'many', '1000'):
+            with self.subTest(passengers=passengers):
+                self.assertEqual(self.quote(passengers).status_code, 400)
+
+    @override_settings(FARE_TABLE_CHECK_SECONDS=0)
+    def test_fare_tables_follow_the_shared_version(self):
+        self.addCleanup(invalidate_fare_tables)
+        before = quote_fare('T1', 'Gokul Park', 'Kalupur')['stops']
+        # Another process shortens the route (no signal fires here) and bumps the version
+        Bus.objects.filter(pk=self.bus.pk).update(stops=STOPS[:1] + STOPS[3:])
+        self.assertEqual(quote_fare('T1', 'Gokul Park', 'Kalupur')['stops'], before)
+        cache.set(FARE_TABLES_VERSION_KEY, 'from-another-process', None)
+        self.assertEqual(quote_fare('T1', 'Gokul Park', 'Kalupur')['stops'], 1)
+
+
+class PassVerificationTests(AMTSTestCase):
+    def setUp(self):
+        self.bus_pass = self.create_pass()
+
+    def test_passengers_cannot_look_up_passes(self):
+        self.client.force_login(self.passenger)
+        self.assertEqual(self.client.get(reverse('verify_pass', args=[self.bus_pass.pass_id])).status_code, 403)
+        response = self.client.post(
+            reverse('verify_passes'), json.dumps({'pass_ids': [str(self.bus_pass.pass_id)]}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_conductor_verifies_route_and_dates(self):
+        self.client.force_login(self.conductor)
+        response = self.client.post(
+            reverse('verify_passes'),
+            json.dumps({'pass_ids': [str(self.bus_pass.pass_id), str(uuid.uuid4())], 'bus_number': 'T2'}),
+            content_type='application/json'
+        )
+        reasons = [result['reason'] for result in response.json()['results']]
+        self.assertEqual(reasons, ['wrong_route', 'not_found'])
+
+        response = self.client.get(reverse('verify_pass', args=[self.bus_pass.pass_id]), {'bus_number': 'T1'})
+        self.assertEqual(response.json()['reason'], 'valid')
+
+    def test_snapshot_survives_pipeline_saves_but_not_validity_changes(self):
+        valid_passes.refresh()
+        self.bus_pass.pdf_status = 'READY'
+        self.bus_pass.save(update_fields=['pdf_status'])
+        self.bus_pass.email_status = 'SENT'
+        self.bus_pass.save()
+        self.assertFalse(valid_passes._is_stale())
+
+        self.bus_pass.is_approved = False
+        self.bus_pass.save()
+        self.assertTrue(valid_passes._is_stale())
+        self.assertEqual(verify_passes([self.bus_pass.pass_id])[0]['reason'], 'not_approved')
+
+    def test_ticket_verification_requires_a_conductor(self):
+        self.client.force_login(self.passenger)
+        response = self.client.post(reverse('verify_tickets'), json.dumps({'ticket_ids': [str(uuid.uuid4())]}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+
+class PassDocumentTests(AMTSTestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name, BACKGROUND_TASK_MODE='worker')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_rerender_missing_renders_every_pass_once(self):
+        passes = [self.create_pass(full_name=f'Passenger {i}', pdf_status='FAILED') for i in range(5)]
+        call_command('rerender_bus_passes', '--missing', '--workers', '2', '--chunk-size', '2',
+                     '--batch-size', '2', stdout=io.StringIO())
+        for bus_pass in passes:
+            bus_pass.refresh_from_db()
+            self.assertEqual(bus_pass.pdf_status, 'READY')
+            self.assertTrue(bus_pass.pdf_file)
+
+        output = io.StringIO()
+        call_command('rerender_bus_passes', '--missing', stdout=output)
+        self.assertIn('No passes to render', output.getvalue())
+
+    @override_settings(PASS_EMAIL_MAX_ATTEMPTS=2)
+    def test_failed_emails_are_resent_until_the_attempt_limit(self):
+        retried = self.create_pass(pdf_status='READY', pdf_file='pass_pdfs/retried.pdf',
+                                   email_status='FAILED', email_attempts=1)
+        exhausted = self.create_pass(pdf_status='READY', email_status='FAILED', email_attempts=2)
+
+        self.assertEqual(requeue_passes(), 1)
+        self.assertEqual(process_pending_passes(), 1)
+        retried.refresh_from_db()
+        self.assertEqual((retried.email_status, retried.email_attempts), ('SENT', 2))
+        self.assertEqual(len(mail.outbox), 1)
+        exhausted.refresh_from_db()
+        self.assertEqual(exhausted.email_status, 'FAILED')
+
+    def test_rerender_leaves_pipeline_passes_alone(self):
+        pending = self.create_pass()
+        processing = self.create_pass(pdf_status='PROCESSING', processing_started_at=timezone.now())
+        output = io.StringIO()
+        call_command('rerender_bus_passes', '--missing', '--workers', '1', stdout=output)
+        self.assertIn('No passes to render', output.getvalue())
+        for bus_pass, status in ((pending, 'PENDING'), (processing, 'PROCESSING')):
+            bus_pass.refresh_from_db()
+            self.assertEqual((bus_pass.pdf_status, bus_pass.email_status), (status, 'PENDING'))
+
+    @override_settings(PASS_PROCESSING_LEASE_SECONDS=600)
+    def test_requeue_leaves_passes_a_live_worker_holds(self):
+        now = timezone.now()
+        failed = self.create_pass(pdf_status='FAILED', processing_error='boom')
+        live = self.create_pass(pdf_status='PROCESSING', processing_started_at=now)
+        abandoned = self.create_pass(pdf_status='PROCESSING', processing_started_at=now - timedelta(hours=1))
+
+        self.assertEqual(requeue_passes(), 2)
+        for bus_pass, status in ((failed, 'PENDING'), (live, 'PROCESSING'), (abandoned, 'PENDING')):
+            bus_pass.refresh_from_db()
+            self.assertEqual(bus_pass.pdf_status, status)
+
+
+class PassUploadTests(AMTSTestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media_root = media.name
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def write_upload(self, name, data):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as upload:
+            upload.write(data)
+
+    def thumbnail_files(self):
+        return [name for _, _, files in os.walk(os.path.join(self.media_root, UPLOAD_ROOT, THUMBNAIL_DIR))
+                for name in files]
+
+    def test_thumbnail_is_rendered_once(self):
+        stream = io.BytesIO()
+        Image.new('RGB', (800, 600), 'white').save(stream, 'JPEG')
+        name = f'{UPLOAD_ROOT}/ab/{"ab" * 32}.jpg'
+        self.write_upload(name, stream.getvalue())
+
+        thumb_name = get_thumbnail(name, width=120)
+        with Image.open(os.path.join(self.media_root, thumb_name)) as thumbnail:
+            self.assertEqual(thumbnail.width, 120)
+        self.assertEqual(get_thumbnail(name, width=120), thumb_name)
+
+    @override_settings(PASS_UPLOAD_MAX_BYTES=1024)
+    def test_oversized_upload_is_cut_off_while_reading(self):
+        self.client.force_login(self.passenger)
+        photo = SimpleUploadedFile('photo.jpg', b'x' * 200 * 1024, content_type='image/jpeg')
+        handlers = []
+        real_limit = views.limit_upload_size
+
+        def spy(request):
+            handlers.append(real_limit(request))
+            return handlers[-1]
+
+        with mock.patch.object(views, 'limit_upload_size', spy):
+            response = self.client.post(reverse('submit_bus_pass'), {'pass_type': 'MONTHLY', 'photo': photo})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('larger than 1 KB', response.json()['message'])
+        # Reading stopped at the first chunk over the limit
+        self.assertLess(handlers[0].received, 200 * 1024)
+        self.assertFalse(BusPass.objects.exists())
+
+    @override_settings(PASS_UPLOAD_MAX_BYTES=1024, DATA_UPLOAD_MAX_MEMORY_SIZE=1024)
+    def test_oversized_request_is_rejected_unread(self):
+        self.client.force_login(self.passenger)
+        photo = SimpleUploadedFile('photo.jpg', b'x' * 64 * 1024, content_type='image/jpeg')
+        response = self.client.post(reverse('submit_bus_pass'), {'pass_type': 'MONTHLY', 'photo': photo})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('must total less than', response.json()['message'])
+
+    def test_failed_render_leaves_no_temp_file(self):
+        name = f'{UPLOAD_ROOT}/cd/{"cd" * 32}.jpg'
+        self.write_upload(name, b'not really a jpeg')
+        with self.assertRaises(Exception):
+            get_thumbnail(name, width=120)
+        self.assertEqual(self.thumbnail_files(), [])
@@ -0,0 +1,214 @@
+# my_amts/ticket_tokens.py
+
+import base64
+import hashlib
+import hmac
+import struct
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import lru_cache
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+from django.conf import settings
+
+TOKEN_VERSION = 'v2'
+SIGNATURE_BYTES = 64  # Ed25519
+# HMAC-signed tokens issued before the switch to Ed25519; verified online only
+LEGACY_TOKEN_VERSION = 'v1'
+LEGACY_SIGNATURE_BYTES = 16
+FIELD_SEPARATOR = '\x1f'
+
+
+@lru_cache(maxsize=1)
+def _signing_key(secret):
+    # Derive a dedicated key so ticket tokens can't be replayed against other SECRET_KEY uses
+    return hmac.new(secret.encode('utf-8'), b'amts.ticket-token', hashlib.sha256).digest()
+
+
+def get_signing_key():
+    return _signing_key(getattr(settings, 'TICKET_SIGNING_KEY', settings.SECRET_KEY))
+
+
+@lru_cache(maxsize=4096)
+def _route_day_key(master_key, bus_number, service_date):
+    return hmac.new(master_key, f'{bus_number}|{service_date}'.encode('utf-8'), hashlib.sha256).digest()
+
+
+def route_day_key(bus_number, service_date):
+    """HMAC key for legacy v1 tokens on one route and day; never leaves the server"""
+    return _route_day_key(get_signing_key(), bus_number, service_date.isoformat())
+
+
+@lru_cache(maxsize=4096)
+def _route_day_signing_key(master_key, bus_number, service_date):
+    seed = hmac.new(master_key, f'ed25519|{bus_number}|{service_date}'.encode('utf-8'), hashlib.sha256).digest()
+    return Ed25519PrivateKey.from_private_bytes(seed)
+
+
+def route_day_signing_key(bus_number, service_date):
+    """
+    Per-route, per-day Ed25519 key that tokens are signed with, derived from the
+    master key so every server process agrees without storing keys.
+    """
+    return _route_day_signing_key(get_signing_key(), bus_number, service_date.isoformat())
+
+
+@lru_cache(maxsize=4096)
+def _route_day_public_key(master_key, bus_number, service_date):
+    return _route_day_signing_key(master_key, bus_number, service_date).public_key()
+
+
+def route_day_public_key(bus_number, service_date):
+    """
+    Public half of route_day_signing_key. Offline verification bundles ship only
+    these, so a leaked conductor device can check tickets but never mint them.
+    """
+    return _route_day_public_key(get_signing_key(), bus_number, service_date.isoformat())
+
+
+def public_key_bytes(public_key):
+    return public_key.public_bytes(Encoding.Raw, PublicFormat.Raw)
+
+
+def token_service_date(valid_until_epoch):
+    """The (UTC) day whose key signs a token, taken from its expiry"""
+    return datetime.fromtimestamp(valid_until_epoch, tz=dt_timezone.utc).date()
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def ticket_valid_until(booking):
+    """Tickets stay valid for TICKET_VALIDITY_HOURS after booking"""
+    return booking.booking_date + timedelta(hours=getattr(settings, 'TICKET_VALIDITY_HOURS', 24))
+
+
+def sign_ticket(ticket_id, bus_number, from_stop, to_stop, valid_until):
+    """
+    Build a compact signed token: v2.<payload>.<signature>
+    payload = ticket UUID (16 bytes) + valid-until epoch (4 bytes) + bus/from/to text,
+    signed with the route's Ed25519 key for the (UTC) day the token expires
+    """
+    expires = int(valid_until.timestamp())
+    payload = (
+        uuid.UUID(str(ticket_id)).bytes
+        + struct.pack('>I', expires)
+        + FIELD_SEPARATOR.join([bus_number, from_stop, to_stop]).encode('utf-8')
+    )
+    body = _b64encode(payload)
+    signature = route_day_signing_key(bus_number, token_service_date(expires)).sign(body.encode('ascii'))
+    return f'{TOKEN_VERSION}.{body}.{_b64encode(signature)}'
+
+
+def sign_ticket_for_booking(ticket, booking):
+    return sign_ticket(
+        ticket.ticket_id,
+        booking.bus_number,
+        booking.from_stop,
+        booking.to_stop,
+        ticket_valid_until(booking)
+    )
+
+
+class RevocationList:
+    """
+    In-memory set of revoked ticket IDs, reloaded from RevokedTicket at most
+    every REVOCATION_REFRESH_SECONDS so verification never waits on the database.
+    """
+
+    def __init__(self):
+        self._revoked = frozenset()
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        from .models import RevokedTicket
+
+        revoked = frozenset(RevokedTicket.objects.values_list('ticket_id', flat=True))
+        with self._lock:
+            self._revoked = revoked
+            self._loaded_at = time.monotonic()
+
+    def _is_stale(self):
+        ttl = getattr(settings, 'REVOCATION_REFRESH_SECONDS', 30)
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > ttl
+
+    def __contains__(self, ticket_id):
+        if self._is_stale():
+            self.refresh()
+        return ticket_id in self._revoked
+
+
+revocation_list = RevocationList()
+
+
+def verify_ticket_token(token, now=None):
+    """
+    Check a ticket token's signature, expiry and revocation without touching the database
+    (apart from the periodic revocation list refresh).
+    Returns (is_valid, reason, claims).
+    """
+    try:
+        version, body, signature = token.split('.')
+    except (AttributeError, ValueError):
+        return False, 'malformed', None
+
+    if version not in (TOKEN_VERSION, LEGACY_TOKEN_VERSION):
+        return False, 'unsupported_version', None
+
+    try:
+        # Fields are only trusted once the signature over the encoded body checks out
+        payload = _b64decode(body)
+        ticket_id = uuid.UUID(bytes=payload[:16])
+        valid_until = struct.unpack('>I', payload[16:20])[0]
+        bus_number, from_stop, to_stop = payload[20:].decode('utf-8').split(FIELD_SEPARATOR)
+
+        signing_date = token_service_date(valid_until)
+        if version == TOKEN_VERSION:
+            route_day_public_key(bus_number, signing_date).verify(_b64decode(signature), body.encode('ascii'))
+        else:
+            key = route_day_key(bus_number, signing_date)
+            expected = hmac.new(key, body.encode('ascii'), hashlib.sha256).digest()[:LEGACY_SIGNATURE_BYTES]
+            if not hmac.compare_digest(expected, _b64decode(signature)):
+                return False, 'bad_signature', None
+    except InvalidSignature:
+        return False, 'bad_signature', None
+    except (ValueError, struct.error):
+        return False, 'malformed', None
+
+    claims = {
+        'ticket_id': str(ticket_id),
+        'bus_number': bus_number,
+        'from_stop': from_stop,
+        'to_stop': to_stop,
+        'valid_until': valid_until
+    }
+
+    if (now if now is not None else time.time()) > valid_until:
+        return False, 'expired', claims
+    if ticket_id in revocation_list:
+        return False, 'revoked', claims
+    return True, 'valid', claims
+
+
+def revoke_tickets(ticket_ids, reason='REFUND'):
+    """
+    Add tickets to the revocation list (e.g. on refund) and refresh this
+    process's copy once the surrounding transaction commits
+    """
+    from django.db import transaction
+    from .models import RevokedTicket
+
+    RevokedTicket.objects.bulk_create(
+        [RevokedTicket(ticket_id=ticket_id, reason=reason) for ticket_id in ticket_ids],
+        ignore_conflicts=True
+    )
+    transaction.on_commit(revocation_list.refresh)
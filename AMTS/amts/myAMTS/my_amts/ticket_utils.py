@@ -1,29 +1,12 @@
 from datetime import datetime, timedelta
-from decimal import Decimal
+from .fare_engine import get_fare_table
 
 def calculate_ticket_price(from_stop, to_stop, bus):
     """Calculate ticket price based on number of stops"""
-    stops = bus.stops
-    stop_names = [stop['name'] for stop in stops]
-    
-    try:
-        start_idx = stop_names.index(from_stop)
-        end_idx = stop_names.index(to_stop)
-        num_stops = abs(end_idx - start_idx)
-        
-        # Base price
-        base_price = Decimal('10.00')
-        
-        # Add price per stop
-        price_per_stop = Decimal('2.00')
-        total_price = base_price + (price_per_stop * num_stops)
-        
-        # Maximum price cap
-        max_price = Decimal('50.00')
-        return min(total_price, max_price)
-        
-    except ValueError:
+    table = get_fare_table(bus.bus_number)
+    if table is None:
         return None
+    return table.fare(from_stop, to_stop)
 
 def generate_ticket_validity():
     """Generate ticket validity period (24 hours from purchase)"""
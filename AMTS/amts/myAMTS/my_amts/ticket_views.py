@@ -1,10 +1,22 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
-from .models import Booking, Ticket
+from django.http import JsonResponse, HttpResponse, HttpResponseNotModified, Http404
+from django.db.models import Exists, OuterRef
+from .auth import conductor_required
+from .models import Booking, Bus, RevokedTicket, Ticket
 from .forms import BookingForm, TicketForm
+from .booking_service import create_booking_with_tickets, refund_booking
+from .fare_engine import quote_fare
+from .pagination import keyset_page
+from .pass_verification import verify_passes
+from .qr_codes import QR_FORMATS, encode_qr, mark_on_demand_ready
+from .seat_inventory import parse_travel_time
+from .ticket_tokens import verify_ticket_token
+from .verification_bundles import bundle_date_allowed, get_bundle, serialize_bundle
+from datetime import datetime
 from django.views.decorators.csrf import csrf_exempt
 import json
+import uuid
 
 @login_required
 @csrf_exempt
@@ -13,19 +25,20 @@ def book_ticket(request):
         try:
             data = json.loads(request.body) if request.body else request.POST
 
-            # Create booking
+            # Create booking, priced on the server rather than from total_amount
+            quote = quote_fare(data.get('bus_number'), data.get('from_stop'), data.get('to_stop'))
             booking_data = {
-                'bus_number': data.get('bus_number'),
-                'from_stop': data.get('from_stop'),
-                'to_stop': data.get('to_stop'),
-                'total_amount': float(data.get('total_amount', 0)),
+                'bus_number': quote['bus_number'],
+                'from_stop': quote['from_stop'],
+                'to_stop': quote['to_stop'],
+                'total_amount': quote['total'],
                 'user': request.user  # Add the user to the booking
             }
             
-            booking = Booking.objects.create(**booking_data)
-            
-            # Create single ticket without passenger info
-            ticket = Ticket.objects.create(booking=booking)
+            # Create booking with a single ticket without passenger info
+            booking, tickets = create_booking_with_tickets(
+                travel_time=parse_travel_time(data.get('travel_time')), **booking_data
+            )
             
             return JsonResponse({
                 'status': 'success',
@@ -44,32 +57,269 @@ def book_ticket(request):
         'message': 'Invalid request method'
     })
 
+@login_required
+@csrf_exempt
+def refund_booking_view(request, booking_id):
+    """Refund one of the user's bookings: its tickets are revoked and its seats released"""
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=400)
+
+    booking = get_object_or_404(Booking, booking_id=booking_id, user=request.user)
+    if not refund_booking(booking):
+        return JsonResponse({'status': 'error', 'message': 'Booking is not refundable'}, status=400)
+
+    return JsonResponse({
+        'status': 'success',
+        'booking_id': str(booking.booking_id),
+        'message': 'Booking refunded'
+    })
+
 @login_required
 def ticket_list(request):
-    # Get all bookings for the current user
-    bookings = Booking.objects.all().order_by('-booking_date')
-    return render(request, 'my_amts/ticket_list.html', {'bookings': bookings})
+    # Get a page of bookings for the current user, with their tickets in one extra query
+    bookings, next_cursor = keyset_page(
+        Booking.objects.filter(user=request.user).prefetch_related('tickets'),
+        cursor=request.GET.get('cursor')
+    )
+    return render(request, 'my_amts/tickets/ticket_list.html', {
+        'bookings': bookings,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor')
+    })
 
 @login_required
 def ticket_detail(request, ticket_id):
     # Get the ticket and verify it belongs to the current user
     ticket = get_object_or_404(Ticket, ticket_id=ticket_id, booking__user=request.user)
+    mark_on_demand_ready(ticket)
     return render(request, 'my_amts/ticket_detail.html', {'ticket': ticket})
 
 @login_required
+def ticket_qr_status(request, ticket_id):
+    ticket = get_object_or_404(Ticket, ticket_id=ticket_id, booking__user=request.user)
+    mark_on_demand_ready(ticket)
+    return JsonResponse({
+        'status': 'success',
+        'ticket_id': str(ticket.ticket_id),
+        'qr_status': ticket.qr_status,
+        'qr_code': ticket.qr_image_url if ticket.qr_status == 'READY' else None
+    })
+
+@login_required
+def ticket_qr(request, ticket_id, fmt='png'):
+    """
+    Render a ticket's QR code on demand as PNG or SVG.
+    The image never changes for a ticket, so it is served with a long-lived
+    private cache lifetime and an ETag; encoded bytes are cached in memory.
+    """
+    if fmt not in QR_FORMATS:
+        raise Http404('Unsupported QR format')
+
+    ticket = get_object_or_404(
+        Ticket.objects.select_related('booking'),
+        ticket_id=ticket_id,
+        booking__user=request.user
+    )
+
+    etag = f'"qr-{ticket.ticket_id}-{fmt}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(encode_qr(ticket.qr_payload(), fmt), content_type=QR_FORMATS[fmt][0])
+
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+@csrf_exempt
+def verify_ticket_token_view(request):
+    """
+    Verify a signed ticket token scanned from a QR code.
+    Pure CPU check: signature, expiry and the in-memory revocation list.
+    """
+    if request.method == 'POST':
+        if request.content_type == 'application/json':
+            try:
+                token = json.loads(request.body).get('token')
+            except (ValueError, AttributeError):
+                token = None
+        else:
+            token = request.POST.get('token')
+    else:
+        token = request.GET.get('token')
+
+    if not token:
+        return JsonResponse({'status': 'error', 'message': 'Token is required'}, status=400)
+
+    is_valid, reason, claims = verify_ticket_token(token)
+    return JsonResponse({
+        'status': 'success',
+        'is_valid': is_valid,
+        'reason': reason,
+        'ticket': claims
+    })
+
+@login_required
+@conductor_required
+def verification_bundle(request, bus_number, service_date):
+    """
+    Offline verification bundle for conductors: route public keys plus revoked
+    ticket IDs. ?since=<version> returns only revocations added after that version;
+    the ETag lets devices skip the download entirely when nothing changed.
+    The keys can't sign tickets, but the revocation list is only for conductors.
+    """
+    try:
+        service_date = datetime.strptime(service_date, '%Y-%m-%d').date()
+        since = request.GET.get('since')
+        since = int(since) if since is not None else None
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid date or version'}, status=400)
+
+    if not bundle_date_allowed(service_date):
+        return JsonResponse({'status': 'error', 'message': 'No bundle is available for that date'}, status=400)
+    if not Bus.objects.filter(bus_number=bus_number).exists():
+        return JsonResponse({'status': 'error', 'message': 'Bus not found'}, status=404)
+
+    bundle = get_bundle(bus_number, service_date)
+
+    etag = f'"bundle-{bundle.bus_number}-{bundle.service_date}-v{bundle.version}-s{since}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = JsonResponse({'status': 'success', 'bundle': serialize_bundle(bundle, since)})
+
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _ticket_summary(ticket):
+    return {
+        'ticket_id': str(ticket.ticket_id),
+        'bus_number': ticket.booking.bus_number,
+        'from_stop': ticket.booking.from_stop,
+        'to_stop': ticket.booking.to_stop,
+        'booking_date': ticket.booking.booking_date.strftime('%Y-%m-%d %H:%M'),
+        'payment_status': ticket.booking.payment_status
+    }
+
+def _tickets_for_verification():
+    """Tickets with their booking and whether they were revoked, in one query"""
+    return Ticket.objects.select_related('booking').annotate(
+        is_revoked=Exists(RevokedTicket.objects.filter(ticket_id=OuterRef('ticket_id')))
+    )
+
+def _ticket_validity(ticket):
+    """(is_valid, reason), agreeing with the signed-token check on revoked tickets"""
+    if ticket.is_revoked:
+        return False, 'revoked'
+    if ticket.booking.payment_status != 'COMPLETED':
+        return False, 'payment_incomplete'
+    return True, 'valid'
+
+@login_required
+@conductor_required
 def verify_ticket(request, ticket_id):
-    ticket = get_object_or_404(Ticket, ticket_id=ticket_id)
-    is_valid = ticket.booking.payment_status == 'COMPLETED'
+    ticket = get_object_or_404(_tickets_for_verification(), ticket_id=ticket_id)
+    is_valid, reason = _ticket_validity(ticket)
     
     return JsonResponse({
         'status': 'success',
         'is_valid': is_valid,
-        'ticket': {
-            'ticket_id': str(ticket.ticket_id),
-            'bus_number': ticket.booking.bus_number,
-            'from_stop': ticket.booking.from_stop,
-            'to_stop': ticket.booking.to_stop,
-            'booking_date': ticket.booking.booking_date.strftime('%Y-%m-%d %H:%M'),
-            'payment_status': ticket.booking.payment_status
-        }
-    }) 
\ No newline at end of file
+        'reason': reason,
+        'ticket': _ticket_summary(ticket)
+    })
+
+MAX_BATCH_VERIFY = 200
+
+@login_required
+@conductor_required
+@csrf_exempt
+def verify_tickets(request):
+    """
+    Verify a batch of tickets (e.g. an inspector checking a full bus) with a
+    single Ticket+Booking query (revocations included) instead of one
+    verify_ticket call per passenger.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=400)
+
+    try:
+        data = json.loads(request.body) if request.body else {}
+        ticket_ids = [uuid.UUID(str(ticket_id)) for ticket_id in data.get('ticket_ids', [])]
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'status': 'error', 'message': 'ticket_ids must be a list of ticket IDs'}, status=400)
+
+    if not ticket_ids:
+        return JsonResponse({'status': 'error', 'message': 'ticket_ids is required'}, status=400)
+    if len(ticket_ids) > MAX_BATCH_VERIFY:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'At most {MAX_BATCH_VERIFY} tickets can be verified per request'
+        }, status=400)
+
+    tickets = {
+        ticket.ticket_id: ticket
+        for ticket in _tickets_for_verification().filter(ticket_id__in=ticket_ids)
+    }
+
+    results = []
+    for ticket_id in ticket_ids:
+        ticket = tickets.get(ticket_id)
+        if ticket is None:
+            results.append({'ticket_id': str(ticket_id), 'is_valid': False, 'reason': 'not_found'})
+            continue
+        is_valid, reason = _ticket_validity(ticket)
+        results.append({
+            'ticket_id': str(ticket_id),
+            'is_valid': is_valid,
+            'reason': reason,
+            'ticket': _ticket_summary(ticket)
+        })
+
+    return JsonResponse({
+        'status': 'success',
+        'valid_count': sum(1 for result in results if result['is_valid']),
+        'results': results
+    })
+
+@login_required
+@conductor_required
+def verify_pass(request, pass_id):
+    """
+    Check a bus pass on board: approval, validity dates and, with ?bus_number=,
+    whether it covers the route.
+    """
+    result = verify_passes([pass_id], request.GET.get('bus_number'))[0]
+    if result['reason'] == 'not_found':
+        return JsonResponse({'status': 'error', 'message': 'Bus pass not found'}, status=404)
+
+    return JsonResponse({'status': 'success', **result})
+
+@login_required
+@conductor_required
+@csrf_exempt
+def verify_passes_view(request):
+    """Verify a batch of bus passes (POST {"pass_ids": [...], "bus_number": ...})"""
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=400)
+
+    try:
+        data = json.loads(request.body) if request.body else {}
+        pass_ids = [uuid.UUID(str(pass_id)) for pass_id in data.get('pass_ids', [])]
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'status': 'error', 'message': 'pass_ids must be a list of pass IDs'}, status=400)
+
+    if not pass_ids:
+        return JsonResponse({'status': 'error', 'message': 'pass_ids is required'}, status=400)
+    if len(pass_ids) > MAX_BATCH_VERIFY:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'At most {MAX_BATCH_VERIFY} passes can be verified per request'
+        }, status=400)
+
+    results = verify_passes(pass_ids, data.get('bus_number'))
+    return JsonResponse({
+        'status': 'success',
+        'valid_count': sum(1 for result in results if result['is_valid']),
+        'results': results
+    })
@@ -12,10 +12,21 @@ urlpatterns = [
     path('api/search/', views.search_buses, name='search_buses'),
     path('api/buses/<str:bus_number>/active/', views.get_active_buses, name='active_buses'),
     path('api/update-bus-status/', views.update_bus_status, name='update_bus_status'),
+    path('api/update-bus-positions/', views.update_bus_positions, name='update_bus_positions'),
     path('book-ticket/', ticket_views.book_ticket, name='book_ticket'),
+    path('api/booking/<uuid:booking_id>/refund/', ticket_views.refund_booking_view, name='refund_booking'),
     path('tickets/', ticket_views.ticket_list, name='ticket_list'),
     path('ticket/<uuid:ticket_id>/', ticket_views.ticket_detail, name='ticket_detail'),
+    path('api/ticket/<uuid:ticket_id>/qr-status/', ticket_views.ticket_qr_status, name='ticket_qr_status'),
+    path('ticket/<uuid:ticket_id>/qr.<str:fmt>', ticket_views.ticket_qr, name='ticket_qr'),
     path('verify-ticket/<uuid:ticket_id>/', ticket_views.verify_ticket, name='verify_ticket'),
+    path('api/verify-tickets/', ticket_views.verify_tickets, name='verify_tickets'),
+    path('api/verify-token/', ticket_views.verify_ticket_token_view, name='verify_ticket_token'),
+    path('api/verify-pass/<uuid:pass_id>/', ticket_views.verify_pass, name='verify_pass'),
+    path('api/verify-passes/', ticket_views.verify_passes_view, name='verify_passes'),
+    path('api/verification-bundle/<str:bus_number>/<str:service_date>/', ticket_views.verification_bundle, name='verification_bundle'),
+    path('api/fare/', views.fare_quote, name='fare_quote'),
+    path('api/seats/', views.seat_availability, name='seat_availability'),
     path('api/create-booking/', views.create_booking, name='create_booking'),
     path('my-bookings/', views.my_bookings, name='my_bookings'),
     path('api/nearby-stops/', views.get_nearby_stops, name='nearby_stops'),
@@ -23,9 +34,14 @@ urlpatterns = [
     path('available-buses/', views.get_available_buses, name='available_buses'),
     path('api/notify-accident-passengers/', views.notify_accident_passengers, name='notify_accident_passengers'),
     path('api/emergency-accident/', views.emergency_accident_alert, name='emergency_accident_alert'),
+    path('api/emergency/<uuid:notification_id>/status/', views.emergency_incident_status, name='emergency_incident_status'),
     path('emergency-dashboard/', views.emergency_dashboard, name='emergency_dashboard'),
+    path('api/headway-alerts/', views.headway_alerts, name='headway_alerts'),
+    path('api/ridership/', views.ridership, name='ridership'),
     path('bus-pass/monthly/', views.monthly_pass_form, name='monthly_pass'),
     path('bus-pass/student/', views.student_pass_form, name='student_pass'),
     path('api/submit-bus-pass/', views.submit_bus_pass, name='submit_bus_pass'),
+    path('api/bus-pass/<uuid:pass_id>/status/', views.bus_pass_status, name='bus_pass_status'),
+    path('bus-pass/<uuid:pass_id>/<str:field>/thumbnail/', views.bus_pass_thumbnail, name='bus_pass_thumbnail'),
     path('my-passes/', views.my_passes, name='my_passes'),
 ]
\ No newline at end of file
@@ -0,0 +1,161 @@
+# my_amts/verification_bundles.py
+
+import base64
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.utils import timezone
+from .models import Bus, RevokedTicket, Ticket, VerificationBundle
+from .ticket_tokens import (
+    SIGNATURE_BYTES, TOKEN_VERSION, public_key_bytes, route_day_public_key, token_service_date
+)
+
+# Revoked tickets are shipped as the first 8 bytes of their UUID: exact enough that a
+# collision is negligible, and unlike a Bloom filter it never rejects a valid ticket
+ID_PREFIX_HEX = 16
+
+
+def id_prefix(ticket_id):
+    return ticket_id.hex[:ID_PREFIX_HEX]
+
+
+def service_day_bounds(service_date):
+    """Local start and end of a service day"""
+    start = timezone.make_aware(datetime.combine(service_date, time.min))
+    return start, start + timedelta(days=1)
+
+
+def booking_window(service_date):
+    """Bookings whose tickets are still valid at some point during the service day"""
+    start, end = service_day_bounds(service_date)
+    validity = timedelta(hours=getattr(settings, 'TICKET_VALIDITY_HOURS', 24))
+    return start - validity, end
+
+
+def bundle_keys(bus_number, service_date):
+    """Route public keys for every (UTC) signing day a token checked on this service day can carry"""
+    start, end = service_day_bounds(service_date)
+    validity = timedelta(hours=getattr(settings, 'TICKET_VALIDITY_HOURS', 24))
+    first = token_service_date(start.timestamp())
+    last = token_service_date((end + validity).timestamp())
+
+    keys = {}
+    day = first
+    while day <= last:
+        public_key = public_key_bytes(route_day_public_key(bus_number, day))
+        keys[day.isoformat()] = base64.b64encode(public_key).decode('ascii')
+        day += timedelta(days=1)
+    return keys
+
+
+def build_bundles(service_date, bus_numbers=None, now=None):
+    """
+    Incrementally refresh the bundles for a service day.
+    Only revocations newer than each bundle's high-water mark are queried (one
+    joined query for all routes); a bundle's version is bumped only when it changes.
+    The mark only advances to VERIFICATION_BUNDLE_LAG_SECONDS ago, so a revocation
+    stamped before a build but committed after it is still picked up next time.
+    Returns the number of bundles that changed.
+    """
+    if bus_numbers is None:
+        bus_numbers = list(Bus.objects.values_list('bus_number', flat=True))
+
+    bundles = {
+        bundle.bus_number: bundle
+        for bundle in VerificationBundle.objects.filter(service_date=service_date, bus_number__in=bus_numbers)
+    }
+    missing = [
+        VerificationBundle(bus_number=bus_number, service_date=service_date)
+        for bus_number in bus_numbers if bus_number not in bundles
+    ]
+    if missing:
+        # Another request may be creating the same bundles; keep whichever row won
+        VerificationBundle.objects.bulk_create(missing, ignore_conflicts=True)
+        bundles = {
+            bundle.bus_number: bundle
+            for bundle in VerificationBundle.objects.filter(service_date=service_date, bus_number__in=bus_numbers)
+        }
+    if not bundles:
+        return 0
+
+    now = now or timezone.now()
+    high_water = now - timedelta(seconds=getattr(settings, 'VERIFICATION_BUNDLE_LAG_SECONDS', 120))
+
+    # Every bundle for the day is refreshed together, so they share the oldest mark
+    marks = [bundle.revoked_through for bundle in bundles.values()]
+    since = None if any(mark is None for mark in marks) else min(marks)
+
+    revoked = RevokedTicket.objects.filter(revoked_at__lte=high_water)
+    if since is not None:
+        revoked = revoked.filter(revoked_at__gt=since)
+
+    window_start, window_end = booking_window(service_date)
+    rows = Ticket.objects.filter(
+        ticket_id__in=revoked.values('ticket_id'),
+        booking__bus_number__in=list(bundles.keys()),
+        booking__booking_date__gte=window_start,
+        booking__booking_date__lt=window_end
+    ).values_list('ticket_id', 'booking__bus_number')
+
+    additions = {}
+    for ticket_id, bus_number in rows:
+        additions.setdefault(bus_number, set()).add(id_prefix(ticket_id))
+
+    changed = 0
+    for bus_number, bundle in bundles.items():
+        new_prefixes = additions.get(bus_number, set()) - bundle.revoked_entries.keys()
+        if new_prefixes:
+            bundle.version += 1
+            for prefix in new_prefixes:
+                bundle.revoked_entries[prefix] = bundle.version
+            changed += 1
+        bundle.revoked_through = high_water
+        # bulk_update bypasses auto_now
+        bundle.generated_at = now
+
+    VerificationBundle.objects.bulk_update(
+        bundles.values(), ['version', 'revoked_entries', 'revoked_through', 'generated_at']
+    )
+    return changed
+
+
+def bundle_date_allowed(service_date):
+    """Bundles are served from yesterday up to VERIFICATION_BUNDLE_DAYS_AHEAD days ahead"""
+    today = timezone.localdate()
+    days_ahead = getattr(settings, 'VERIFICATION_BUNDLE_DAYS_AHEAD', 7)
+    return today - timedelta(days=1) <= service_date <= today + timedelta(days=days_ahead)
+
+
+def get_bundle(bus_number, service_date):
+    """Bundle for an existing route; built on first request"""
+    bundle = VerificationBundle.objects.filter(bus_number=bus_number, service_date=service_date).first()
+    if bundle is None:
+        build_bundles(service_date, [bus_number])
+        bundle = VerificationBundle.objects.get(bus_number=bus_number, service_date=service_date)
+    return bundle
+
+
+def serialize_bundle(bundle, since=None):
+    """Bundle payload; with since, revoked IDs are limited to those added after that version"""
+    full = since is None or since > bundle.version
+    revoked = sorted(
+        prefix for prefix, version in bundle.revoked_entries.items()
+        if full or version > since
+    )
+    return {
+        'bus_number': bundle.bus_number,
+        'service_date': bundle.service_date.isoformat(),
+        'version': bundle.version,
+        'generated_at': bundle.generated_at.strftime('%Y-%m-%d %H:%M:%S'),
+        'token': {
+            'version': TOKEN_VERSION,
+            'algorithm': 'Ed25519',
+            'signature_bytes': SIGNATURE_BYTES,
+            'keys': bundle_keys(bundle.bus_number, bundle.service_date)
+        },
+        'revoked': {
+            'encoding': f'uuid-hex-prefix-{ID_PREFIX_HEX}',
+            'full': full,
+            'since': None if full else since,
+            'ids': revoked
+        }
+    }
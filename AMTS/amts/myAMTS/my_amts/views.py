@@ -1,15 +1,30 @@
-from django.shortcuts import render, redirect
-from django.http import JsonResponse, FileResponse
+from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.http import JsonResponse, FileResponse, Http404, HttpResponseNotModified
+from django.conf import settings
+from django.db.models import Prefetch
 from django.views.decorators.csrf import csrf_exempt  # Temporary for testing
-from .models import Bus, ActiveBus, Booking, Ticket, SearchHistory, BusPass
+from .models import Bus, ActiveBus, Booking, Ticket, SearchHistory, BusPass, HeadwayAlert, AccidentNotification
 from .route_finder import RouteFinder
+from .stop_geofence import apply_position, mark_reporting, record_speed, snap_fleet
+from .booking_service import create_booking_with_tickets, parse_passenger_count
+from .fare_engine import get_pass_routes, price_itineraries, quote_fare
+from .notification_outbox import IncidentLockTimeout
+from .pagination import keyset_page
+from .ridership import GROUPINGS, ridership_summary
+from .seat_inventory import SeatsUnavailable, parse_travel_time, seats_available, trip_departure
+from .pass_documents import enqueue_pass_processing
+from .pass_uploads import UPLOAD_FIELDS, UploadRejected, get_thumbnail, limit_upload_size, store_pass_uploads
 from datetime import datetime, timedelta
+from django.utils import timezone
+from decimal import Decimal
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth.forms import UserCreationForm
 from .forms import UserRegistrationForm
 import json
+import os
 from math import radians, sin, cos, sqrt, atan2
 
 def home(request):
@@ -153,6 +168,9 @@ def search_buses(request):
             routes = route_finder.find_all_routes(from_location, to_location)
             
             print(f"Found {len(routes)} routes")  # Debug log
+
+            # Price every itinerary up front so results show fares without a second request
+            price_itineraries(routes, get_pass_routes(request.user))
             
             if not routes:
                 return JsonResponse({
@@ -259,6 +277,7 @@ def get_active_buses(request, bus_number):
                     defaults={
                         'bus': bus,
                         'current_location': initial_location,
+                        'stop_index': start_idx,
                         'status': 'ON_TIME',
                         'speed': 45.0,
                         'is_active': True
@@ -268,12 +287,14 @@ def get_active_buses(request, bus_number):
                 active_buses_data.append({
                     "id": bus_instance.identifier,
                     "current_location": bus_instance.current_location,
+                    "stop_index": bus_instance.stop_index,
                     "status": bus_instance.status,
                     "direction": "forward" if is_forward_journey else "reverse",
                     "last_updated": bus_instance.last_updated.strftime("%I:%M %p"),
                     "speed": bus_instance.speed,
                     "is_manual_stop": bus_instance.is_manual_stop,
-                    "is_accident": bus_instance.is_accident
+                    "is_accident": bus_instance.is_accident,
+                    "is_stalled": bus_instance.is_stalled
                 })
             
             # Replace the hardcoded list with our DB data
@@ -305,10 +326,15 @@ def update_bus_status(request):
             
             # Find the bus
             bus = ActiveBus.objects.get(identifier=bus_id)
+            mark_reporting(bus)
             
             # Update fields if present
             if 'speed' in data:
-                bus.speed = float(data['speed'])
+                record_speed(bus, data['speed'])
+            
+            # Snap GPS fixes to the nearest stop on the route
+            if data.get('latitude') is not None and data.get('longitude') is not None:
+                apply_position(bus, data['latitude'], data['longitude'])
             
             if 'is_manual_stop' in data:
                 bus.is_manual_stop = data['is_manual_stop']
@@ -332,6 +358,78 @@ def update_bus_status(request):
             
     return JsonResponse({'status': 'error', 'message': 'Invalid method'}, status=400)
 
+@csrf_exempt
+def update_bus_positions(request):
+    """Batch telemetry endpoint: snap GPS fixes for many buses to their route stops"""
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            positions = {
+                item['bus_id']: (float(item['latitude']), float(item['longitude']), item.get('speed'))
+                for item in data.get('positions', [])
+            }
+            
+            result = snap_fleet(positions)
+            
+            return JsonResponse({'status': 'success', **result})
+        except (KeyError, TypeError, ValueError) as e:
+            return JsonResponse({'status': 'error', 'message': f'Invalid position data: {str(e)}'}, status=400)
+        except Exception as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+            
+    return JsonResponse({'status': 'error', 'message': 'Invalid method'}, status=400)
+
+
+def fare_quote(request):
+    """Look up the fare between two stops: /api/fare/?bus=&from=&to=[&passengers=]"""
+    if request.method != 'GET':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=400)
+
+    bus_number = request.GET.get('bus')
+    from_stop = request.GET.get('from')
+    to_stop = request.GET.get('to')
+    if not all([bus_number, from_stop, to_stop]):
+        return JsonResponse({'status': 'error', 'message': 'bus, from and to are required'}, status=400)
+
+    try:
+        passenger_count = parse_passenger_count(request.GET.get('passengers', 1))
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    try:
+        quote = quote_fare(bus_number, from_stop, to_stop, passenger_count)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=404)
+
+    return JsonResponse({
+        'status': 'success',
+        'fare': {
+            key: str(value) if isinstance(value, Decimal) else value
+            for key, value in quote.items()
+        }
+    })
+
+def seat_availability(request):
+    """Seats left on a departure of a route: /api/seats/?bus=[&travel_time=YYYY-MM-DDTHH:MM] (default now)"""
+    bus_number = request.GET.get('bus')
+    if not bus_number:
+        return JsonResponse({'status': 'error', 'message': 'bus is required'}, status=400)
+
+    try:
+        travel_time = parse_travel_time(request.GET.get('travel_time'))
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    available = seats_available(bus_number, travel_time)
+    if available is None:
+        return JsonResponse({'status': 'error', 'message': f'Unknown bus route: {bus_number}'}, status=404)
+
+    return JsonResponse({
+        'status': 'success',
+        'bus_number': bus_number,
+        'departure': trip_departure(travel_time).strftime('%Y-%m-%d %H:%M'),
+        'seats_available': available
+    })
 
 @csrf_exempt
 @login_required
@@ -363,45 +461,55 @@ def create_booking(request):
                     'message': 'Invalid CVV'
                 })
 
-            # Get the total amount from the form data
-            total_amount = request.POST.get('totalAmount')
-            if not total_amount:
+            # Price the booking on the server; the client's totalAmount is display only
+            bus_number = request.POST.get('bookingBusNumber')
+            from_stop = request.POST.get('bookingFromStop')
+            to_stop = request.POST.get('bookingToStop')
+            try:
+                passenger_count = parse_passenger_count(request.POST.get('passengerCount', 1))
+                quote = quote_fare(bus_number, from_stop, to_stop, passenger_count)
+                travel_time = parse_travel_time(request.POST.get('travelTime'))
+            except ValueError as e:
                 return JsonResponse({
                     'status': 'error',
-                    'message': 'Total amount is required'
+                    'message': str(e)
                 })
 
-            # Remove the ₹ symbol and convert to float
-            total_amount = float(total_amount.replace('₹', '').strip())
-
-            # Create booking
-            booking = Booking.objects.create(
-                user=request.user,
-                bus_number=request.POST.get('bookingBusNumber'),
-                from_stop=request.POST.get('bookingFromStop'),
-                to_stop=request.POST.get('bookingToStop'),
-                total_amount=total_amount
-            )
+            # Create the booking and all passenger tickets in one transaction.
+            # QR images are rendered in the background; clients poll ticket_qr_status
+            try:
+                booking, created_tickets = create_booking_with_tickets(
+                    user=request.user,
+                    bus_number=bus_number,
+                    from_stop=from_stop,
+                    to_stop=to_stop,
+                    total_amount=quote['total'],
+                    passenger_count=passenger_count,
+                    travel_time=travel_time
+                )
+            except SeatsUnavailable as e:
+                return JsonResponse({
+                    'status': 'error',
+                    'message': str(e)
+                }, status=409)
 
-            # Create tickets for the number of passengers
             tickets = []
-            passenger_count = int(request.POST.get('passengerCount', 1))
-            for i in range(passenger_count):
-                ticket = Ticket.objects.create(
-                    booking=booking
-                )
+            for ticket in created_tickets:
                 tickets.append({
                     'ticket_id': str(ticket.ticket_id),
                     'bus_number': booking.bus_number,
                     'from_stop': booking.from_stop,
                     'to_stop': booking.to_stop,
                     'date': booking.booking_date.strftime('%Y-%m-%d %H:%M'),
-                    'qr_code': ticket.qr_code.url if ticket.qr_code else None
+                    'qr_code': ticket.qr_image_url if ticket.qr_status == 'READY' else None,
+                    'qr_status': ticket.qr_status,
+                    'token': ticket.signed_token()
                 })
 
             return JsonResponse({
                 'status': 'success',
                 'booking_id': str(booking.booking_id),
+                'total_amount': str(booking.total_amount),
                 'tickets': tickets
             })
 
@@ -419,8 +527,17 @@ def create_booking(request):
 
 @login_required
 def my_bookings(request):
-    bookings = Booking.objects.filter(user=request.user).order_by('-booking_date')
-    return render(request, 'my_amts/my_bookings.html', {'bookings': bookings})
+    bookings, next_cursor = keyset_page(
+        Booking.objects.filter(user=request.user).prefetch_related(
+            Prefetch('tickets', queryset=Ticket.objects.only('ticket_id', 'booking_id'))
+        ),
+        cursor=request.GET.get('cursor')
+    )
+    return render(request, 'my_amts/my_bookings.html', {
+        'bookings': bookings,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor')
+    })
 
 def calculate_distance(lat1, lon1, lat2, lon2):
     """Calculate the Haversine distance between two points"""
@@ -579,6 +696,12 @@ def get_available_buses(request):
             'message': str(e)
         }, status=500)
 
+def alert_busy_response(error):
+    """503 asking the client to resend an alert that couldn't get the bus's accident lock"""
+    response = JsonResponse({'status': 'error', 'message': f'{error}; please retry'}, status=503)
+    response['Retry-After'] = '1'
+    return response
+
 @csrf_exempt
 def notify_accident_passengers(request):
     """Enhanced Emergency Accident Notification System"""
@@ -619,33 +742,34 @@ def notify_accident_passengers(request):
             from .emergency_notifications import EmergencyNotificationSystem
             
             emergency_system = EmergencyNotificationSystem()
-            notification_result = emergency_system.send_emergency_emails(
-                bus_number=bus_number,
-                latitude=latitude,
-                longitude=longitude,
-                accident_location=accident_location
-            )
+            try:
+                notification_result = emergency_system.queue_emergency_notifications(
+                    bus_number=bus_number,
+                    latitude=latitude,
+                    longitude=longitude,
+                    accident_location=accident_location
+                )
+            except IncidentLockTimeout as e:
+                return alert_busy_response(e)
+            incident = notification_result['incident']
             
-            if notification_result['status'] == 'success':
-                return JsonResponse({
-                    'status': 'success',
-                    'message': 'Emergency notifications sent successfully',
-                    'bus_status': 'ACCIDENT_DETECTED',
-                    'location_frozen': True,
-                    'notifications': {
-                        'total_emails_sent': notification_result['emails_sent'],
-                        'affected_passengers': notification_result['affected_passengers'],
-                        'family_alerts': notification_result['family_alerts'],
-                        'helpline_alerts': notification_result['helpline_alerts'],
-                        'failed_emails': notification_result['failed_emails']
-                    },
-                    'accident_details': notification_result['accident_details']
-                })
-            else:
-                return JsonResponse({
-                    'status': 'error',
-                    'message': f"Emergency notification failed: {notification_result.get('message', 'Unknown error')}"
-                }, status=500)
+            return JsonResponse({
+                'status': 'success',
+                'message': 'Emergency notifications queued for delivery',
+                'bus_status': 'ACCIDENT_DETECTED',
+                'location_frozen': True,
+                'incident_id': str(incident.pk),
+                'status_url': reverse('emergency_incident_status', args=[incident.pk]),
+                'coalesced': notification_result['coalesced'],
+                'alert_count': incident.alert_count,
+                'notifications': {
+                    'emails_queued': notification_result['emails_queued'],
+                    'sms_queued': notification_result['sms_queued'],
+                    'affected_passengers': notification_result['affected_passengers'],
+                    'helpline_alerts': notification_result['helpline_alerts']
+                },
+                'accident_details': notification_result['accident_details']
+            }, status=202)
             
         except Exception as e:
             print(f"Error in emergency notification: {str(e)}")
@@ -659,6 +783,82 @@ def notify_accident_passengers(request):
         'message': 'Invalid request method'
     }, status=400)
 
+def headway_alerts(request):
+    """Open bunching / long-gap alerts, optionally filtered by ?bus=<bus_number>"""
+    try:
+        alerts = HeadwayAlert.objects.filter(is_resolved=False).select_related('bus')
+        bus_number = request.GET.get('bus')
+        if bus_number:
+            alerts = alerts.filter(bus__bus_number=bus_number)
+        
+        return JsonResponse({
+            'status': 'success',
+            'alerts': [{
+                'bus_number': alert.bus.bus_number,
+                'direction': alert.direction,
+                'alert_type': alert.alert_type,
+                'leading_bus': alert.leading_bus,
+                'following_bus': alert.following_bus,
+                'gap_km': alert.gap_km,
+                'headway_minutes': alert.headway_minutes,
+                'detected_at': alert.detected_at.strftime('%Y-%m-%d %H:%M:%S')
+            } for alert in alerts]
+        })
+    except Exception as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e)
+        }, status=500)
+
+@login_required
+def ridership(request):
+    """
+    Ridership from the rollup tables.
+    ?start=&end= (YYYY-MM-DD, default the last 7 days), ?granularity=day|hour,
+    ?group_by=period|bus|od|stop, optional ?bus=, ?from_stop=, ?to_stop= filters.
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'status': 'error', 'message': 'Staff access required'}, status=403)
+
+    try:
+        today = timezone.localdate()
+        start = request.GET.get('start')
+        end = request.GET.get('end')
+        end_date = datetime.strptime(end, '%Y-%m-%d').date() if end else today
+        start_date = datetime.strptime(start, '%Y-%m-%d').date() if start else end_date - timedelta(days=6)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Dates must be in YYYY-MM-DD format'}, status=400)
+
+    granularity = request.GET.get('granularity', 'day').upper()
+    group_by = request.GET.get('group_by', 'period')
+    if granularity not in ('DAY', 'HOUR') or group_by not in GROUPINGS:
+        return JsonResponse({
+            'status': 'error',
+            'message': f"granularity must be day or hour and group_by one of {', '.join(GROUPINGS)}"
+        }, status=400)
+
+    rows = ridership_summary(
+        start_date, end_date,
+        granularity=granularity,
+        group_by=group_by,
+        bus_number=request.GET.get('bus'),
+        from_stop=request.GET.get('from_stop'),
+        to_stop=request.GET.get('to_stop')
+    )
+    for row in rows:
+        row['total_revenue'] = f"{row['total_revenue']:.2f}"
+        if 'period_start' in row:
+            row['period_start'] = timezone.localtime(row['period_start']).strftime('%Y-%m-%d %H:%M')
+
+    return JsonResponse({
+        'status': 'success',
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'granularity': granularity,
+        'group_by': group_by,
+        'rows': rows
+    })
+
 # Bus Pass Views
 @login_required
 def monthly_pass_form(request):
@@ -673,8 +873,14 @@ def student_pass_form(request):
 @login_required
 @csrf_exempt
 def submit_bus_pass(request):
-    """Handle bus pass form submission and generate PDF"""
+    """Handle bus pass form submission and queue its PDF"""
     if request.method == 'POST':
+        # Oversized uploads are cut off while the body is read, not after it is buffered
+        try:
+            limit_upload_size(request).check()
+        except UploadRejected as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
         try:
             pass_type = request.POST.get('pass_type').upper()
             
@@ -693,6 +899,12 @@ def submit_bus_pass(request):
             # Get email from form
             pass_email = request.POST.get('email')
             
+            # Stream uploaded documents to content-addressed storage
+            try:
+                uploads = store_pass_uploads(request.FILES)
+            except UploadRejected as e:
+                return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+            
             # Create bus pass record
             bus_pass = BusPass.objects.create(
                 user=request.user,
@@ -710,23 +922,19 @@ def submit_bus_pass(request):
                 student_id=request.POST.get('student_id', ''),
                 class_year=request.POST.get('class_year', ''),
                 start_date=start_date,
-                end_date=end_date
+                end_date=end_date,
+                **uploads
             )
             
-            # Generate PDF
-            pdf_path = generate_bus_pass_pdf(bus_pass)
-            bus_pass.pdf_file = pdf_path
-            bus_pass.save()
-            
-            # Send PDF via email
-            email_sent = send_bus_pass_email(bus_pass, pass_email, pdf_path)
+            # PDF rendering and email happen in the background; clients poll bus_pass_status
+            enqueue_pass_processing(bus_pass)
             
             return JsonResponse({
                 'status': 'success',
                 'pass_id': str(bus_pass.pass_id),
-                'pdf_url': f'/media/{pdf_path}',
-                'email_sent': email_sent,
-                'message': f'Bus pass application submitted successfully! {"PDF sent to " + pass_email if email_sent else "PDF generated successfully"}'
+                'pdf_status': bus_pass.pdf_status,
+                'status_url': reverse('bus_pass_status', args=[bus_pass.pass_id]),
+                'message': f'Bus pass application submitted successfully! Your PDF is being prepared{" and will be sent to " + pass_email if pass_email else ""}.'
             })
             
         except Exception as e:
@@ -737,186 +945,45 @@ def submit_bus_pass(request):
     
     return JsonResponse({'status': 'error', 'message': 'Invalid method'}, status=400)
 
-def generate_bus_pass_pdf(bus_pass):
-    """Generate PDF for bus pass"""
-    import os
-    from django.conf import settings
-    from reportlab.lib.pagesizes import A4
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.units import inch
-    
-    # Create PDF file path
-    filename = f"bus_pass_{bus_pass.pass_id}.pdf"
-    filepath = os.path.join(settings.MEDIA_ROOT, 'pass_pdfs', filename)
-    
-    # Ensure directory exists
-    os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    
-    # Create PDF
-    c = canvas.Canvas(filepath, pagesize=A4)
-    width, height = A4
-    
-    # Header
-    c.setFillColorRGB(0.1, 0.14, 0.49)  # AMTS Blue
-    c.rect(0, height - 2*inch, width, 2*inch, fill=True)
-    
-    c.setFillColorRGB(1, 1, 1)  # White text
-    c.setFont("Helvetica-Bold", 24)
-    c.drawCentredString(width/2, height - 1*inch, "AHMEDABAD MUNICIPAL")
-    c.drawCentredString(width/2, height - 1.4*inch, "TRANSPORT SERVICE (AMTS)")
-    
-    c.setFont("Helvetica-Bold", 18)
-    c.drawCentredString(width/2, height - 1.8*inch, bus_pass.get_pass_type_display().upper())
-    
-    # Pass Details Box
-    y = height - 3*inch
-    c.setFillColorRGB(0, 0, 0)
-    c.setFont("Helvetica-Bold", 12)
-    
-    # Personal Information
-    c.drawString(1*inch, y, "PERSONAL INFORMATION")
-    y -= 0.3*inch
-    c.setFont("Helvetica", 10)
-    
-    c.drawString(1*inch, y, f"Pass ID: {bus_pass.pass_id}")
-    y -= 0.25*inch
-    c.drawString(1*inch, y, f"Full Name: {bus_pass.full_name}")
-    y -= 0.25*inch
-    c.drawString(1*inch, y, f"Date of Birth: {bus_pass.date_of_birth.strftime('%d/%m/%Y')}")
-    y -= 0.25*inch
-    c.drawString(1*inch, y, f"Gender: {bus_pass.get_gender_display()}")
-    y -= 0.25*inch
-    c.drawString(1*inch, y, f"Phone: {bus_pass.phone_number}")
-    y -= 0.25*inch
-    c.drawString(1*inch, y, f"Email: {bus_pass.email}")
-    y -= 0.25*inch
-    c.drawString(1*inch, y, f"Address: {bus_pass.address}")
-    
-    # Route Information
-    y -= 0.5*inch
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(1*inch, y, "ROUTE INFORMATION")
-    y -= 0.3*inch
-    c.setFont("Helvetica", 10)
-    
-    c.drawString(1*inch, y, f"From: {bus_pass.from_stop}")
-    y -= 0.25*inch
-    c.drawString(1*inch, y, f"To: {bus_pass.to_stop}")
-    y -= 0.25*inch
-    c.drawString(1*inch, y, f"Route Number: {bus_pass.route_number}")
-    
-    # Student Information (if applicable)
-    if bus_pass.pass_type == 'STUDENT':
-        y -= 0.5*inch
-        c.setFont("Helvetica-Bold", 12)
-        c.drawString(1*inch, y, "STUDENT INFORMATION")
-        y -= 0.3*inch
-        c.setFont("Helvetica", 10)
-        
-        c.drawString(1*inch, y, f"Institution: {bus_pass.school_college_name}")
-        y -= 0.25*inch
-        c.drawString(1*inch, y, f"Student ID: {bus_pass.student_id}")
-        y -= 0.25*inch
-        c.drawString(1*inch, y, f"Class/Year: {bus_pass.class_year}")
-    
-    # Validity
-    y -= 0.5*inch
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(1*inch, y, "VALIDITY")
-    y -= 0.3*inch
-    c.setFont("Helvetica", 10)
-    
-    c.drawString(1*inch, y, f"Valid From: {bus_pass.start_date.strftime('%d/%m/%Y')}")
-    y -= 0.25*inch
-    c.drawString(1*inch, y, f"Valid Until: {bus_pass.end_date.strftime('%d/%m/%Y')}")
-    
-    # Footer
-    c.setFont("Helvetica-Oblique", 8)
-    c.drawCentredString(width/2, 1*inch, "This is a computer-generated pass. No signature required.")
-    c.drawCentredString(width/2, 0.7*inch, f"Generated on: {datetime.now().strftime('%d/%m/%Y %I:%M %p')}")
-    
-    # Border
-    c.setStrokeColorRGB(0.1, 0.14, 0.49)
-    c.setLineWidth(2)
-    c.rect(0.5*inch, 0.5*inch, width - 1*inch, height - 1*inch)
-    
-    c.save()
-    
-    return f"pass_pdfs/{filename}"
-
-def send_bus_pass_email(bus_pass, email_address, pdf_path):
-    """Send bus pass PDF via email"""
-    try:
-        from django.core.mail import EmailMessage
-        from django.conf import settings
-        import os
-        
-        # Email subject and content
-        subject = f"🚌 Your AMTS {bus_pass.get_pass_type_display()} Pass - Ready for Use!"
-        
-        message = f"""
-Dear {bus_pass.full_name},
-
-🎉 Congratulations! Your AMTS {bus_pass.get_pass_type_display()} Pass has been successfully generated and is ready for use.
-
-📋 Pass Details:
-• Pass ID: {bus_pass.pass_id}
-• Type: {bus_pass.get_pass_type_display()}
-• Route: {bus_pass.from_stop} ↔ {bus_pass.to_stop}
-• Route Number: {bus_pass.route_number}
-• Valid From: {bus_pass.start_date.strftime('%d/%m/%Y')}
-• Valid Until: {bus_pass.end_date.strftime('%d/%m/%Y')}
-
-📱 How to Use Your Pass:
-1. Download and save the attached PDF to your phone
-2. Show the PDF pass to the bus conductor when boarding
-3. Keep a backup copy for your records
-4. The pass is valid for the specified route and dates
+@login_required
+def bus_pass_status(request, pass_id):
+    """PDF / email progress for one of the user's passes"""
+    bus_pass = BusPass.objects.filter(pass_id=pass_id, user=request.user).only(
+        'pass_id', 'pdf_status', 'email_status', 'pdf_file'
+    ).first()
+    if bus_pass is None:
+        return JsonResponse({'status': 'error', 'message': 'Bus pass not found'}, status=404)
 
-🚌 Important Notes:
-• This pass is non-transferable and valid only for the registered user
-• Please carry a valid ID along with your pass
-• Report any issues to AMTS customer service: +91-79-2658-0000
-• Keep your pass safe - replacement charges may apply
+    return JsonResponse({
+        'status': 'success',
+        'pass_id': str(bus_pass.pass_id),
+        'pdf_status': bus_pass.pdf_status,
+        'email_status': bus_pass.email_status,
+        'pdf_url': bus_pass.pdf_file.url if bus_pass.pdf_status == 'READY' and bus_pass.pdf_file else None
+    })
 
-Thank you for choosing AMTS for your daily commute!
+@login_required
+def bus_pass_thumbnail(request, pass_id, field):
+    """Thumbnail of an uploaded pass image (photo or image ID documents), rendered on first request"""
+    if field not in UPLOAD_FIELDS:
+        raise Http404
+    passes = BusPass.objects.all() if request.user.is_staff else BusPass.objects.filter(user=request.user)
+    name = passes.filter(pass_id=pass_id).values_list(field, flat=True).first()
+    if not name:
+        raise Http404
 
-Best regards,
-AMTS Pass Department
-Ahmedabad Municipal Transport Service
+    thumb_name = get_thumbnail(name)
+    if thumb_name is None:
+        raise Http404
 
----
-This is an automated email. Please do not reply to this message.
-For support, contact: support@amts.gov.in
-        """
-        
-        # Create email with attachment
-        email = EmailMessage(
-            subject=subject,
-            body=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[email_address],
-        )
-        
-        # Attach PDF file
-        pdf_full_path = os.path.join(settings.MEDIA_ROOT, pdf_path)
-        if os.path.exists(pdf_full_path):
-            with open(pdf_full_path, 'rb') as pdf_file:
-                email.attach(
-                    f"AMTS_{bus_pass.get_pass_type_display()}_Pass_{bus_pass.pass_id}.pdf",
-                    pdf_file.read(),
-                    'application/pdf'
-                )
-        
-        # Send email
-        email.send(fail_silently=False)
-        
-        print(f"✅ Bus pass PDF sent successfully to: {email_address}")
-        return True
-        
-    except Exception as e:
-        print(f"❌ Failed to send bus pass email to {email_address}: {str(e)}")
-        return False
+    # Thumbnails are content-addressed, so the file name doubles as a strong ETag
+    etag = f'"{os.path.basename(thumb_name)}"'
+    if request.headers.get('If-None-Match') == etag:
+        return HttpResponseNotModified()
+    response = FileResponse(open(os.path.join(settings.MEDIA_ROOT, thumb_name), 'rb'), content_type='image/jpeg')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
 
 @login_required
 def my_passes(request):
@@ -971,48 +1038,50 @@ def emergency_accident_alert(request):
             except Exception as e:
                 print(f"⚠️ Error updating bus status: {str(e)}")
             
-            # Step 2: Trigger Emergency Notification System
+            # Step 2: Queue emergency notifications (delivered in the background)
             from .emergency_notifications import EmergencyNotificationSystem
             
             emergency_system = EmergencyNotificationSystem()
-            notification_result = emergency_system.send_emergency_emails(
-                bus_number=bus_number,
-                latitude=latitude,
-                longitude=longitude,
-                accident_location=accident_location
-            )
+            try:
+                notification_result = emergency_system.queue_emergency_notifications(
+                    bus_number=bus_number,
+                    latitude=latitude,
+                    longitude=longitude,
+                    accident_location=accident_location
+                )
+            except IncidentLockTimeout as e:
+                return alert_busy_response(e)
+            incident = notification_result['incident']
             
-            if notification_result['status'] == 'success':
-                print(f"✅ Emergency notifications sent successfully")
-                print(f"📧 Total emails sent: {notification_result['emails_sent']}")
-                print(f"👥 Affected passengers: {notification_result['affected_passengers']}")
-                print(f"📢 Broadcast alerts: {notification_result.get('broadcast_alerts', notification_result.get('family_alerts', 0))}")
-                print(f"🚨 Helpline alerts: {notification_result['helpline_alerts']}")
-                
-                return JsonResponse({
-                    'status': 'success',
-                    'message': '🚨 EMERGENCY SYSTEM ACTIVATED',
-                    'emergency_response': {
-                        'bus_status': 'ACCIDENT_DETECTED',
-                        'location_frozen': True,
-                        'gps_coordinates': f"{latitude}, {longitude}",
-                        'google_maps_link': f"https://www.google.com/maps?q={latitude},{longitude}",
-                        'notifications_sent': notification_result['emails_sent'],
-                        'affected_passengers': notification_result['affected_passengers'],
-                        'broadcast_alerts_sent': notification_result.get('broadcast_alerts', notification_result.get('family_alerts', 0)),
-                        'helpline_alerts_sent': notification_result['helpline_alerts'],
-                        'failed_notifications': len(notification_result['failed_emails']),
-                        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    },
-                    'accident_details': notification_result['accident_details']
-                })
+            if notification_result['coalesced']:
+                print(f"ℹ️ Repeat alert attached to incident {incident.pk} (alert #{incident.alert_count})")
             else:
-                print(f"❌ Emergency notification failed: {notification_result.get('message')}")
-                return JsonResponse({
-                    'status': 'partial_success',
-                    'message': 'Bus status updated but notification system failed',
-                    'error': notification_result.get('message', 'Unknown notification error')
-                }, status=500)
+                print(f"✅ Emergency notifications queued (incident {incident.pk})")
+            print(f"📧 Emails queued: {notification_result['emails_queued']}")
+            print(f"📱 SMS queued: {notification_result['sms_queued']}")
+            print(f"👥 Affected passengers: {notification_result['affected_passengers']}")
+            print(f"🚨 Helpline alerts: {notification_result['helpline_alerts']}")
+            
+            return JsonResponse({
+                'status': 'success',
+                'message': '🚨 EMERGENCY SYSTEM ACTIVATED',
+                'emergency_response': {
+                    'bus_status': 'ACCIDENT_DETECTED',
+                    'location_frozen': True,
+                    'gps_coordinates': f"{latitude}, {longitude}",
+                    'google_maps_link': f"https://www.google.com/maps?q={latitude},{longitude}",
+                    'incident_id': str(incident.pk),
+                    'status_url': reverse('emergency_incident_status', args=[incident.pk]),
+                    'coalesced': notification_result['coalesced'],
+                    'alert_count': incident.alert_count,
+                    'notifications_queued': notification_result['emails_queued'],
+                    'sms_queued': notification_result['sms_queued'],
+                    'affected_passengers': notification_result['affected_passengers'],
+                    'helpline_alerts_queued': notification_result['helpline_alerts'],
+                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                },
+                'accident_details': notification_result['accident_details']
+            }, status=202)
             
         except Exception as e:
             print(f"❌ Critical error in emergency system: {str(e)}")
@@ -1026,6 +1095,30 @@ def emergency_accident_alert(request):
         'message': 'Invalid request method. Use POST.'
     }, status=400)
 
+@login_required
+def emergency_incident_status(request, notification_id):
+    """Delivery progress of an accident's queued notifications (per recipient for staff)"""
+    from .notification_outbox import incident_status
+    
+    incident = get_object_or_404(AccidentNotification, notification_id=notification_id)
+    data = {
+        'status': 'success',
+        'incident_id': str(incident.pk),
+        'bus_number': incident.bus_number,
+        'reported_at': timezone.localtime(incident.timestamp).strftime('%Y-%m-%d %H:%M:%S'),
+        'alert_count': incident.alert_count,
+        'last_reported_at': timezone.localtime(incident.last_reported_at).strftime('%Y-%m-%d %H:%M:%S'),
+        'total_sent': incident.total_notifications_sent,
+        'delivery': incident_status(incident)
+    }
+    if request.user.is_staff:
+        data['recipients'] = list(
+            incident.messages.order_by('id').values(
+                'recipient', 'recipient_type', 'channel', 'status', 'attempts', 'last_error', 'sent_at'
+            )
+        )
+    return JsonResponse(data)
+
 def emergency_dashboard(request):
     """Emergency Dashboard for Admin/Driver to trigger accident alerts"""
     
@@ -1037,9 +1130,12 @@ def emergency_dashboard(request):
         is_active=True
     ).select_related('bus')
     
+    headway_alerts = HeadwayAlert.objects.filter(is_resolved=False).select_related('bus')[:20]
+    
     context = {
         'active_emergencies': active_emergencies,
-        'emergency_count': active_emergencies.count()
+        'emergency_count': active_emergencies.count(),
+        'headway_alerts': headway_alerts
     }
     
     return render(request, 'my_amts/emergency_dashboard.html', context)
\ No newline at end of file